@@ -15,6 +15,16 @@ from frappe import _
 from frappe.utils import now_datetime, add_days, getdate, cint
 from datetime import datetime, timedelta
 
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    get_daily_series,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_export_job.cntemad_export_job import start_export
+from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+    get_revenue,
+)
+from cntemad_lms.cntemad_lms.exports import iter_query, stream_csv_response
+from cntemad_lms.cntemad_lms.identity import get_current_admin_center
+
 
 @frappe.whitelist()
 def get_my_center() -> dict:
@@ -24,34 +34,7 @@ def get_my_center() -> dict:
     Returns:
         dict: Center info or None
     """
-    user = frappe.session.user
-
-    # Check if user is a center admin
-    center_id = frappe.db.get_value(
-        "CNTEMAD Center",
-        {"admin_user": user},
-        "name"
-    )
-
-    if not center_id:
-        # Check if linked via custom field or role
-        center_id = frappe.db.get_value(
-            "CNTEMAD Center Admin",
-            {"user": user, "is_active": 1},
-            "center"
-        ) if frappe.db.exists("DocType", "CNTEMAD Center Admin") else None
-
-    if not center_id:
-        return None
-
-    center = frappe.get_doc("CNTEMAD Center", center_id)
-
-    return {
-        "name": center.name,
-        "title": center.title,
-        "region": center.region,
-        "code": center.code if hasattr(center, "code") else None,
-    }
+    return get_current_admin_center()
 
 
 @frappe.whitelist()
@@ -119,24 +102,14 @@ def get_center_kpis(center_id: str) -> dict:
     # This month's stats
     first_of_month = getdate().replace(day=1)
 
-    # Payments this month
-    monthly_payments = frappe.db.sql("""
-        SELECT
-            COUNT(*) as count,
-            COALESCE(SUM(amount), 0) as total
-        FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
-        AND p.status = 'Completed'
-        AND p.creation >= %s
-    """, (center_id, first_of_month), as_dict=True)[0]
+    # Payments this month (payment ledger balance)
+    monthly_payments = get_revenue("center", center_id, month=first_of_month)
 
     # Pending payments
     pending_payments = frappe.db.sql("""
         SELECT COUNT(*) as count
         FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
+        WHERE p.center = %s
         AND p.status IN ('Pending', 'Processing')
     """, center_id, as_dict=True)[0]
 
@@ -144,8 +117,7 @@ def get_center_kpis(center_id: str) -> dict:
     validations = frappe.db.sql("""
         SELECT COUNT(*) as count
         FROM `tabCNTEMAD Enrollment` e
-        INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
-        WHERE s.center = %s
+        WHERE e.center = %s
         AND e.status = 'Validated'
         AND e.validation_date >= %s
     """, (center_id, first_of_month), as_dict=True)[0]
@@ -154,8 +126,7 @@ def get_center_kpis(center_id: str) -> dict:
     total_enrollments = frappe.db.sql("""
         SELECT COUNT(*) as count
         FROM `tabCNTEMAD Enrollment` e
-        INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
-        WHERE s.center = %s
+        WHERE e.center = %s
         AND e.status IN ('Paid', 'In Progress', 'Validated')
     """, center_id, as_dict=True)[0]
 
@@ -164,8 +135,7 @@ def get_center_kpis(center_id: str) -> dict:
         validated = frappe.db.sql("""
             SELECT COUNT(*) as count
             FROM `tabCNTEMAD Enrollment` e
-            INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
-            WHERE s.center = %s
+            WHERE e.center = %s
             AND e.status = 'Validated'
         """, center_id, as_dict=True)[0]
         validation_rate = round((validated["count"] / total_enrollments["count"]) * 100)
@@ -173,8 +143,8 @@ def get_center_kpis(center_id: str) -> dict:
     return {
         "total_students": total_students,
         "active_students": active_students,
-        "monthly_payments": monthly_payments["count"],
-        "monthly_revenue": monthly_payments["total"] or 0,
+        "monthly_payments": monthly_payments["payment_count"],
+        "monthly_revenue": monthly_payments["amount"],
         "pending_payments": pending_payments["count"],
         "monthly_validations": validations["count"],
         "validation_rate": validation_rate,
@@ -182,54 +152,19 @@ def get_center_kpis(center_id: str) -> dict:
 
 
 def get_enrollment_trends(center_id: str, days: int = 30) -> list:
-    """Get daily enrollment/payment trends."""
-    start_date = add_days(getdate(), -days)
-
-    # Daily enrollments
-    data = frappe.db.sql("""
-        SELECT
-            DATE(e.creation) as date,
-            COUNT(*) as enrollments,
-            SUM(CASE WHEN e.status = 'Validated' THEN 1 ELSE 0 END) as validations
-        FROM `tabCNTEMAD Enrollment` e
-        INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
-        WHERE s.center = %s
-        AND e.creation >= %s
-        GROUP BY DATE(e.creation)
-        ORDER BY date
-    """, (center_id, start_date), as_dict=True)
-
-    # Daily payments
-    payments = frappe.db.sql("""
-        SELECT
-            DATE(p.creation) as date,
-            COUNT(*) as payments,
-            COALESCE(SUM(p.amount), 0) as revenue
-        FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
-        AND p.status = 'Completed'
-        AND p.creation >= %s
-        GROUP BY DATE(p.creation)
-        ORDER BY date
-    """, (center_id, start_date), as_dict=True)
-
-    # Merge data
-    payment_by_date = {str(p["date"]): p for p in payments}
-
-    result = []
-    for d in data:
-        date_str = str(d["date"])
-        p = payment_by_date.get(date_str, {})
-        result.append({
-            "date": date_str,
-            "enrollments": d["enrollments"],
-            "validations": d["validations"],
-            "payments": p.get("payments", 0),
-            "revenue": p.get("revenue", 0),
-        })
-
-    return result
+    """Get daily enrollment/payment trends (contiguous, days without activity at 0)."""
+    series = get_daily_series(add_days(getdate(), -days), getdate(), center=center_id)
+
+    return [
+        {
+            "date": str(point["date"]),
+            "enrollments": point["enrollments"],
+            "validations": point["validations"],
+            "payments": point["payments"],
+            "revenue": point["revenue"],
+        }
+        for point in series
+    ]
 
 
 def get_center_alerts(center_id: str) -> list:
@@ -240,8 +175,7 @@ def get_center_alerts(center_id: str) -> list:
     old_pending = frappe.db.sql("""
         SELECT COUNT(*) as count
         FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
+        WHERE p.center = %s
         AND p.status = 'Pending'
         AND p.creation < DATE_SUB(NOW(), INTERVAL 24 HOUR)
     """, center_id, as_dict=True)[0]
@@ -288,7 +222,7 @@ def get_recent_activity(center_id: str, limit: int = 10) -> list:
             p.creation as date
         FROM `tabCNTEMAD Payment` p
         INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
+        WHERE p.center = %s
         ORDER BY p.creation DESC
         LIMIT %s
     """, (center_id, limit), as_dict=True)
@@ -304,7 +238,7 @@ def get_recent_activity(center_id: str, limit: int = 10) -> list:
         FROM `tabCNTEMAD Enrollment` e
         INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
         INNER JOIN `tabCNTEMAD EC` ec ON e.ec = ec.name
-        WHERE s.center = %s
+        WHERE e.center = %s
         AND e.status = 'Validated'
         AND e.validation_date IS NOT NULL
         ORDER BY e.validation_date DESC
@@ -419,7 +353,7 @@ def get_center_payments(
         center_id = my_center["name"]
 
     # Build query
-    conditions = ["s.center = %s"]
+    conditions = ["p.center = %s"]
     values = [center_id]
 
     if status:
@@ -476,7 +410,6 @@ def get_center_payments(
     total = frappe.db.sql(f"""
         SELECT COUNT(*) as count
         FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
         WHERE {where_clause}
     """, values, as_dict=True)[0]["count"]
 
@@ -487,8 +420,7 @@ def get_center_payments(
             COUNT(*) as count,
             COALESCE(SUM(p.amount), 0) as total
         FROM `tabCNTEMAD Payment` p
-        INNER JOIN `tabCNTEMAD Student` s ON p.student = s.name
-        WHERE s.center = %s
+        WHERE p.center = %s
         GROUP BY p.status
     """, center_id, as_dict=True)
 
@@ -530,9 +462,7 @@ def get_center_stats(center_id: str) -> dict:
             SUM(amount) as total,
             status
         FROM `tabCNTEMAD Payment`
-        WHERE student IN (
-            SELECT name FROM `tabCNTEMAD Student` WHERE center = %s
-        )
+        WHERE center = %s
         AND creation >= DATE_SUB(NOW(), INTERVAL 30 DAY)
         GROUP BY status
     """, center_id, as_dict=True)
@@ -545,8 +475,7 @@ def get_center_stats(center_id: str) -> dict:
             e.status,
             COUNT(*) as count
         FROM `tabCNTEMAD Enrollment` e
-        INNER JOIN `tabCNTEMAD Student` s ON e.student = s.name
-        WHERE s.center = %s
+        WHERE e.center = %s
         GROUP BY e.status
     """, center_id, as_dict=True)
 
@@ -591,12 +520,13 @@ def get_all_centers() -> list:
 
 
 @frappe.whitelist()
-def export_students(center_id: str = None, format: str = "csv") -> dict:
+def export_students(center_id: str = None, format: str = "csv"):
     """
     Export students list for a center.
 
     Returns:
-        dict: { url: download_url } or { data: csv_content }
+        csv: chunked `text/csv` attachment
+        xlsx/parquet: export job dict (see `cntemad_lms.api.export`)
     """
     if not center_id:
         my_center = get_my_center()
@@ -604,7 +534,15 @@ def export_students(center_id: str = None, format: str = "csv") -> dict:
             frappe.throw(_("Aucun centre associé"))
         center_id = my_center["name"]
 
-    students = frappe.db.sql("""
+    if format != "csv":
+        return start_export("center_students", format, {"center_id": center_id})
+
+    return stream_csv_response(f"etudiants_{center_id}.csv", iter_center_students, center_id)
+
+
+def iter_center_students(center_id: str):
+    """Yield the header then one row per student of the center."""
+    return iter_query("""
         SELECT
             s.name as id,
             s.full_name,
@@ -617,33 +555,11 @@ def export_students(center_id: str = None, format: str = "csv") -> dict:
             SUM(CASE WHEN e.status = 'Validated' THEN 1 ELSE 0 END) as validated_ecs
         FROM `tabCNTEMAD Student` s
         LEFT JOIN `tabCNTEMAD Enrollment` e ON e.student = s.name
-        WHERE s.center = %s
+        WHERE s.center = %(center_id)s
         GROUP BY s.name
         ORDER BY s.full_name
-    """, center_id, as_dict=True)
-
-    if format == "csv":
-        import csv
-        import io
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Header
-        writer.writerow([
-            "ID", "Nom complet", "Email", "Téléphone",
-            "Année", "Statut", "Date inscription",
-            "Total EC", "EC validés"
-        ])
-
-        # Data
-        for s in students:
-            writer.writerow([
-                s.id, s.full_name, s.email, s.phone,
-                s.current_year, s.status, s.inscription_date,
-                s.total_ecs, s.validated_ecs
-            ])
-
-        return {"data": output.getvalue(), "filename": f"etudiants_{center_id}.csv"}
-
-    return {"students": students}
+    """, {"center_id": center_id}, header=[
+        "ID", "Nom complet", "Email", "Téléphone",
+        "Année", "Statut", "Date inscription",
+        "Total EC", "EC validés"
+    ])
@@ -3,6 +3,8 @@
 import frappe
 from frappe import _
 
+from cntemad_lms.cntemad_lms.identity import get_current_student_id
+
 
 @frappe.whitelist(allow_guest=True)
 def get_courses(center: str = None, year: str = None, limit: int = 20) -> list:
@@ -77,9 +79,7 @@ def get_course_content(course_id: str) -> dict:
     # Check user enrollment if logged in
     user_progress = None
     if frappe.session.user != "Guest":
-        student_id = frappe.db.get_value(
-            "CNTEMAD Student", {"user": frappe.session.user}, "name"
-        )
+        student_id = get_current_student_id()
         if student_id:
             user_progress = get_user_course_progress(student_id, course_id)
 
@@ -1,7 +1,21 @@
 """API endpoints for EC (Élément Constitutif) operations."""
 
+import re
+
 import frappe
 from frappe import _
+from frappe.utils import cint
+
+from cntemad_lms.cntemad_lms.api.enrollment import (
+    apply_enrollment_status_change,
+    get_enrollment_status_map,
+)
+from cntemad_lms.cntemad_lms.catalog_index import autocomplete as catalog_autocomplete
+from cntemad_lms.cntemad_lms.counters import mark_student_active
+from cntemad_lms.cntemad_lms.identity import get_current_student_id
+
+
+FULLTEXT_MIN_TOKEN = 3  # innodb_ft_min_token_size
 
 
 @frappe.whitelist(allow_guest=True)
@@ -27,77 +41,111 @@ def get_available_ecs(
     Returns:
         dict: { ecs: [], total: int, has_more: bool }
     """
-    filters = {"is_published": 1}
+    conditions = ["is_published = 1"]
+    values = {"limit": cint(limit), "offset": cint(offset)}
 
     if year:
-        filters["year"] = year
+        conditions.append("year = %(year)s")
+        values["year"] = year
 
     if course:
-        filters["course"] = course
-
-    # Build query
-    ecs = frappe.get_all(
-        "CNTEMAD EC",
-        filters=filters,
-        fields=[
-            "name",
-            "title",
-            "description",
-            "course",
-            "year",
-            "price",
-            "duration_hours",
-            "image",
-            "is_published",
-            "creation",
-        ],
-        order_by=f"{sort_by} asc" if sort_by in ["title", "price"] else "creation desc",
-        limit_page_length=limit,
-        start=offset,
-    )
+        conditions.append("course = %(course)s")
+        values["course"] = course
 
-    # Search filter (post-query for simplicity)
-    if search:
-        search_lower = search.lower()
-        ecs = [
-            ec for ec in ecs
-            if search_lower in (ec.title or "").lower()
-            or search_lower in (ec.description or "").lower()
-        ]
+    order_by = f"{sort_by} asc" if sort_by in ["title", "price"] else "creation desc"
 
-    # Get total count
-    total = frappe.db.count("CNTEMAD EC", filters=filters)
-
-    # Check if user has paid for each EC
-    user = frappe.session.user
-    if user != "Guest":
-        student_id = frappe.db.get_value("CNTEMAD Student", {"user": user}, "name")
-        if student_id:
-            for ec in ecs:
-                enrollment = frappe.db.get_value(
-                    "CNTEMAD Enrollment",
-                    {"student": student_id, "ec": ec.name},
-                    ["status", "name"],
-                    as_dict=True,
-                )
-                if enrollment:
-                    ec["user_status"] = enrollment.status.lower().replace(" ", "_")
-                else:
-                    ec["user_status"] = "not_paid"
-        else:
-            for ec in ecs:
-                ec["user_status"] = "not_paid"
-    else:
-        for ec in ecs:
-            ec["user_status"] = "not_paid"
+    # Full-text search, ranked by relevance
+    if search:
+        search_conditions, relevance, search_values = build_search_condition(search)
+        conditions.extend(search_conditions)
+        values.update(search_values)
+        order_by = f"{relevance} desc, {order_by}"
+
+    where_clause = " AND ".join(conditions)
+
+    ecs = frappe.db.sql(f"""
+        SELECT
+            name, title, description, course, year, price,
+            duration_hours, image, is_published, creation
+        FROM `tabCNTEMAD EC`
+        WHERE {where_clause}
+        ORDER BY {order_by}
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, values, as_dict=True)
+
+    # Get total count (same filters, search included)
+    total = frappe.db.sql(f"""
+        SELECT COUNT(*)
+        FROM `tabCNTEMAD EC`
+        WHERE {where_clause}
+    """, values)[0][0]
+
+    # Check if user has paid for each EC (one cached map for the whole page)
+    statuses = get_enrollment_status_map(get_current_student_id())
+    for ec in ecs:
+        status = statuses.get(ec.name)
+        ec["user_status"] = status.lower().replace(" ", "_") if status else "not_paid"
 
     return {
         "ecs": ecs,
         "total": total,
-        "has_more": offset + len(ecs) < total,
+        "has_more": cint(offset) + len(ecs) < total,
     }
 
 
+@frappe.whitelist(allow_guest=True)
+def autocomplete(query: str = None, limit: int = 8) -> list:
+    """
+    Suggestions instantanées pour la barre de recherche du catalogue.
+
+    Servies par l'index inversé en mémoire du worker (aucune requête SQL).
+
+    Args:
+        query: Texte saisi (le dernier mot est traité comme un préfixe)
+        limit: Nombre de suggestions (20 max)
+
+    Returns:
+        list: [{type: "ec"|"course", name, title, year, course}]
+    """
+    return catalog_autocomplete(query or "", limit=min(cint(limit) or 8, 20))
+
+
+def build_search_condition(search: str):
+    """
+    Conditions SQL pour une recherche textuelle sur les EC.
+
+    Les mots d'au moins FULLTEXT_MIN_TOKEN lettres passent par l'index FULLTEXT
+    (préfixes, mode booléen, tous requis); les plus courts, ignorés par
+    InnoDB, sont cherchés par LIKE. La collation de la table ignore les accents.
+
+    Returns:
+        tuple: (conditions, relevance expression, values)
+    """
+    words = re.findall(r"\w+", search.lower())
+    long_words = [w for w in words if len(w) >= FULLTEXT_MIN_TOKEN]
+    short_words = [w for w in words if len(w) < FULLTEXT_MIN_TOKEN]
+
+    conditions = []
+    relevance = "0"
+    values = {}
+
+    if long_words:
+        conditions.append(
+            "MATCH(title, description) AGAINST (%(search_boolean)s IN BOOLEAN MODE)"
+        )
+        relevance = "MATCH(title, description) AGAINST (%(search_terms)s)"
+        values["search_boolean"] = " ".join(f"+{w}*" for w in long_words)
+        values["search_terms"] = " ".join(long_words)
+
+    for i, word in enumerate(short_words):
+        conditions.append(
+            f"(title LIKE %(search_like_{i})s OR description LIKE %(search_like_{i})s)"
+        )
+        values[f"search_like_{i}"] = f"%{word}%"
+
+    return conditions, relevance, values
+
+
 @frappe.whitelist(allow_guest=True)
 def get_ec_detail(ec_id: str) -> dict:
     """
@@ -130,23 +178,14 @@ def get_ec_detail(ec_id: str) -> dict:
     }
 
     # Check user access
-    user = frappe.session.user
-    if user != "Guest":
-        student_id = frappe.db.get_value("CNTEMAD Student", {"user": user}, "name")
-        if student_id:
-            enrollment = frappe.db.get_value(
-                "CNTEMAD Enrollment",
-                {"student": student_id, "ec": ec_id},
-                ["status", "name"],
-                as_dict=True,
-            )
-            if enrollment:
-                result["user_status"] = enrollment.status.lower().replace(" ", "_")
-
-                # If paid, include content
-                if enrollment.status in ["Paid", "In Progress", "Validated"]:
-                    result["content"] = ec.content if hasattr(ec, "content") else None
-                    result["quiz_id"] = ec.quiz if hasattr(ec, "quiz") else None
+    status = get_enrollment_status_map(get_current_student_id()).get(ec_id)
+    if status:
+        result["user_status"] = status.lower().replace(" ", "_")
+
+        # If paid, include content
+        if status in ["Paid", "In Progress", "Validated"]:
+            result["content"] = ec.content if hasattr(ec, "content") else None
+            result["quiz_id"] = ec.quiz if hasattr(ec, "quiz") else None
 
     return result
 
@@ -166,8 +205,7 @@ def get_ec_content(ec_id: str) -> dict:
             progress: User progress
         }
     """
-    user = frappe.session.user
-    student_id = frappe.db.get_value("CNTEMAD Student", {"user": user}, "name")
+    student_id = get_current_student_id()
 
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"))
@@ -304,8 +342,7 @@ def update_lesson_progress(ec_id: str, lesson_id: str, completed: bool = True) -
     """
     import json
 
-    user = frappe.session.user
-    student_id = frappe.db.get_value("CNTEMAD Student", {"user": user}, "name")
+    student_id = get_current_student_id()
 
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"))
@@ -343,6 +380,8 @@ def update_lesson_progress(ec_id: str, lesson_id: str, completed: bool = True) -
         "completed_lessons": json.dumps(completed_lessons),
         "status": new_status,
     })
+    apply_enrollment_status_change(student_id, ec_id, enrollment.status, new_status)
+    mark_student_active(student_id)
 
     frappe.db.commit()
 
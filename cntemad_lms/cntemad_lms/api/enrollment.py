@@ -1,7 +1,22 @@
 """API and hooks for enrollment operations."""
 
+from functools import partial
+
 import frappe
 from frappe import _
+from frappe.utils import getdate
+
+from cntemad_lms.cntemad_lms.cache import invalidate_cache_tags
+from cntemad_lms.cntemad_lms.counters import increment_kpis, mark_student_active
+from cntemad_lms.cntemad_lms.doctype.cntemad_center_stats.cntemad_center_stats import (
+    update_center_stats,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    record_daily_stats,
+)
+
+
+ENROLLMENT_STATUS_KEY = "cntemad_enrollment_status"
 
 
 def on_enrollment_created(doc, method):
@@ -12,5 +27,114 @@ def on_enrollment_created(doc, method):
         title="Enrollment Created"
     )
 
+    center = doc.center or _get_student_center(doc.student)
+    validated = 1 if doc.status == "Validated" else 0
+
+    update_center_stats(center, enrollment_count=1, validated_count=validated)
+    record_daily_stats(getdate(doc.creation), center, doc.ec, enrollments=1)
+    if validated:
+        record_daily_stats(doc.validation_date or getdate(), center, doc.ec, validations=1)
+
+    increment_kpis({"total_enrollments": 1, "validated_enrollments": validated})
+    mark_student_active(doc.student)
+    clear_enrollment_status_map(doc.student)
+    invalidate_cache_tags("enrollment")
+
     # Send welcome notification if needed
     # send_enrollment_welcome(doc)
+
+
+def on_enrollment_updated(doc, method):
+    """Hook après modification d'une inscription."""
+    if doc.flags.in_insert:
+        # Already handled by on_enrollment_created
+        return
+
+    mark_student_active(doc.student)
+
+    before = doc.get_doc_before_save()
+    apply_enrollment_status_change(
+        doc.student, doc.ec, before.status if before else None, doc.status,
+        validation_date=doc.validation_date,
+    )
+
+
+def on_enrollment_deleted(doc, method):
+    """Hook avant suppression d'une inscription."""
+    center = doc.center or _get_student_center(doc.student)
+    validated = 1 if doc.status == "Validated" else 0
+
+    update_center_stats(center, enrollment_count=-1, validated_count=-validated)
+    record_daily_stats(getdate(doc.creation), center, doc.ec, enrollments=-1)
+    if validated:
+        record_daily_stats(doc.validation_date or getdate(), center, doc.ec, validations=-1)
+
+    increment_kpis({"total_enrollments": -1, "validated_enrollments": -validated})
+    clear_enrollment_status_map(doc.student)
+    invalidate_cache_tags("enrollment")
+
+
+def apply_enrollment_status_change(
+    student_id: str,
+    ec_id: str,
+    old_status: str,
+    new_status: str,
+    validation_date=None
+) -> None:
+    """
+    Répercute un changement de statut d'inscription sur les agrégats.
+
+    À appeler aussi après les `frappe.db.set_value` qui contournent les hooks.
+    """
+    if old_status != new_status:
+        clear_enrollment_status_map(student_id)
+
+    was_validated = old_status == "Validated"
+    is_validated = new_status == "Validated"
+
+    if was_validated == is_validated:
+        return
+
+    sign = 1 if is_validated else -1
+    center = _get_student_center(student_id)
+
+    update_center_stats(center, validated_count=sign)
+    record_daily_stats(validation_date or getdate(), center, ec_id, validations=sign)
+    increment_kpis({"validated_enrollments": sign})
+    invalidate_cache_tags("enrollment")
+
+
+def _get_student_center(student_id: str) -> str:
+    """Retourne le centre d'un étudiant."""
+    return frappe.db.get_value("CNTEMAD Student", student_id, "center")
+
+
+def get_enrollment_status_map(student_id: str) -> dict:
+    """
+    Statuts de toutes les inscriptions d'un étudiant: {ec: status}.
+
+    Une seule requête, puis cache Redis jusqu'au prochain changement d'inscription.
+    """
+    if not student_id:
+        return {}
+
+    return frappe.cache().hget(
+        ENROLLMENT_STATUS_KEY, student_id, generator=partial(_load_enrollment_statuses, student_id)
+    )
+
+
+def clear_enrollment_status_map(student_id: str) -> None:
+    """Invalide le cache des statuts d'inscription d'un étudiant (maintenant et après commit)."""
+    if not student_id:
+        return
+
+    frappe.cache().hdel(ENROLLMENT_STATUS_KEY, student_id)
+    frappe.db.after_commit.add(partial(frappe.cache().hdel, ENROLLMENT_STATUS_KEY, student_id))
+
+
+def _load_enrollment_statuses(student_id: str) -> dict:
+    return dict(frappe.db.sql("""
+        SELECT ec, status
+        FROM `tabCNTEMAD Enrollment`
+        WHERE student = %s AND ec IS NOT NULL
+    """, student_id))
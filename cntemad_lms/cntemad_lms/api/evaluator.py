@@ -5,6 +5,12 @@ from frappe import _
 import json
 from datetime import datetime, timedelta
 
+from cntemad_lms.cntemad_lms.api.enrollment import apply_enrollment_status_change
+from cntemad_lms.cntemad_lms.counters import mark_student_active
+from cntemad_lms.cntemad_lms.doctype.cntemad_notification_outbox.cntemad_notification_outbox import (
+    queue_notification,
+)
+
 
 @frappe.whitelist()
 def get_evaluator_dashboard() -> dict:
@@ -366,19 +372,25 @@ def submit_grade(
             enrollment = frappe.db.get_value(
                 "CNTEMAD Enrollment",
                 {"student": sub.student, "ec": sub.ec},
-                "name"
+                ["name", "status"],
+                as_dict=True
             )
             if enrollment:
-                frappe.db.set_value("CNTEMAD Enrollment", enrollment, {
+                frappe.db.set_value("CNTEMAD Enrollment", enrollment.name, {
                     "status": "Validated",
                     "final_grade": grade
                 })
+                apply_enrollment_status_change(sub.student, sub.ec, enrollment.status, "Validated")
+                mark_student_active(sub.student)
 
         frappe.db.commit()
         return {"success": True, "message": "Note enregistrée"}
 
     # Handle enrollment (quiz)
-    if frappe.db.exists("CNTEMAD Enrollment", submission_id):
+    enrollment = frappe.db.get_value(
+        "CNTEMAD Enrollment", submission_id, ["student", "ec", "status"], as_dict=True
+    )
+    if enrollment:
         update_data = {
             "evaluator_feedback": feedback,
             "graded_by": user,
@@ -393,6 +405,11 @@ def submit_grade(
             update_data["needs_review"] = 0
 
         frappe.db.set_value("CNTEMAD Enrollment", submission_id, update_data)
+        if validate_ec:
+            apply_enrollment_status_change(
+                enrollment.student, enrollment.ec, enrollment.status, "Validated"
+            )
+        mark_student_active(enrollment.student)
         frappe.db.commit()
 
         return {"success": True, "message": "Évaluation enregistrée"}
@@ -536,22 +553,13 @@ def validate_certificate(
             VALUES (%s, %s, %s, %s, %s, %s)
         """, [cert_id, student_id, year, certificate_number, user, datetime.now()])
 
-    frappe.db.commit()
-
     # Send notification to student
-    try:
-        frappe.sendmail(
-            recipients=[student.email],
-            subject=f"Félicitations ! Certificat {year} validé",
-            message=f"""
-            <p>Cher(e) {student.full_name},</p>
-            <p>Félicitations ! Votre certificat pour l'année {year} a été validé.</p>
-            <p>Numéro de certificat: <strong>{certificate_number}</strong></p>
-            <p>Cordialement,<br>CNTEMAD</p>
-            """
-        )
-    except Exception:
-        pass  # Email failure should not block certificate creation
+    queue_notification(
+        "certificate_issued", "CNTEMAD Student", student_id,
+        year=year, certificate_number=certificate_number,
+    )
+
+    frappe.db.commit()
 
     return {
         "success": True,
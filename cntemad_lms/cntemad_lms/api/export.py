@@ -0,0 +1,77 @@
+"""
+API endpoints for background exports.
+
+Les exports volumineux (XLSX, Parquet) sont générés par un worker puis
+conservés dans les fichiers privés; une demande identique du même
+utilisateur le même jour réutilise le fichier existant. Le rapport
+national est réservé aux administrateurs nationaux, celui d'un centre à
+son administrateur. Seul le demandeur (ou un System Manager) peut suivre
+et télécharger un export.
+
+Usage:
+    POST /api/method/cntemad_lms.api.export.start_export
+    GET  /api/method/cntemad_lms.api.export.get_export_status
+    GET  /api/method/cntemad_lms.api.export.download_export
+"""
+
+import json
+import os
+
+import frappe
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+from cntemad_lms.cntemad_lms.doctype.cntemad_export_job import cntemad_export_job
+
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+@frappe.whitelist()
+def start_export(report: str, format: str = "csv", filters: str = None) -> dict:
+    """
+    Enqueue an export job.
+
+    Args:
+        report: Report name (national, center_students)
+        format: csv, xlsx or parquet
+        filters: JSON dict of report arguments
+
+    Returns:
+        dict: { name, status, download_url, ... }
+
+    The owner also receives a `cntemad_export_ready` realtime event.
+    """
+    if isinstance(filters, str):
+        filters = json.loads(filters or "{}")
+
+    return cntemad_export_job.start_export(report, format, filters)
+
+
+@frappe.whitelist()
+def get_export_status(job_id: str) -> dict:
+    """Get the status of an export job (polling, requester only)."""
+    cntemad_export_job.check_export_permission(job_id)
+    return cntemad_export_job.get_export_job(job_id)
+
+
+@frappe.whitelist()
+def download_export(job_id: str):
+    """Stream the file of a completed export (requester only)."""
+    cntemad_export_job.check_export_permission(job_id)
+    job = cntemad_export_job.get_export_job(job_id)
+    path = cntemad_export_job.get_artifact_path(job_id)
+    filename = f"cntemad_{job.report}_{job.completed_at.strftime('%Y%m%d')}.{job.export_format}"
+
+    response = Response(
+        wrap_file(frappe.local.request.environ, open(path, "rb")),
+        mimetype=MIMETYPES[job.export_format],
+        direct_passthrough=True
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["Content-Length"] = str(os.path.getsize(path))
+    return response
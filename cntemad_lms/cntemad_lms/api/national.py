@@ -2,9 +2,34 @@
 
 import frappe
 from frappe import _
+from frappe.utils import add_days, cint, getdate
 import json
 from datetime import datetime, timedelta
 
+from cntemad_lms.cntemad_lms.cache import get_cached
+from cntemad_lms.cntemad_lms.counters import get_kpi_counters
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    get_monthly_series,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_export_job.cntemad_export_job import start_export
+from cntemad_lms.cntemad_lms.doctype.cntemad_payment_ledger.cntemad_payment_ledger import PAID_STATUS
+from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+    get_revenue,
+)
+from cntemad_lms.cntemad_lms.exports import iter_query, stream_csv_response
+from cntemad_lms.cntemad_lms.providers import get_provider_metrics
+
+
+# Dashboard sections: (function, kwargs, invalidation tags)
+DASHBOARD_SECTIONS = {
+    "kpis": ("get_national_kpis", None, ["payment", "enrollment", "student"]),
+    "centers_summary": ("get_centers_summary", None, ["payment", "enrollment", "student"]),
+    "trends": ("get_national_trends", None, ["payment", "enrollment", "student"]),
+    "alerts": ("get_national_alerts", None, ["payment", "enrollment"]),
+    "top_centers": ("get_top_centers", {"limit": 5}, ["payment", "student"]),
+    "recent_activity": ("get_recent_national_activity", {"limit": 10}, ["payment", "enrollment"]),
+}
+
 
 @frappe.whitelist()
 def get_national_dashboard() -> dict:
@@ -20,88 +45,46 @@ def get_national_dashboard() -> dict:
             top_centers: Best performing centers,
             recent_activity: Recent national activity
         }
-    """
-    # Global KPIs
-    kpis = get_national_kpis()
-
-    # Centers summary
-    centers_summary = get_centers_summary()
-
-    # Trends (6 months)
-    trends = get_national_trends()
-
-    # Alerts
-    alerts = get_national_alerts()
-
-    # Top performing centers
-    top_centers = get_top_centers(limit=5)
-
-    # Recent activity
-    recent_activity = get_recent_national_activity(limit=10)
 
+    Each section is served from the Redis cache (see `cntemad_lms.cache`).
+    """
     return {
-        "kpis": kpis,
-        "centers_summary": centers_summary,
-        "trends": trends,
-        "alerts": alerts,
-        "top_centers": top_centers,
-        "recent_activity": recent_activity
+        section: get_cached(
+            f"national:{section}",
+            f"cntemad_lms.cntemad_lms.api.national.{method}",
+            kwargs=kwargs,
+            tags=tags,
+        )
+        for section, (method, kwargs, tags) in DASHBOARD_SECTIONS.items()
     }
 
 
 def get_national_kpis() -> dict:
-    """Calculate national KPIs across all centers."""
-    # Total students
-    total_students = frappe.db.count("CNTEMAD Student")
+    """
+    Calculate national KPIs across all centers.
 
-    # Active students (with at least one enrollment in last 30 days)
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    active_students = frappe.db.sql("""
-        SELECT COUNT(DISTINCT student)
-        FROM `tabCNTEMAD Enrollment`
-        WHERE modified >= %s
-    """, [thirty_days_ago])[0][0] or 0
+    Student and enrollment figures come from the Redis counters maintained
+    by the document hooks (see `cntemad_lms.counters`); revenue comes from
+    the balances of the payment ledger.
+    """
+    counters = get_kpi_counters()
+    revenue_this_month = get_revenue("national", month=getdate())
 
-    # Total centers
+    # Reference tables (a few hundred rows at most)
     total_centers = frappe.db.count("CNTEMAD Center")
-
-    # Total ECs
     total_ecs = frappe.db.count("CNTEMAD EC")
     published_ecs = frappe.db.count("CNTEMAD EC", {"is_published": 1})
-
-    # Total courses
     total_courses = frappe.db.count("CNTEMAD Course")
 
-    # Enrollments
-    total_enrollments = frappe.db.count("CNTEMAD Enrollment")
-    validated_enrollments = frappe.db.count("CNTEMAD Enrollment", {"status": "Validated"})
-
-    # Payments this month
-    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0)
-    payments_this_month = frappe.db.count(
-        "CNTEMAD Payment",
-        {"status": "Success", "creation": [">=", month_start]}
-    )
-
-    revenue_this_month = frappe.db.sql("""
-        SELECT COALESCE(SUM(amount), 0)
-        FROM `tabCNTEMAD Payment`
-        WHERE status = 'Success' AND creation >= %s
-    """, [month_start])[0][0] or 0
-
-    # Total revenue
-    total_revenue = frappe.db.sql("""
-        SELECT COALESCE(SUM(amount), 0)
-        FROM `tabCNTEMAD Payment`
-        WHERE status = 'Success'
-    """)[0][0] or 0
+    total_enrollments = cint(counters["total_enrollments"])
+    validated_enrollments = cint(counters["validated_enrollments"])
 
     # Validation rate
     validation_rate = round((validated_enrollments / total_enrollments) * 100, 1) if total_enrollments > 0 else 0
 
     return {
-        "total_students": total_students,
-        "active_students": active_students,
+        "total_students": cint(counters["total_students"]),
+        "active_students": cint(counters["active_students"]),
         "total_centers": total_centers,
         "total_ecs": total_ecs,
         "published_ecs": published_ecs,
@@ -109,103 +92,83 @@ def get_national_kpis() -> dict:
         "total_enrollments": total_enrollments,
         "validated_enrollments": validated_enrollments,
         "validation_rate": validation_rate,
-        "payments_this_month": payments_this_month,
-        "revenue_this_month": revenue_this_month,
-        "total_revenue": total_revenue
+        "payments_this_month": revenue_this_month["payment_count"],
+        "revenue_this_month": revenue_this_month["amount"],
+        "total_revenue": get_revenue("national")["amount"]
     }
 
 
 def get_centers_summary() -> list:
-    """Get summary data for all centers."""
-    centers = frappe.get_all(
-        "CNTEMAD Center",
-        fields=["name", "center_name", "region", "latitude", "longitude"],
-        order_by="center_name asc"
-    )
+    """Get summary data for all centers (read from the CNTEMAD Center Stats rollup)."""
+    return get_center_stats_rows()
 
-    for center in centers:
-        # Student count
-        center["student_count"] = frappe.db.count(
-            "CNTEMAD Student",
-            {"center": center.name}
-        )
 
-        # Payment stats
-        payment_data = frappe.db.sql("""
-            SELECT
-                COUNT(*) as count,
-                COALESCE(SUM(amount), 0) as total
-            FROM `tabCNTEMAD Payment`
-            WHERE center = %s AND status = 'Success'
-        """, [center.name], as_dict=True)[0]
-
-        center["payment_count"] = payment_data.get("count", 0)
-        center["revenue"] = payment_data.get("total", 0)
-
-        # Validation rate
-        enrollments = frappe.db.sql("""
-            SELECT
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'Validated' THEN 1 ELSE 0 END) as validated
-            FROM `tabCNTEMAD Enrollment` e
-            JOIN `tabCNTEMAD Student` s ON e.student = s.name
-            WHERE s.center = %s
-        """, [center.name], as_dict=True)[0]
-
-        total = enrollments.get("total", 0) or 0
-        validated = enrollments.get("validated", 0) or 0
-        center["validation_rate"] = round((validated / total) * 100, 1) if total > 0 else 0
+def get_center_stats_rows(
+    center_ids: list = None,
+    with_coordinates: bool = False,
+    order_by: str = "c.center_name asc",
+    limit: int = None
+) -> list:
+    """
+    Read per-center stats in a single query.
+
+    Counters are maintained incrementally by the document events and
+    rebuilt nightly, see `cntemad_center_stats.rebuild_center_stats`;
+    payment figures are the all-time center balances of the payment ledger.
+    """
+    conditions = []
+    values = {}
+
+    if center_ids:
+        conditions.append("c.name IN %(center_ids)s")
+        values["center_ids"] = center_ids
+
+    if with_coordinates:
+        conditions.append("c.latitude IS NOT NULL AND c.longitude IS NOT NULL")
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = f"LIMIT {int(limit)}" if limit else ""
+
+    centers = frappe.db.sql(f"""
+        SELECT
+            c.name,
+            c.center_name,
+            c.region,
+            c.latitude,
+            c.longitude,
+            COALESCE(cs.student_count, 0) as student_count,
+            COALESCE(rb.payment_count, 0) as payment_count,
+            COALESCE(rb.amount, 0) as revenue,
+            COALESCE(cs.enrollment_count, 0) as total_enrollments,
+            COALESCE(cs.validated_count, 0) as validated_enrollments
+        FROM `tabCNTEMAD Center` c
+        LEFT JOIN `tabCNTEMAD Center Stats` cs ON cs.center = c.name
+        LEFT JOIN `tabCNTEMAD Revenue Balance` rb ON rb.name = CONCAT('center|', c.name, '|')
+        {where_clause}
+        ORDER BY {order_by}
+        {limit_clause}
+    """, values, as_dict=True)
+
+    for center in centers:
+        total = center.total_enrollments
+        center["validation_rate"] = round((center.validated_enrollments / total) * 100, 1) if total > 0 else 0
 
     return centers
 
 
 def get_national_trends() -> list:
-    """Get national enrollment trends over 6 months."""
-    trends = []
-
-    for i in range(5, -1, -1):
-        date = datetime.now() - timedelta(days=i * 30)
-        month_start = date.replace(day=1, hour=0, minute=0, second=0)
-
-        if i > 0:
-            next_month = (date + timedelta(days=32)).replace(day=1)
-        else:
-            next_month = datetime.now() + timedelta(days=1)
-
-        # Enrollments
-        enrollments = frappe.db.sql("""
-            SELECT COUNT(*)
-            FROM `tabCNTEMAD Enrollment`
-            WHERE creation >= %s AND creation < %s
-        """, [month_start, next_month])[0][0] or 0
-
-        # Payments
-        payments = frappe.db.sql("""
-            SELECT COUNT(*), COALESCE(SUM(amount), 0)
-            FROM `tabCNTEMAD Payment`
-            WHERE status = 'Success' AND creation >= %s AND creation < %s
-        """, [month_start, next_month])
-
-        payment_count = payments[0][0] or 0
-        revenue = payments[0][1] or 0
-
-        # New students
-        new_students = frappe.db.sql("""
-            SELECT COUNT(*)
-            FROM `tabCNTEMAD Student`
-            WHERE creation >= %s AND creation < %s
-        """, [month_start, next_month])[0][0] or 0
-
-        trends.append({
-            "month": month_start.strftime("%b %Y"),
-            "month_short": month_start.strftime("%b"),
-            "enrollments": enrollments,
-            "payments": payment_count,
-            "revenue": revenue,
-            "new_students": new_students
-        })
-
-    return trends
+    """Get national enrollment trends over 6 months (read from CNTEMAD Daily Stats)."""
+    return [
+        {
+            "month": point["month_start"].strftime("%b %Y"),
+            "month_short": point["month_start"].strftime("%b"),
+            "enrollments": point["enrollments"],
+            "payments": point["payments"],
+            "revenue": point["revenue"],
+            "new_students": point["new_students"]
+        }
+        for point in get_monthly_series(months=6)
+    ]
 
 
 def get_national_alerts() -> list:
@@ -257,13 +220,12 @@ def get_national_alerts() -> list:
     # Low validation rate centers
     low_validation = frappe.db.sql("""
         SELECT c.name, c.center_name,
-            COUNT(e.name) as total,
-            SUM(CASE WHEN e.status = 'Validated' THEN 1 ELSE 0 END) as validated
-        FROM `tabCNTEMAD Center` c
-        JOIN `tabCNTEMAD Student` s ON s.center = c.name
-        JOIN `tabCNTEMAD Enrollment` e ON e.student = s.name
-        GROUP BY c.name
-        HAVING total > 10 AND (validated / total) < 0.3
+            cs.enrollment_count as total,
+            cs.validated_count as validated
+        FROM `tabCNTEMAD Center Stats` cs
+        JOIN `tabCNTEMAD Center` c ON c.name = cs.center
+        WHERE cs.enrollment_count > 10
+        AND (cs.validated_count / cs.enrollment_count) < 0.3
     """, as_dict=True)
 
     for center in low_validation[:2]:
@@ -280,22 +242,7 @@ def get_national_alerts() -> list:
 
 def get_top_centers(limit: int = 5) -> list:
     """Get top performing centers by various metrics."""
-    centers = frappe.db.sql("""
-        SELECT
-            c.name,
-            c.center_name,
-            c.region,
-            COUNT(DISTINCT s.name) as student_count,
-            COALESCE(SUM(p.amount), 0) as revenue
-        FROM `tabCNTEMAD Center` c
-        LEFT JOIN `tabCNTEMAD Student` s ON s.center = c.name
-        LEFT JOIN `tabCNTEMAD Payment` p ON p.center = c.name AND p.status = 'Success'
-        GROUP BY c.name
-        ORDER BY revenue DESC
-        LIMIT %s
-    """, [limit], as_dict=True)
-
-    return centers
+    return get_center_stats_rows(order_by="revenue desc", limit=cint(limit))
 
 
 def get_recent_national_activity(limit: int = 10) -> list:
@@ -326,7 +273,7 @@ def get_recent_national_activity(limit: int = 10) -> list:
     # Recent payments
     payments = frappe.get_all(
         "CNTEMAD Payment",
-        filters={"status": "Success"},
+        filters={"status": PAID_STATUS},
         fields=["name", "student", "amount", "center", "creation"],
         order_by="creation desc",
         limit=5
@@ -388,41 +335,26 @@ def get_center_detail(center_id: str) -> dict:
     enrollment_stats = frappe.db.sql("""
         SELECT status, COUNT(*) as count
         FROM `tabCNTEMAD Enrollment` e
-        JOIN `tabCNTEMAD Student` s ON e.student = s.name
-        WHERE s.center = %s
+        WHERE e.center = %s
         GROUP BY status
     """, [center_id], as_dict=True)
 
-    # Payments
-    payment_stats = frappe.db.sql("""
-        SELECT
-            COUNT(*) as total_payments,
-            COALESCE(SUM(amount), 0) as total_revenue,
-            COALESCE(SUM(CASE WHEN creation >= %s THEN amount ELSE 0 END), 0) as revenue_this_month
-        FROM `tabCNTEMAD Payment`
-        WHERE center = %s AND status = 'Success'
-    """, [datetime.now().replace(day=1), center_id], as_dict=True)[0]
+    # Payments (payment ledger balances)
+    total = get_revenue("center", center_id)
+    payment_stats = {
+        "total_payments": total["payment_count"],
+        "total_revenue": total["amount"],
+        "revenue_this_month": get_revenue("center", center_id, month=getdate())["amount"],
+    }
 
     # Monthly trends
-    trends = []
-    for i in range(5, -1, -1):
-        date = datetime.now() - timedelta(days=i * 30)
-        month_start = date.replace(day=1)
-        if i > 0:
-            next_month = (date + timedelta(days=32)).replace(day=1)
-        else:
-            next_month = datetime.now() + timedelta(days=1)
-
-        count = frappe.db.sql("""
-            SELECT COUNT(*)
-            FROM `tabCNTEMAD Student`
-            WHERE center = %s AND creation >= %s AND creation < %s
-        """, [center_id, month_start, next_month])[0][0] or 0
-
-        trends.append({
-            "month": month_start.strftime("%b"),
-            "count": count
-        })
+    trends = [
+        {
+            "month": point["month_start"].strftime("%b"),
+            "count": point["new_students"]
+        }
+        for point in get_monthly_series(months=6, center=center_id)
+    ]
 
     return {
         "name": center.name,
@@ -458,52 +390,20 @@ def compare_centers(center_ids: str = None) -> dict:
     if not ids:
         frappe.throw(_("Sélectionnez au moins un centre"))
 
-    comparisons = []
-
-    for center_id in ids:
-        if not frappe.db.exists("CNTEMAD Center", center_id):
-            continue
-
-        center = frappe.db.get_value(
-            "CNTEMAD Center", center_id,
-            ["name", "center_name", "region"],
-            as_dict=True
-        )
-
-        # Stats
-        student_count = frappe.db.count("CNTEMAD Student", {"center": center_id})
-
-        enrollment_data = frappe.db.sql("""
-            SELECT
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'Validated' THEN 1 ELSE 0 END) as validated
-            FROM `tabCNTEMAD Enrollment` e
-            JOIN `tabCNTEMAD Student` s ON e.student = s.name
-            WHERE s.center = %s
-        """, [center_id], as_dict=True)[0]
-
-        payment_data = frappe.db.sql("""
-            SELECT
-                COUNT(*) as count,
-                COALESCE(SUM(amount), 0) as total
-            FROM `tabCNTEMAD Payment`
-            WHERE center = %s AND status = 'Success'
-        """, [center_id], as_dict=True)[0]
-
-        total_enrollments = enrollment_data.get("total", 0) or 0
-        validated = enrollment_data.get("validated", 0) or 0
-
-        comparisons.append({
-            "name": center.name,
-            "center_name": center.center_name,
-            "region": center.region,
-            "student_count": student_count,
-            "total_enrollments": total_enrollments,
-            "validated_enrollments": validated,
-            "validation_rate": round((validated / total_enrollments) * 100, 1) if total_enrollments > 0 else 0,
-            "payment_count": payment_data.get("count", 0),
-            "revenue": payment_data.get("total", 0)
-        })
+    comparisons = [
+        {
+            "name": c.name,
+            "center_name": c.center_name,
+            "region": c.region,
+            "student_count": c.student_count,
+            "total_enrollments": c.total_enrollments,
+            "validated_enrollments": c.validated_enrollments,
+            "validation_rate": c.validation_rate,
+            "payment_count": c.payment_count,
+            "revenue": c.revenue
+        }
+        for c in get_center_stats_rows(center_ids=ids)
+    ]
 
     # Sort by revenue
     comparisons.sort(key=lambda x: x["revenue"], reverse=True)
@@ -520,7 +420,7 @@ def export_national_report(
     date_from: str = None,
     date_to: str = None,
     format: str = "csv"
-) -> dict:
+):
     """
     Export national reports.
 
@@ -528,125 +428,131 @@ def export_national_report(
         report_type: Type of report (summary, students, payments, centers)
         date_from: Start date filter
         date_to: End date filter
-        format: Export format (csv, xlsx)
+        format: Export format (csv, xlsx, parquet)
 
     Returns:
-        dict: { data: str, filename: str }
+        csv: chunked `text/csv` attachment, with no row limit
+        xlsx/parquet: export job dict (see `cntemad_lms.api.export`)
     """
-    import csv
-    from io import StringIO
-
-    output = StringIO()
-    writer = csv.writer(output)
+    if report_type not in NATIONAL_REPORTS:
+        frappe.throw(_("Type de rapport inconnu: {0}").format(report_type))
+
+    if format != "csv":
+        return start_export("national", format, {
+            "report_type": report_type,
+            "date_from": date_from,
+            "date_to": date_to,
+        })
 
     filename = f"cntemad_{report_type}_{datetime.now().strftime('%Y%m%d')}.csv"
 
-    if report_type == "summary":
-        # National summary report
-        writer.writerow(["Rapport National CNTEMAD", datetime.now().strftime("%d/%m/%Y")])
-        writer.writerow([])
-
-        kpis = get_national_kpis()
-        writer.writerow(["Indicateur", "Valeur"])
-        writer.writerow(["Total étudiants", kpis["total_students"]])
-        writer.writerow(["Étudiants actifs", kpis["active_students"]])
-        writer.writerow(["Total centres", kpis["total_centers"]])
-        writer.writerow(["Total EC", kpis["total_ecs"]])
-        writer.writerow(["Inscriptions totales", kpis["total_enrollments"]])
-        writer.writerow(["Inscriptions validées", kpis["validated_enrollments"]])
-        writer.writerow(["Taux de validation", f"{kpis['validation_rate']}%"])
-        writer.writerow(["Revenus ce mois", f"{kpis['revenue_this_month']:,.0f} Ar"])
-        writer.writerow(["Revenus totaux", f"{kpis['total_revenue']:,.0f} Ar"])
-
-    elif report_type == "centers":
-        # Centers report
-        writer.writerow([
-            "Centre", "Région", "Étudiants", "Paiements",
-            "Revenus (Ar)", "Taux validation (%)"
-        ])
-
-        centers = get_centers_summary()
-        for c in centers:
-            writer.writerow([
-                c["center_name"],
-                c["region"],
-                c["student_count"],
-                c["payment_count"],
-                c["revenue"],
-                c["validation_rate"]
-            ])
-
-    elif report_type == "students":
-        # Students report
-        filters = {}
-        if date_from:
-            filters["creation"] = [">=", date_from]
-
-        students = frappe.get_all(
-            "CNTEMAD Student",
-            filters=filters,
-            fields=["student_id", "full_name", "email", "phone", "center", "year", "creation"],
-            order_by="creation desc",
-            limit=10000
-        )
+    return stream_csv_response(
+        filename, iter_national_report, report_type, date_from=date_from, date_to=date_to
+    )
 
-        writer.writerow([
-            "ID", "Nom complet", "Email", "Téléphone",
-            "Centre", "Année", "Date inscription"
-        ])
-
-        for s in students:
-            center_name = frappe.db.get_value("CNTEMAD Center", s.center, "center_name") if s.center else ""
-            writer.writerow([
-                s.student_id,
-                s.full_name,
-                s.email,
-                s.phone,
-                center_name,
-                s.year,
-                s.creation.strftime("%d/%m/%Y") if s.creation else ""
-            ])
-
-    elif report_type == "payments":
-        # Payments report
-        filters = {"status": "Success"}
-        if date_from:
-            filters["creation"] = [">=", date_from]
-        if date_to:
-            if "creation" in filters:
-                filters["creation"] = ["between", [date_from, date_to]]
-            else:
-                filters["creation"] = ["<=", date_to]
-
-        payments = frappe.get_all(
-            "CNTEMAD Payment",
-            filters=filters,
-            fields=["reference", "student", "amount", "provider", "center", "creation"],
-            order_by="creation desc",
-            limit=10000
-        )
 
-        writer.writerow([
-            "Référence", "Étudiant", "Montant (Ar)", "Provider",
-            "Centre", "Date"
-        ])
-
-        for p in payments:
-            student_name = frappe.db.get_value("CNTEMAD Student", p.student, "full_name") if p.student else ""
-            center_name = frappe.db.get_value("CNTEMAD Center", p.center, "center_name") if p.center else ""
-            writer.writerow([
-                p.reference,
-                student_name,
-                p.amount,
-                p.provider,
-                center_name,
-                p.creation.strftime("%d/%m/%Y %H:%M") if p.creation else ""
-            ])
+def iter_national_report(report_type: str, date_from: str = None, date_to: str = None):
+    """Yield the header then every row of a national report."""
+    return NATIONAL_REPORTS[report_type](date_from, date_to)
 
-    return {
-        "data": output.getvalue(),
-        "filename": filename
-    }
+
+def _iter_summary_report(date_from=None, date_to=None):
+    yield ["Rapport National CNTEMAD", datetime.now().strftime("%d/%m/%Y")]
+    yield []
+
+    kpis = get_national_kpis()
+    yield ["Indicateur", "Valeur"]
+    yield ["Total étudiants", kpis["total_students"]]
+    yield ["Étudiants actifs", kpis["active_students"]]
+    yield ["Total centres", kpis["total_centers"]]
+    yield ["Total EC", kpis["total_ecs"]]
+    yield ["Inscriptions totales", kpis["total_enrollments"]]
+    yield ["Inscriptions validées", kpis["validated_enrollments"]]
+    yield ["Taux de validation", f"{kpis['validation_rate']}%"]
+    yield ["Revenus ce mois", f"{kpis['revenue_this_month']:,.0f} Ar"]
+    yield ["Revenus totaux", f"{kpis['total_revenue']:,.0f} Ar"]
+
+
+def _iter_centers_report(date_from=None, date_to=None):
+    yield [
+        "Centre", "Région", "Étudiants", "Paiements",
+        "Revenus (Ar)", "Taux validation (%)"
+    ]
+
+    for c in get_centers_summary():
+        yield [
+            c["center_name"],
+            c["region"],
+            c["student_count"],
+            c["payment_count"],
+            c["revenue"],
+            c["validation_rate"]
+        ]
+
+
+def _iter_students_report(date_from=None, date_to=None):
+    conditions, values = _date_conditions("s.creation", date_from, date_to)
+
+    return iter_query(f"""
+        SELECT
+            s.name, s.full_name, s.email, s.phone,
+            c.center_name, s.current_year, s.creation
+        FROM `tabCNTEMAD Student` s
+        LEFT JOIN `tabCNTEMAD Center` c ON c.name = s.center
+        WHERE {conditions}
+        ORDER BY s.creation DESC
+    """, values, header=[
+        "ID", "Nom complet", "Email", "Téléphone",
+        "Centre", "Année", "Date inscription"
+    ], format_row=lambda r: [
+        r[0], r[1], r[2], r[3], r[4] or "", r[5],
+        r[6].strftime("%d/%m/%Y") if r[6] else ""
+    ])
+
+
+def _iter_payments_report(date_from=None, date_to=None):
+    conditions, values = _date_conditions("p.creation", date_from, date_to)
+
+    return iter_query(f"""
+        SELECT
+            p.name, s.full_name, p.amount, p.provider,
+            c.center_name, p.creation
+        FROM `tabCNTEMAD Payment` p
+        LEFT JOIN `tabCNTEMAD Student` s ON s.name = p.student
+        LEFT JOIN `tabCNTEMAD Center` c ON c.name = p.center
+        WHERE p.status = 'Completed'
+        AND {conditions}
+        ORDER BY p.creation DESC
+    """, values, header=[
+        "Référence", "Étudiant", "Montant (Ar)", "Provider",
+        "Centre", "Date"
+    ], format_row=lambda r: [
+        r[0], r[1] or "", r[2], r[3], r[4] or "",
+        r[5].strftime("%d/%m/%Y %H:%M") if r[5] else ""
+    ])
+
+
+def _date_conditions(column: str, date_from: str = None, date_to: str = None):
+    """Bornes de dates inclusives sur une colonne datetime."""
+    conditions = ["1=1"]
+    values = {}
+
+    if date_from:
+        conditions.append(f"{column} >= %(date_from)s")
+        values["date_from"] = getdate(date_from)
+    if date_to:
+        conditions.append(f"{column} < %(date_to)s")
+        values["date_to"] = add_days(getdate(date_to), 1)
+
+    return " AND ".join(conditions), values
+
+
+NATIONAL_REPORTS = {
+    "summary": _iter_summary_report,
+    "centers": _iter_centers_report,
+    "students": _iter_students_report,
+    "payments": _iter_payments_report,
+}
 
 
 @frappe.whitelist()
@@ -657,26 +563,18 @@ def get_centers_map_data() -> dict:
     Returns:
         dict: { centers: [...], bounds: {...} }
     """
-    centers = frappe.get_all(
-        "CNTEMAD Center",
-        fields=["name", "center_name", "region", "latitude", "longitude"],
-        filters=[["latitude", "is", "set"], ["longitude", "is", "set"]]
-    )
-
-    # Add stats for each center
-    for center in centers:
-        center["student_count"] = frappe.db.count(
-            "CNTEMAD Student",
-            {"center": center.name}
-        )
-
-        revenue = frappe.db.sql("""
-            SELECT COALESCE(SUM(amount), 0)
-            FROM `tabCNTEMAD Payment`
-            WHERE center = %s AND status = 'Success'
-        """, [center.name])[0][0] or 0
-
-        center["revenue"] = revenue
+    centers = [
+        {
+            "name": c.name,
+            "center_name": c.center_name,
+            "region": c.region,
+            "latitude": c.latitude,
+            "longitude": c.longitude,
+            "student_count": c.student_count,
+            "revenue": c.revenue
+        }
+        for c in get_center_stats_rows(with_coordinates=True)
+    ]
 
     # Calculate bounds
     if centers:
@@ -702,3 +600,18 @@ def get_centers_map_data() -> dict:
         "centers": centers,
         "bounds": bounds
     }
+
+
+@frappe.whitelist()
+def get_provider_health(minutes: int = 15) -> dict:
+    """
+    Latency, error rate and circuit state of each mobile money provider.
+
+    Args:
+        minutes: Window (1 to 1440 minutes)
+
+    Returns:
+        dict: {provider: {requests, errors, error_rate, avg_latency_ms,
+                          p95_latency_ms, circuit_open}}
+    """
+    return get_provider_metrics(min(max(cint(minutes), 1), 1440))
@@ -12,23 +12,102 @@ Usage:
     POST /api/method/cntemad_lms.api.payment.initiate_bank_payment
     POST /api/method/cntemad_lms.api.payment.submit_bank_proof
     POST /api/method/cntemad_lms.api.payment.validate_bank_payment
+    POST /api/method/cntemad_lms.api.payment.validate_bank_payments
+    POST /api/method/cntemad_lms.api.payment.import_bank_statement
     GET  /api/method/cntemad_lms.api.payment.check_payment_status
+    GET  /api/method/cntemad_lms.api.payment.wait_payment_status
     POST /api/method/cntemad_lms.api.payment.webhook_callback
 """
 
 import frappe
 from frappe import _
-from frappe.utils import now_datetime, cint, get_datetime_str
+from frappe.utils import now_datetime, cint, flt, getdate, get_datetime_str, sbool
+from frappe.utils.background_jobs import execute_job, get_queue
+import json
 import re
 import hashlib
 import hmac
 import random
 import string
+import time
+from datetime import timedelta
+from functools import partial
+
+import requests
+
+from cntemad_lms.cntemad_lms.api.enrollment import apply_enrollment_status_change
+from cntemad_lms.cntemad_lms.cache import invalidate_cache_tags
+from cntemad_lms.cntemad_lms.doctype.cntemad_bank_statement_import import cntemad_bank_statement_import
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    record_daily_stats,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_notification_outbox.cntemad_notification_outbox import (
+    queue_notification,
+    queue_notifications,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_payment_ledger.cntemad_payment_ledger import (
+    post_ledger_entries,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_webhook_inbox.cntemad_webhook_inbox import (
+    record_webhook_event,
+)
+from cntemad_lms.cntemad_lms.identity import get_current_admin_center, get_current_student_id, is_national_admin
+from cntemad_lms.cntemad_lms.providers import BREAKER_COOLDOWN, ProviderUnavailable, provider_request
 
 
 VALID_PROVIDERS = ["mvola", "orange_money", "airtel_money"]
 VALID_BANKS = ["bfv", "bni"]
 
+# Provider calls run off the web workers, on a dedicated RQ queue
+# (declared under `workers` in common_site_config.json). Retries are
+# scheduled jobs (RQ scheduler of the bench workers), never a sleep.
+PAYMENTS_QUEUE = "payments"
+PROVIDER_JOB_TIMEOUT = 300
+PROVIDER_MAX_ATTEMPTS = 4
+PROVIDER_RETRY_DELAYS = (2, 5, 15)  # seconds before attempts 2, 3, 4
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# Full MSISDN for the provider job: never stored on the Payment (only
+# phone_last_4) nor in RQ job arguments; dropped once the request is settled
+PAYMENT_PHONE_KEY = "cntemad:payment:phone:{payment}"
+PAYMENT_PHONE_TTL = 3600  # seconds, covers the retries
+
+# Airtel transaction status codes
+AIRTEL_STATUSES = {"TS": "completed", "TF": "failed", "TIP": "pending", "TA": "pending"}
+
+# Fallback polling of payment status (wait_payment_status), for clients
+# without realtime: the wait holds a sync web worker, so it stays short
+PAYMENT_STATUS_CHANNEL = "cntemad:payment_status:{payment}"
+LONG_POLL_TIMEOUT = 5  # seconds
+
+# Payments accepted by one validate_bank_payments call
+MAX_BULK_VALIDATION = 500
+
+# Page size cap of the keyset-paginated listings
+MAX_PAGE_LENGTH = 100
+
+# Provider status (webhook, status query) -> CNTEMAD Payment status
+PROVIDER_STATUSES = {
+    "completed": "Completed",
+    "success": "Completed",
+    "successful": "Completed",
+    "failed": "Failed",
+    "cancelled": "Failed",
+    "rejected": "Failed",
+    "expired": "Failed",
+    "pending": "Processing",
+    "processing": "Processing",
+}
+
+# Allowed status transitions (transition_payment); each one is applied
+# in a single transaction, with its enrollment and notification
+PAYMENT_TRANSITIONS = {
+    "Pending": ("Processing", "Completed", "Failed"),
+    "Processing": ("Completed", "Failed"),
+    "Pending Transfer": ("Pending Validation", "Completed"),
+    "Pending Validation": ("Completed", "Rejected"),
+    "Completed": ("Refunded",),
+}
+
 # Bank details for CNTEMAD
 BANKS = {
     "bfv": {
@@ -85,6 +164,8 @@ def get_provider_config(provider: str) -> dict:
         "api_secret": config.get("api_secret", ""),
         "merchant_id": config.get("merchant_id", ""),
         "sandbox": config.get("sandbox", True),
+        "connect_timeout": config.get("connect_timeout"),
+        "read_timeout": config.get("read_timeout"),
     }
 
 
@@ -93,6 +174,10 @@ def initiate_payment(ec_id: str, provider: str, phone_number: str) -> dict:
     """
     Initie un paiement mobile money pour un EC.
 
+    Le paiement est créé en Pending et l'appel à l'opérateur est mis en
+    file (`send_provider_request`); suivre l'avancement avec
+    check_payment_status.
+
     Args:
         ec_id: ID de l'EC à payer
         provider: mvola, orange_money, ou airtel_money
@@ -102,7 +187,6 @@ def initiate_payment(ec_id: str, provider: str, phone_number: str) -> dict:
         dict: {
             "payment_id": str,
             "status": str,
-            "provider_ref": str,
             "message": str
         }
 
@@ -110,9 +194,7 @@ def initiate_payment(ec_id: str, provider: str, phone_number: str) -> dict:
         frappe.ValidationError: Si les données sont invalides
     """
     # Get current student
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"), frappe.ValidationError)
 
@@ -175,43 +257,110 @@ def initiate_payment(ec_id: str, provider: str, phone_number: str) -> dict:
         "phone_last_4": phone_clean[-4:],
     })
     payment.insert(ignore_permissions=True)
-    frappe.db.commit()
+    frappe.cache().set_value(
+        PAYMENT_PHONE_KEY.format(payment=payment.name), phone_clean, expires_in_sec=PAYMENT_PHONE_TTL
+    )
 
-    # Call provider API
-    try:
-        provider_response = call_provider_api(payment, phone_clean)
+    # Provider call runs on the payments queue, once the Payment is committed
+    frappe.enqueue(
+        "cntemad_lms.cntemad_lms.api.payment.send_provider_request",
+        queue=PAYMENTS_QUEUE,
+        timeout=PROVIDER_JOB_TIMEOUT,
+        enqueue_after_commit=True,
+        payment_id=payment.name,
+    )
 
-        if provider_response.get("success"):
-            payment.status = "Processing"
-            payment.provider_transaction_id = provider_response.get("transaction_id", "")
-            payment.save(ignore_permissions=True)
-            frappe.db.commit()
+    return {
+        "payment_id": payment.name,
+        "status": "pending",
+        "amount": amount,
+        "provider_label": PROVIDER_LABELS.get(provider, provider),
+        "message": _("Paiement en cours d'envoi. Confirmez ensuite sur votre téléphone."),
+    }
 
-            return {
-                "payment_id": payment.name,
-                "status": "processing",
-                "provider_ref": provider_response.get("transaction_id"),
-                "amount": amount,
-                "provider_label": PROVIDER_LABELS.get(provider, provider),
-                "message": _("Paiement initié. Confirmez sur votre téléphone."),
-            }
-        else:
-            payment.status = "Failed"
-            payment.failure_reason = provider_response.get("error", "Unknown error")
-            payment.save(ignore_permissions=True)
-            frappe.db.commit()
 
-            frappe.throw(
-                _("Erreur provider: {}").format(provider_response.get("error")),
-                frappe.ValidationError,
-            )
+def send_provider_request(payment_id: str, attempt: int = 1) -> None:
+    """
+    Tâche de fond (file `payments`): envoie la demande de paiement à l'opérateur.
+
+    Les erreurs transitoires (timeout, connexion, HTTP 429/5xx) sont
+    retentées jusqu'à PROVIDER_MAX_ATTEMPTS fois: la tentative suivante
+    est planifiée avec un délai croissant (circuit ouvert: après
+    BREAKER_COOLDOWN) et le worker est libéré. Les autres erreurs passent
+    le paiement en Failed.
+
+    Le numéro complet est lu dans le cache (PAYMENT_PHONE_KEY), jamais
+    dans les arguments du job.
+    """
+    if frappe.db.get_value("CNTEMAD Payment", payment_id, "status") != "Pending":
+        # Already handled (callback, duplicate job)
+        return
+
+    phone_key = PAYMENT_PHONE_KEY.format(payment=payment_id)
+    phone = frappe.cache().get_value(phone_key)
+
+    payment = frappe.get_doc("CNTEMAD Payment", payment_id)
+    if not phone:
+        provider_response = {"success": False, "error": "Numéro de téléphone expiré"}
+    else:
+        try:
+            provider_response = call_provider_api(payment, phone)
+        except Exception as e:
+            frappe.log_error(frappe.get_traceback(), f"Payment provider request {payment_id}")
+            provider_response = {"success": False, "error": str(e)}
+
+    # A callback may have been applied during the call
+    payment = frappe.get_doc("CNTEMAD Payment", payment_id, for_update=True)
+    if payment.status != "Pending":
+        frappe.db.rollback()
+        return
+
+    if provider_response.get("success"):
+        transition_payment(
+            payment, "Processing",
+            provider_attempts=attempt,
+            provider_transaction_id=provider_response.get("transaction_id", ""),
+            failure_reason=None,
+        )
+    elif phone and provider_response.get("retryable") and attempt < PROVIDER_MAX_ATTEMPTS:
+        payment.db_set({
+            "provider_attempts": attempt,
+            "failure_reason": provider_response.get("error"),
+        })
+        delay = PROVIDER_RETRY_DELAYS[attempt - 1]
+        if provider_response.get("circuit_open"):
+            delay = max(delay, BREAKER_COOLDOWN)
+        frappe.db.after_commit.add(partial(_schedule_provider_request, payment_id, attempt + 1, delay))
+    else:
+        transition_payment(
+            payment, "Failed",
+            provider_attempts=attempt,
+            failure_reason=provider_response.get("error") or "Unknown error",
+        )
+
+    if payment.status != "Pending":
+        frappe.db.after_commit.add(partial(frappe.cache().delete_value, phone_key))
+
+    frappe.db.commit()
 
-    except Exception as e:
-        payment.status = "Failed"
-        payment.failure_reason = str(e)
-        payment.save(ignore_permissions=True)
-        frappe.db.commit()
-        raise
+
+def _schedule_provider_request(payment_id: str, attempt: int, delay: int) -> None:
+    """Re-enqueue send_provider_request on the payments queue in `delay` seconds."""
+    method = "cntemad_lms.cntemad_lms.api.payment.send_provider_request"
+    get_queue(PAYMENTS_QUEUE).enqueue_in(
+        timedelta(seconds=delay),
+        execute_job,
+        job_timeout=PROVIDER_JOB_TIMEOUT,
+        kwargs={
+            "site": frappe.local.site,
+            "user": frappe.session.user,
+            "method": method,
+            "event": None,
+            "job_name": method,
+            "is_async": True,
+            "kwargs": {"payment_id": payment_id, "attempt": attempt},
+        },
+    )
 
 
 def call_provider_api(payment, phone: str) -> dict:
@@ -247,10 +396,6 @@ def call_provider_api(payment, phone: str) -> dict:
 
 def call_mvola_api(payment, phone: str, config: dict) -> dict:
     """Call MVola API to initiate payment."""
-    import requests
-
-    api_url = config.get("api_url", "https://devapi.mvola.mg")
-
     headers = {
         "Authorization": f"Bearer {config.get('api_key')}",
         "Content-Type": "application/json",
@@ -269,44 +414,160 @@ def call_mvola_api(payment, phone: str, config: dict) -> dict:
         "creditParty": [{"key": "msisdn", "value": config.get("merchant_id")}],
     }
 
-    try:
-        response = requests.post(
-            f"{api_url}/mvola/mm/transactions/type/merchantpay/1.0.0/",
-            json=payload,
-            headers=headers,
-            timeout=30,
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                "success": True,
-                "transaction_id": data.get("serverCorrelationId"),
-            }
-        else:
-            return {
-                "success": False,
-                "error": f"MVola error: {response.status_code}",
-            }
-    except requests.exceptions.RequestException as e:
-        return {"success": False, "error": str(e)}
+    return _send_provider_request(
+        "mvola",
+        "/mvola/mm/transactions/type/merchantpay/1.0.0/",
+        config,
+        payload,
+        headers,
+        lambda data: data.get("serverCorrelationId"),
+    )
 
 
 def call_orange_api(payment, phone: str, config: dict) -> dict:
     """Call Orange Money API to initiate payment."""
-    # Placeholder - implement based on Orange Money API docs
-    return {
-        "success": True,
-        "transaction_id": f"ORANGE-{payment.name}",
+    headers = {
+        "Authorization": f"Bearer {config.get('api_key')}",
+        "Content-Type": "application/json",
+    }
+
+    payload = {
+        "merchant_key": config.get("merchant_id"),
+        "currency": "MGA",
+        "order_id": payment.name,
+        "amount": int(payment.amount),
+        "subscriber_msisdn": phone,
+        "reference": f"Paiement EC - {payment.ec}",
+        "notif_url": frappe.utils.get_url(
+            "/api/method/cntemad_lms.api.payment.orange_callback"
+        ),
     }
 
+    return _send_provider_request(
+        "orange_money",
+        "/orange-money-webpay/mg/v1/webpayment",
+        config,
+        payload,
+        headers,
+        lambda data: data.get("pay_token"),
+    )
+
 
 def call_airtel_api(payment, phone: str, config: dict) -> dict:
     """Call Airtel Money API to initiate payment."""
-    # Placeholder - implement based on Airtel Money API docs
+    headers = {
+        "Authorization": f"Bearer {config.get('api_key')}",
+        "Content-Type": "application/json",
+        "X-Country": "MG",
+        "X-Currency": "MGA",
+    }
+
+    payload = {
+        "reference": f"Paiement EC - {payment.ec}",
+        "subscriber": {"country": "MG", "currency": "MGA", "msisdn": phone[1:]},
+        "transaction": {"amount": int(payment.amount), "country": "MG", "currency": "MGA", "id": payment.name},
+    }
+
+    return _send_provider_request(
+        "airtel_money",
+        "/merchant/v1/payments/",
+        config,
+        payload,
+        headers,
+        lambda data: ((data.get("data") or {}).get("transaction") or {}).get("id"),
+    )
+
+
+def query_provider_status(payment) -> dict:
+    """
+    Interroge le provider sur l'état d'une transaction (réconciliation).
+
+    Returns:
+        dict: {"status": completed|failed|pending, "transaction_id", "reason"},
+            or None when the provider cannot be queried (sandbox, no transaction id)
+
+    Raises:
+        requests.exceptions.RequestException: provider unreachable, circuit open
+            or unexpected HTTP status
+    """
+    config = get_provider_config(payment.provider)
+    if config.get("sandbox", True) or payment.provider not in VALID_PROVIDERS:
+        return None
+
+    headers = {"Authorization": f"Bearer {config.get('api_key')}"}
+
+    if payment.provider == "mvola":
+        if not payment.provider_transaction_id:
+            return None
+        response = provider_request(
+            "mvola", "GET",
+            f"/mvola/mm/transactions/type/merchantpay/1.0.0/status/{payment.provider_transaction_id}",
+            config, headers=headers,
+        )
+        response.raise_for_status()
+        data = response.json()
+        status = data.get("status")
+        transaction_id = data.get("objectReference") or payment.provider_transaction_id
+
+    elif payment.provider == "orange_money":
+        if not payment.provider_transaction_id:
+            return None
+        response = provider_request(
+            "orange_money", "POST", "/orange-money-webpay/mg/v1/transactionstatus", config,
+            headers=headers,
+            json={
+                "order_id": payment.name,
+                "amount": int(payment.amount),
+                "pay_token": payment.provider_transaction_id,
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        status = data.get("status")
+        transaction_id = data.get("txnid") or payment.provider_transaction_id
+
+    else:
+        response = provider_request(
+            "airtel_money", "GET", f"/standard/v1/payments/{payment.name}", config,
+            headers={**headers, "X-Country": "MG", "X-Currency": "MGA"},
+        )
+        response.raise_for_status()
+        transaction = ((response.json().get("data") or {}).get("transaction") or {})
+        status = AIRTEL_STATUSES.get(transaction.get("status"), "pending")
+        transaction_id = transaction.get("airtel_money_id") or payment.provider_transaction_id
+        data = transaction
+
+    return {
+        "status": (status or "pending").lower(),
+        "transaction_id": transaction_id,
+        "reason": data.get("message") or data.get("reason"),
+    }
+
+
+def _send_provider_request(provider: str, path: str, config: dict, payload: dict, headers: dict, get_transaction_id) -> dict:
+    """POST through the pooled provider client and normalize the outcome."""
+    label = PROVIDER_LABELS.get(provider, provider)
+
+    try:
+        response = provider_request(provider, "POST", path, config, json=payload, headers=headers)
+    except ProviderUnavailable as e:
+        # Circuit open: the call was not attempted, retry once it half-opens
+        return {"success": False, "error": str(e), "retryable": True, "circuit_open": True}
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        return {"success": False, "error": str(e), "retryable": True}
+    except requests.exceptions.RequestException as e:
+        return {"success": False, "error": str(e)}
+
+    if response.status_code in (200, 201, 202):
+        return {
+            "success": True,
+            "transaction_id": get_transaction_id(response.json()),
+        }
+
     return {
-        "success": True,
-        "transaction_id": f"AIRTEL-{payment.name}",
+        "success": False,
+        "error": f"{label} error: {response.status_code}",
+        "retryable": response.status_code in RETRYABLE_STATUS_CODES,
     }
 
 
@@ -336,9 +597,7 @@ def check_payment_status(payment_id: str) -> dict:
     payment = frappe.get_doc("CNTEMAD Payment", payment_id)
 
     # Verify ownership
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
 
     if payment.student != student_id and not frappe.has_permission("CNTEMAD Payment", "write"):
         frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
@@ -381,47 +640,118 @@ def check_payment_status(payment_id: str) -> dict:
 
 
 @frappe.whitelist()
-def get_payment_history(limit: int = 20, offset: int = 0) -> dict:
+def wait_payment_status(payment_id: str, last_status: str = None, timeout: int = LONG_POLL_TIMEOUT) -> dict:
     """
-    Get payment history for current student.
+    Repli du suivi realtime (`cntemad_payment_status`): attend que le
+    statut du paiement diffère de `last_status`.
+
+    Répond immédiatement si le statut a déjà changé, sinon au plus tard
+    après `timeout` secondes (5 max) avec le statut courant. Le réveil
+    passe par Redis pub/sub (voir publish_payment_status), sans relire
+    la base en boucle.
+
+    Args:
+        payment_id: ID du paiement CNTEMAD
+        last_status: Dernier statut connu du client (format check_payment_status)
+        timeout: Durée d'attente maximale en secondes
 
     Returns:
-        dict: { payments: [], total: int }
+        dict: Même contenu que check_payment_status
     """
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    cache = frappe.cache()
+    pubsub = cache.pubsub(ignore_subscribe_messages=True)
+    # Subscribe before reading, so a change in between is not missed
+    pubsub.subscribe(cache.make_key(PAYMENT_STATUS_CHANNEL.format(payment=payment_id)))
 
-    if not student_id:
-        return {"payments": [], "total": 0}
+    try:
+        result = check_payment_status(payment_id)
+        if not last_status or result["status"] != last_status:
+            return result
 
-    filters = {"student": student_id}
-    total = frappe.db.count("CNTEMAD Payment", filters)
+        deadline = time.monotonic() + min(max(cint(timeout), 1), LONG_POLL_TIMEOUT)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return result
 
-    payments = frappe.get_all(
-        "CNTEMAD Payment",
-        filters=filters,
-        fields=[
-            "name", "ec", "amount", "provider", "status",
-            "creation", "completed_at", "failure_reason"
-        ],
-        order_by="creation desc",
-        limit_page_length=cint(limit),
-        limit_start=cint(offset),
-    )
+            if pubsub.get_message(timeout=remaining):
+                # Start a new transaction to see the committed change
+                frappe.db.rollback()
+                return check_payment_status(payment_id)
+    finally:
+        pubsub.close()
+
+
+@frappe.whitelist()
+def get_payment_history(limit: int = 20, cursor: str = None) -> dict:
+    """
+    Get payment history for current student, newest first.
+
+    Args:
+        limit: Page size (max MAX_PAGE_LENGTH)
+        cursor: `next_cursor` of the previous page (first page when empty)
+
+    Returns:
+        dict: { payments: [], total: int, next_cursor: dict | None }
+    """
+    student_id = get_current_student_id()
+
+    if not student_id:
+        return {"payments": [], "total": 0, "next_cursor": None}
+
+    limit = _page_length(limit)
+    after, values = _keyset_condition(cursor)
+    values.update(student=student_id, limit=limit)
+
+    payments = frappe.db.sql(f"""
+        SELECT
+            p.name, p.ec, ec.title as ec_title, p.amount, p.provider, p.status,
+            p.creation, p.completed_at, p.failure_reason
+        FROM `tabCNTEMAD Payment` p
+        LEFT JOIN `tabCNTEMAD EC` ec ON ec.name = p.ec
+        WHERE p.student = %(student)s
+            {after}
+        ORDER BY p.creation DESC, p.name DESC
+        LIMIT %(limit)s
+    """, values, as_dict=True)
 
-    # Enrich with EC titles
     for p in payments:
-        if p.ec:
-            p["ec_title"] = frappe.db.get_value("CNTEMAD EC", p.ec, "title")
         p["provider_label"] = PROVIDER_LABELS.get(p.provider, p.provider)
 
     return {
         "payments": payments,
-        "total": total,
+        "total": frappe.db.count("CNTEMAD Payment", {"student": student_id}),
+        "next_cursor": _next_cursor(payments, limit),
     }
 
 
+def _page_length(limit) -> int:
+    return min(max(cint(limit), 1), MAX_PAGE_LENGTH)
+
+
+def _keyset_condition(cursor) -> tuple:
+    """Condition SQL « après le curseur » pour un tri (p.creation, p.name) décroissant."""
+    cursor = frappe.parse_json(cursor) if cursor else None
+    if not cursor:
+        return "", {}
+
+    if not cursor.get("creation") or not cursor.get("name"):
+        frappe.throw(_("Curseur de pagination invalide"), frappe.ValidationError)
+
+    return (
+        "AND (p.creation < %(cursor_creation)s"
+        " OR (p.creation = %(cursor_creation)s AND p.name < %(cursor_name)s))",
+        {"cursor_creation": cursor["creation"], "cursor_name": cursor["name"]},
+    )
+
+
+def _next_cursor(rows: list, limit: int):
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return {"creation": str(last.creation), "name": last.name}
+
+
 @frappe.whitelist(allow_guest=True)
 def mvola_callback():
     """Webhook callback for MVola payment notifications."""
@@ -444,6 +774,10 @@ def process_webhook_callback(provider: str) -> dict:
     """
     Process webhook callback from mobile money provider.
 
+    The callback is only verified and stored in `CNTEMAD Webhook Inbox`
+    (deduplicated), then acknowledged; the payment is updated by the
+    inbox consumer (`process_webhook_inbox`).
+
     Args:
         provider: Provider name (mvola, orange_money, airtel_money)
 
@@ -460,57 +794,105 @@ def process_webhook_callback(provider: str) -> dict:
     # Parse callback data
     data = frappe.request.get_json(force=True, silent=True) or {}
 
-    # Extract transaction info based on provider format
+    event = parse_webhook_payload(provider, data)
+    if not event:
+        return {"status": "error", "message": "Unknown provider"}
+
+    record_webhook_event(provider, event, data)
+    return {"status": "ok"}
+
+
+def parse_webhook_payload(provider: str, data: dict) -> frappe._dict:
+    """Extract transaction info based on provider format."""
     if provider == "mvola":
         tx_id = data.get("serverCorrelationId")
         reference = data.get("requestingOrganisationTransactionReference")
-        status = data.get("status", "").lower()
     elif provider == "orange_money":
         tx_id = data.get("transactionId")
         reference = data.get("orderId")
-        status = data.get("status", "").lower()
     elif provider == "airtel_money":
         tx_id = data.get("transaction_id")
         reference = data.get("reference")
-        status = data.get("status", "").lower()
     else:
-        return {"status": "error", "message": "Unknown provider"}
+        return None
+
+    return frappe._dict(
+        transaction_id=tx_id,
+        reference=reference,
+        status=(data.get("status") or "").lower(),
+        reason=data.get("message", data.get("reason", "Payment failed")),
+    )
+
 
-    # Find payment by reference (our payment name)
-    if not reference or not frappe.db.exists("CNTEMAD Payment", reference):
-        frappe.log_error(
-            f"Webhook callback: Payment not found for reference {reference}",
-            "Payment Webhook Error"
+def apply_provider_status(payment, provider_status: str, transaction_id: str = None, reason: str = None) -> bool:
+    """
+    Applique à un paiement le statut remonté par le provider (webhook, réconciliation).
+
+    Seuls les paiements Pending/Processing évoluent: un événement rejoué ou
+    arrivé dans le désordre ne modifie jamais un paiement Completed ou
+    Failed. Le commit reste à la charge de l'appelant.
+
+    Returns:
+        bool: True si le paiement a changé de statut
+    """
+    new_status = PROVIDER_STATUSES.get((provider_status or "").lower())
+    if not new_status or new_status == payment.status or payment.status not in ("Pending", "Processing"):
+        return False
+
+    if new_status == "Completed":
+        transition_payment(
+            payment, new_status,
+            provider_transaction_id=transaction_id or payment.provider_transaction_id,
         )
-        return {"status": "error", "message": "Payment not found"}
+    elif new_status == "Failed":
+        transition_payment(payment, new_status, failure_reason=reason or "Payment failed")
+    else:
+        transition_payment(payment, new_status)
 
-    payment = frappe.get_doc("CNTEMAD Payment", reference)
+    frappe.logger().info(f"Payment {payment.name} updated to {payment.status}")
+    return True
 
-    # Update payment status
-    if status in ["completed", "success", "successful"]:
-        payment.status = "Completed"
-        payment.completed_at = now_datetime()
-        payment.provider_transaction_id = tx_id
 
-        # Create/update enrollment
-        if payment.ec:
-            activate_ec_enrollment(payment.student, payment.ec, payment.name)
+def transition_payment(payment, status: str, **values) -> None:
+    """
+    Applique une transition de statut à un paiement, sans commit.
 
-        # Send confirmation
-        send_payment_confirmation(payment)
+    Le paiement, l'inscription activée (Completed) et la notification de
+    la transition sont écrits dans la transaction courante: l'appelant
+    commite une seule fois, ou annule le tout en cas d'erreur.
 
-    elif status in ["failed", "cancelled", "rejected"]:
-        payment.status = "Failed"
-        payment.failure_reason = data.get("message", data.get("reason", "Payment failed"))
+    Usage:
+        transition_payment(payment, "Failed", failure_reason="Timeout")
+        frappe.db.commit()
 
-    elif status in ["pending", "processing"]:
-        payment.status = "Processing"
+    Raises:
+        frappe.ValidationError: transition absente de PAYMENT_TRANSITIONS
+    """
+    if status not in PAYMENT_TRANSITIONS.get(payment.status, ()):
+        frappe.throw(
+            _("Transition de paiement invalide: {0} -> {1}").format(payment.status, status),
+            frappe.ValidationError
+        )
 
+    payment.status = status
+    payment.update(values)
+    if status == "Completed" and not payment.completed_at:
+        payment.completed_at = now_datetime()
     payment.save(ignore_permissions=True)
-    frappe.db.commit()
 
-    frappe.logger().info(f"Payment {reference} updated to {payment.status}")
-    return {"status": "ok"}
+    if status == "Completed" and payment.ec:
+        activate_ec_enrollment(payment.student, payment.ec, payment.name)
+
+    is_bank = (payment.provider or "").startswith("bank_")
+    if status == "Completed":
+        if is_bank:
+            send_bank_payment_confirmation(payment, approved=True)
+        else:
+            send_payment_confirmation(payment)
+    elif status == "Rejected":
+        send_bank_payment_confirmation(payment, approved=False, reason=payment.failure_reason)
+    elif status == "Pending Validation":
+        notify_center_admin_bank_payment(payment)
 
 
 def verify_webhook_signature(provider: str, config: dict) -> bool:
@@ -529,18 +911,20 @@ def verify_webhook_signature(provider: str, config: dict) -> bool:
 
 
 def activate_ec_enrollment(student_id: str, ec_id: str, payment_name: str = None):
-    """Active l'inscription d'un étudiant à un EC après paiement."""
+    """Active l'inscription d'un étudiant à un EC après paiement (sans commit, voir transition_payment)."""
     enrollment = frappe.db.get_value(
         "CNTEMAD Enrollment",
         {"student": student_id, "ec": ec_id},
-        "name"
+        ["name", "status"],
+        as_dict=True
     )
 
     if enrollment:
-        frappe.db.set_value("CNTEMAD Enrollment", enrollment, {
+        frappe.db.set_value("CNTEMAD Enrollment", enrollment.name, {
             "status": "Paid",
             "payment": payment_name,
         })
+        apply_enrollment_status_change(student_id, ec_id, enrollment.status, "Paid")
     else:
         # Create enrollment
         frappe.get_doc({
@@ -552,37 +936,10 @@ def activate_ec_enrollment(student_id: str, ec_id: str, payment_name: str = None
             "enrollment_date": now_datetime(),
         }).insert(ignore_permissions=True)
 
-    frappe.db.commit()
-
 
 def send_payment_confirmation(payment) -> None:
-    """Send SMS/email confirmation for successful payment."""
-    try:
-        student = frappe.get_doc("CNTEMAD Student", payment.student)
-        ec_title = frappe.db.get_value("CNTEMAD EC", payment.ec, "title") or payment.ec
-
-        # Email notification
-        if student.user:
-            frappe.sendmail(
-                recipients=[student.user],
-                subject=f"Paiement confirmé - {ec_title}",
-                message=f"""
-                <p>Bonjour {student.full_name},</p>
-                <p>Votre paiement a été confirmé:</p>
-                <ul>
-                    <li><strong>EC:</strong> {ec_title}</li>
-                    <li><strong>Montant:</strong> {int(payment.amount):,} Ar</li>
-                    <li><strong>Référence:</strong> {payment.name}</li>
-                </ul>
-                <p>Vous pouvez maintenant accéder au contenu de l'EC.</p>
-                <p>CNTEMAD</p>
-                """,
-            )
-
-        frappe.logger().info(f"Payment confirmation sent for {payment.name}")
-
-    except Exception as e:
-        frappe.log_error(f"Failed to send payment confirmation: {e}", "Payment Notification Error")
+    """Queue the email confirmation of a successful payment (sent by the notification worker)."""
+    queue_notification("payment_confirmed", "CNTEMAD Payment", payment.name)
 
 
 # Simulate payment completion for sandbox testing
@@ -604,12 +961,10 @@ def simulate_payment_success(payment_id: str) -> dict:
     if not frappe.db.exists("CNTEMAD Payment", payment_id):
         frappe.throw(_("Paiement non trouvé"))
 
-    payment = frappe.get_doc("CNTEMAD Payment", payment_id)
+    payment = frappe.get_doc("CNTEMAD Payment", payment_id, for_update=True)
 
     # Verify ownership
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
     if payment.student != student_id:
         frappe.throw(_("Accès non autorisé"))
 
@@ -617,14 +972,7 @@ def simulate_payment_success(payment_id: str) -> dict:
         frappe.throw(_("Le paiement ne peut pas être simulé dans cet état"))
 
     # Simulate success
-    payment.status = "Completed"
-    payment.completed_at = now_datetime()
-    payment.save(ignore_permissions=True)
-
-    # Activate enrollment
-    if payment.ec:
-        activate_ec_enrollment(payment.student, payment.ec, payment.name)
-
+    transition_payment(payment, "Completed")
     frappe.db.commit()
 
     return {
@@ -704,9 +1052,7 @@ def initiate_bank_payment(ec_id: str, bank: str) -> dict:
         }
     """
     # Get current student
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"), frappe.ValidationError)
 
@@ -819,12 +1165,10 @@ def submit_bank_proof(payment_id: str, proof_type: str, proof_value: str) -> dic
     if not frappe.db.exists("CNTEMAD Payment", payment_id):
         frappe.throw(_("Paiement non trouvé"), frappe.DoesNotExistError)
 
-    payment = frappe.get_doc("CNTEMAD Payment", payment_id)
+    payment = frappe.get_doc("CNTEMAD Payment", payment_id, for_update=True)
 
     # Verify ownership
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
 
     if payment.student != student_id:
         frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
@@ -844,17 +1188,15 @@ def submit_bank_proof(payment_id: str, proof_type: str, proof_value: str) -> dic
     if not proof_value or len(proof_value.strip()) < 3:
         frappe.throw(_("La preuve de paiement est invalide"), frappe.ValidationError)
 
-    # Update payment
-    payment.status = "Pending Validation"
-    payment.proof_type = proof_type
-    payment.proof_value = proof_value.strip()
-    payment.proof_submitted_at = now_datetime()
-    payment.save(ignore_permissions=True)
+    # Update payment and notify the center admin
+    transition_payment(
+        payment, "Pending Validation",
+        proof_type=proof_type,
+        proof_value=proof_value.strip(),
+        proof_submitted_at=now_datetime(),
+    )
     frappe.db.commit()
 
-    # Notify center admin
-    notify_center_admin_bank_payment(payment)
-
     return {
         "payment_id": payment.name,
         "status": "pending_validation",
@@ -863,38 +1205,8 @@ def submit_bank_proof(payment_id: str, proof_type: str, proof_value: str) -> dic
 
 
 def notify_center_admin_bank_payment(payment) -> None:
-    """Notify center admin about pending bank payment validation."""
-    try:
-        student = frappe.get_doc("CNTEMAD Student", payment.student)
-        ec_title = frappe.db.get_value("CNTEMAD EC", payment.ec, "title") or payment.ec
-
-        # Get center admin email (if center has admin)
-        if student.center:
-            center_admin_email = frappe.db.get_value(
-                "CNTEMAD Center", student.center, "admin_email"
-            )
-            if center_admin_email:
-                frappe.sendmail(
-                    recipients=[center_admin_email],
-                    subject=f"Virement à valider - {student.full_name}",
-                    message=f"""
-                    <p>Un nouveau virement bancaire nécessite votre validation:</p>
-                    <ul>
-                        <li><strong>Étudiant:</strong> {student.full_name}</li>
-                        <li><strong>EC:</strong> {ec_title}</li>
-                        <li><strong>Montant:</strong> {int(payment.amount):,} Ar</li>
-                        <li><strong>Référence:</strong> {payment.bank_reference}</li>
-                        <li><strong>Type de preuve:</strong> {payment.proof_type}</li>
-                        <li><strong>Preuve:</strong> {payment.proof_value}</li>
-                    </ul>
-                    <p>Connectez-vous au dashboard admin pour valider ou rejeter ce paiement.</p>
-                    """,
-                )
-
-        frappe.logger().info(f"Bank payment notification sent for {payment.name}")
-
-    except Exception as e:
-        frappe.log_error(f"Failed to send bank payment notification: {e}", "Bank Payment Notification Error")
+    """Queue the notification of the center admin about a bank payment to validate."""
+    queue_notification("bank_payment_submitted", "CNTEMAD Payment", payment.name)
 
 
 @frappe.whitelist()
@@ -917,7 +1229,7 @@ def validate_bank_payment(payment_id: str, approved: bool, note: str = "") -> di
     if not frappe.db.exists("CNTEMAD Payment", payment_id):
         frappe.throw(_("Paiement non trouvé"), frappe.DoesNotExistError)
 
-    payment = frappe.get_doc("CNTEMAD Payment", payment_id)
+    payment = frappe.get_doc("CNTEMAD Payment", payment_id, for_update=True)
 
     # Validate status
     if payment.status != "Pending Validation":
@@ -931,31 +1243,17 @@ def validate_bank_payment(payment_id: str, approved: bool, note: str = "") -> di
         frappe.throw(_("Une note est requise pour le rejet"), frappe.ValidationError)
 
     if approved:
-        payment.status = "Completed"
-        payment.completed_at = now_datetime()
-        payment.validated_by = frappe.session.user
-        payment.validation_note = note
-
-        # Activate enrollment
-        if payment.ec:
-            activate_ec_enrollment(payment.student, payment.ec, payment.name)
-
-        # Send confirmation to student
-        send_bank_payment_confirmation(payment, approved=True)
-
+        complete_bank_payment(payment, note)
         message = _("Paiement validé avec succès")
     else:
-        payment.status = "Rejected"
-        payment.failure_reason = note
-        payment.validated_by = frappe.session.user
-        payment.validation_note = note
-
-        # Send rejection notification to student
-        send_bank_payment_confirmation(payment, approved=False, reason=note)
-
+        transition_payment(
+            payment, "Rejected",
+            failure_reason=note,
+            validated_by=frappe.session.user,
+            validation_note=note,
+        )
         message = _("Paiement rejeté")
 
-    payment.save(ignore_permissions=True)
     frappe.db.commit()
 
     return {
@@ -965,110 +1263,440 @@ def validate_bank_payment(payment_id: str, approved: bool, note: str = "") -> di
     }
 
 
-def send_bank_payment_confirmation(payment, approved: bool, reason: str = "") -> None:
-    """Send confirmation/rejection email for bank payment."""
-    try:
-        student = frappe.get_doc("CNTEMAD Student", payment.student)
-        ec_title = frappe.db.get_value("CNTEMAD EC", payment.ec, "title") or payment.ec
-
-        if student.user:
-            if approved:
-                subject = f"Paiement validé - {ec_title}"
-                message = f"""
-                <p>Bonjour {student.full_name},</p>
-                <p>Votre virement bancaire a été validé:</p>
-                <ul>
-                    <li><strong>EC:</strong> {ec_title}</li>
-                    <li><strong>Montant:</strong> {int(payment.amount):,} Ar</li>
-                    <li><strong>Référence:</strong> {payment.bank_reference}</li>
-                </ul>
-                <p>Vous pouvez maintenant accéder au contenu de l'EC.</p>
-                <p>CNTEMAD</p>
-                """
-            else:
-                subject = f"Paiement rejeté - {ec_title}"
-                message = f"""
-                <p>Bonjour {student.full_name},</p>
-                <p>Votre virement bancaire a été rejeté:</p>
-                <ul>
-                    <li><strong>EC:</strong> {ec_title}</li>
-                    <li><strong>Montant:</strong> {int(payment.amount):,} Ar</li>
-                    <li><strong>Référence:</strong> {payment.bank_reference}</li>
-                    <li><strong>Raison:</strong> {reason}</li>
-                </ul>
-                <p>Veuillez contacter votre centre CNTEMAD pour plus d'informations.</p>
-                <p>CNTEMAD</p>
-                """
-
-            frappe.sendmail(
-                recipients=[student.user],
-                subject=subject,
-                message=message,
+@frappe.whitelist()
+def validate_bank_payments(decisions) -> dict:
+    """
+    Validate or reject many bank transfer payments at once (admin only).
+
+    The payments are locked together and updated with set-based writes in a
+    single transaction, enrollments included; the emails are queued in the
+    same transaction and sent once it commits. Payments that are no longer
+    Pending Validation are skipped, not failed, as are payments of another
+    center for a center admin.
+
+    Args:
+        decisions: JSON list of {"payment_id", "approved", "note"}
+            (note required for rejection), at most MAX_BULK_VALIDATION
+
+    Returns:
+        dict: {
+            "approved": [payment_id],
+            "rejected": [payment_id],
+            "skipped": [{"payment_id", "reason"}],
+            "message": str
+        }
+    """
+    if not frappe.has_permission("CNTEMAD Payment", "write"):
+        frappe.throw(_("Vous n'avez pas la permission de valider les paiements"), frappe.PermissionError)
+
+    center = None
+    if not is_national_admin():
+        center = get_current_admin_center()
+        if not center:
+            frappe.throw(_("Aucun centre associé"), frappe.PermissionError)
+
+    if isinstance(decisions, str):
+        decisions = json.loads(decisions or "[]")
+
+    if not decisions:
+        frappe.throw(_("Aucun paiement à valider"), frappe.ValidationError)
+
+    if len(decisions) > MAX_BULK_VALIDATION:
+        frappe.throw(
+            _("{0} paiements au maximum par validation groupée").format(MAX_BULK_VALIDATION),
+            frappe.ValidationError
+        )
+
+    # payment_id -> (approved, note)
+    requested = {}
+    for decision in decisions:
+        if not decision.get("payment_id"):
+            frappe.throw(_("Paiement manquant dans la liste"), frappe.ValidationError)
+
+        approved = sbool(decision.get("approved"))
+        note = (decision.get("note") or "").strip()
+        if not approved and not note:
+            frappe.throw(
+                _("Une note est requise pour le rejet ({0})").format(decision.get("payment_id")),
+                frappe.ValidationError
             )
+        requested[decision.get("payment_id")] = (approved, note)
+
+    payments = {
+        p.name: p for p in frappe.db.sql(f"""
+            SELECT name, student, ec, amount, provider, center, status, failure_reason
+            FROM `tabCNTEMAD Payment`
+            WHERE name IN %(names)s
+                {"AND center = %(center)s" if center else ""}
+            FOR UPDATE
+        """, {"names": list(requested), "center": center and center["name"]}, as_dict=True)
+    }
+
+    approved, rejected, skipped = [], [], []
+    rejections = {}  # note -> [payment_id]
+    for payment_id, (is_approved, note) in requested.items():
+        payment = payments.get(payment_id)
+        if not payment:
+            skipped.append({"payment_id": payment_id, "reason": _("Paiement non trouvé")})
+        elif payment.status != "Pending Validation":
+            skipped.append({"payment_id": payment_id, "reason": _("Statut actuel: {0}").format(payment.status)})
+        elif is_approved:
+            approved.append(payment)
+        else:
+            rejections.setdefault(note, []).append(payment_id)
+            rejected.append(payment)
+
+    complete_bank_payments(approved, {p.name: requested[p.name][1] for p in approved})
+
+    now = now_datetime()
+    for note, names in rejections.items():
+        frappe.db.sql("""
+            UPDATE `tabCNTEMAD Payment`
+            SET status = 'Rejected',
+                failure_reason = %(note)s,
+                validated_by = %(user)s,
+                validation_note = %(note)s,
+                modified = %(now)s,
+                modified_by = %(user)s
+            WHERE name IN %(names)s
+        """, {"note": note, "now": now, "user": frappe.session.user, "names": names})
+        queue_notifications("bank_payment_rejected", "CNTEMAD Payment", names, reason=note)
+
+    for payment in rejected:
+        payment.status = "Rejected"
+        payment.failure_reason = requested[payment.name][1]
+
+    if rejected:
+        invalidate_cache_tags("payment")
+        _publish_bulk_status(rejected)
+
+    frappe.db.commit()
+
+    return {
+        "approved": [p.name for p in approved],
+        "rejected": [p.name for p in rejected],
+        "skipped": skipped,
+        "message": _("{0} paiement(s) validé(s), {1} rejeté(s)").format(len(approved), len(rejected)),
+    }
+
+
+def complete_bank_payments(payments: list, notes: dict) -> None:
+    """
+    Variante groupée de `complete_bank_payment`, sans commit.
+
+    `payments` sont des lignes verrouillées (SELECT ... FOR UPDATE: name,
+    student, ec, amount, provider, center, status) qui peuvent passer en
+    Completed. Un seul UPDATE, puis les effets des hooks du Payment pour
+    le lot (inscriptions, agrégats, journal, cache, realtime) et les
+    notifications, dans la transaction courante.
+
+    Partagé par la validation groupée et l'import de relevés bancaires.
+
+    Args:
+        notes: paiement -> note de validation
+    """
+    if not payments:
+        return
+
+    now = now_datetime()
+    cases = " ".join("WHEN %s THEN %s" for _p in payments)
+    params = [value for p in payments for value in (p.name, notes.get(p.name) or "")]
+    frappe.db.sql(f"""
+        UPDATE `tabCNTEMAD Payment`
+        SET status = 'Completed',
+            completed_at = %s,
+            validated_by = %s,
+            validation_note = CASE name {cases} END,
+            modified = %s,
+            modified_by = %s
+        WHERE name IN %s
+    """, [now, frappe.session.user] + params + [now, frappe.session.user, [p.name for p in payments]])
+
+    for payment in payments:
+        payment.status = "Completed"
+
+    # The write above bypasses the Payment hooks: apply their effects for the batch
+    _activate_ec_enrollments(payments)
+    _apply_bulk_paid_delta(payments, now)
+    invalidate_cache_tags("payment")
+    _publish_bulk_status(payments)
+    queue_notifications("bank_payment_validated", "CNTEMAD Payment", [p.name for p in payments])
+
+
+def _publish_bulk_status(payments: list) -> None:
+    """`publish_payment_status` for a batch, student users read in one query."""
+    users = dict(frappe.get_all(
+        "CNTEMAD Student",
+        filters={"name": ["in", list({p.student for p in payments})]},
+        fields=["name", "user"],
+        as_list=True
+    ))
+    for payment in payments:
+        publish_payment_status(payment, user=users.get(payment.student))
+
+
+def _activate_ec_enrollments(payments: list) -> None:
+    """Variante groupée de `activate_ec_enrollment`, sans commit."""
+    payments = [p for p in payments if p.ec]
+    if not payments:
+        return
+
+    enrollments = {
+        (e.student, e.ec): e for e in frappe.db.sql("""
+            SELECT name, student, ec, status
+            FROM `tabCNTEMAD Enrollment`
+            WHERE student IN %(students)s AND ec IN %(ecs)s
+            FOR UPDATE
+        """, {
+            "students": list({p.student for p in payments}),
+            "ecs": list({p.ec for p in payments}),
+        }, as_dict=True)
+    }
+
+    existing = [(enrollments[(p.student, p.ec)], p) for p in payments if (p.student, p.ec) in enrollments]
+    if existing:
+        cases = " ".join("WHEN %s THEN %s" for _e in existing)
+        params = [value for enrollment, payment in existing for value in (enrollment.name, payment.name)]
+        frappe.db.sql(f"""
+            UPDATE `tabCNTEMAD Enrollment`
+            SET status = 'Paid',
+                payment = CASE name {cases} END,
+                modified = %s,
+                modified_by = %s
+            WHERE name IN %s
+        """, params + [now_datetime(), frappe.session.user, [e.name for e, _p in existing]])
+
+        for enrollment, payment in existing:
+            apply_enrollment_status_change(payment.student, payment.ec, enrollment.status, "Paid")
+
+    # Rare (enrollment created at payment time): regular insert, with its hooks
+    for payment in payments:
+        if (payment.student, payment.ec) not in enrollments:
+            frappe.get_doc({
+                "doctype": "CNTEMAD Enrollment",
+                "student": payment.student,
+                "ec": payment.ec,
+                "status": "Paid",
+                "payment": payment.name,
+                "enrollment_date": now_datetime(),
+            }).insert(ignore_permissions=True)
+
+
+def _apply_bulk_paid_delta(payments: list, completed_at) -> None:
+    """`_apply_paid_delta` pour un lot de paiements passés en Completed."""
+    missing = {p.student for p in payments if not p.center}
+    student_centers = dict(frappe.get_all(
+        "CNTEMAD Student", filters={"name": ["in", list(missing)]}, fields=["name", "center"], as_list=True
+    )) if missing else {}
+
+    paid_on = getdate(completed_at)
+    by_row = {}
+    for p in payments:
+        p.center = p.center or student_centers.get(p.student)
+        key = (p.center, p.ec, p.provider)
+        count, revenue = by_row.get(key, (0, 0))
+        by_row[key] = (count + 1, revenue + flt(p.amount))
+
+    for (center, ec, provider), (count, revenue) in by_row.items():
+        record_daily_stats(paid_on, center, ec, provider, payments=count, revenue=revenue)
+
+    post_ledger_entries(payments, "Payment", paid_on)
 
-        frappe.logger().info(f"Bank payment {'confirmation' if approved else 'rejection'} sent for {payment.name}")
 
-    except Exception as e:
-        frappe.log_error(f"Failed to send bank payment confirmation: {e}", "Bank Payment Notification Error")
+def complete_bank_payment(payment, note: str = "") -> None:
+    """
+    Approve a bank transfer: Completed, enrollment activated, student notified.
+
+    Saves the payment; the caller commits. Batches go through
+    `complete_bank_payments`.
+    """
+    transition_payment(
+        payment, "Completed",
+        completed_at=now_datetime(),
+        validated_by=frappe.session.user,
+        validation_note=note,
+    )
+
+
+def send_bank_payment_confirmation(payment, approved: bool, reason: str = "") -> None:
+    """Queue the confirmation/rejection email of a bank payment."""
+    if approved:
+        queue_notification("bank_payment_validated", "CNTEMAD Payment", payment.name)
+    else:
+        queue_notification("bank_payment_rejected", "CNTEMAD Payment", payment.name, reason=reason)
 
 
 @frappe.whitelist()
-def get_pending_bank_payments(center_id: str = None, limit: int = 50, offset: int = 0) -> dict:
+def get_pending_bank_payments(center_id: str = None, limit: int = 50, cursor: str = None) -> dict:
     """
-    Get pending bank payments for validation (admin endpoint).
+    Get pending bank payments for validation (admin endpoint), newest first.
 
     Args:
         center_id: Filter by center (optional)
-        limit: Number of results
-        offset: Pagination offset
+        limit: Page size (max MAX_PAGE_LENGTH)
+        cursor: `next_cursor` of the previous page (first page when empty)
 
     Returns:
-        dict: { payments: [], total: int }
+        dict: { payments: [], total: int, next_cursor: dict | None }
     """
     # Check permissions
     if not frappe.has_permission("CNTEMAD Payment", "read"):
         frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
 
-    filters = {
-        "status": "Pending Validation",
-        "provider": ["like", "bank_%"],
-    }
+    limit = _page_length(limit)
+    after, values = _keyset_condition(cursor)
+    values.update(center=center_id, limit=limit)
 
-    # If center_id provided, filter by student's center
+    # Payments carry the center of their student (set on validate)
+    conditions = """p.status = 'Pending Validation'
+            AND p.provider LIKE 'bank_%%'"""
     if center_id:
-        students_in_center = frappe.get_all(
-            "CNTEMAD Student",
-            filters={"center": center_id},
-            pluck="name"
-        )
-        if students_in_center:
-            filters["student"] = ["in", students_in_center]
-        else:
-            return {"payments": [], "total": 0}
-
-    total = frappe.db.count("CNTEMAD Payment", filters)
-
-    payments = frappe.get_all(
-        "CNTEMAD Payment",
-        filters=filters,
-        fields=[
-            "name", "student", "ec", "amount", "provider", "status",
-            "bank_reference", "bank_code", "proof_type", "proof_value",
-            "proof_submitted_at", "creation"
-        ],
-        order_by="proof_submitted_at desc",
-        limit_page_length=cint(limit),
-        limit_start=cint(offset),
-    )
+        conditions += "\n            AND p.center = %(center)s"
+
+    payments = frappe.db.sql(f"""
+        SELECT
+            p.name, p.student, s.full_name as student_name, p.ec, ec.title as ec_title,
+            p.amount, p.provider, p.status, p.bank_reference, p.bank_code,
+            p.proof_type, p.proof_value, p.proof_submitted_at, p.creation
+        FROM `tabCNTEMAD Payment` p
+        LEFT JOIN `tabCNTEMAD Student` s ON s.name = p.student
+        LEFT JOIN `tabCNTEMAD EC` ec ON ec.name = p.ec
+        WHERE {conditions}
+            {after}
+        ORDER BY p.creation DESC, p.name DESC
+        LIMIT %(limit)s
+    """, values, as_dict=True)
 
-    # Enrich with student and EC info
     for p in payments:
-        p["student_name"] = frappe.db.get_value("CNTEMAD Student", p.student, "full_name")
-        p["ec_title"] = frappe.db.get_value("CNTEMAD EC", p.ec, "title") if p.ec else None
         p["provider_label"] = PROVIDER_LABELS.get(p.provider, p.provider)
         p["bank_name"] = BANKS.get(p.bank_code, {}).get("name", p.bank_code)
 
+    total = frappe.db.sql(f"""
+        SELECT COUNT(*)
+        FROM `tabCNTEMAD Payment` p
+        WHERE {conditions}
+    """, values)[0][0]
+
     return {
         "payments": payments,
         "total": total,
+        "next_cursor": _next_cursor(payments, limit),
     }
+
+
+@frappe.whitelist()
+def import_bank_statement(file_url: str, bank: str) -> dict:
+    """
+    Reconcile a BFV-SG or BNI statement (CSV/OFX) against open bank transfers (admin only).
+
+    Credits whose label carries the `bank_reference` of a Pending Transfer /
+    Pending Validation payment, for the same amount, complete that payment;
+    ambiguous lines are listed for manual review.
+
+    Args:
+        file_url: URL of the uploaded statement (private File)
+        bank: Bank code (bfv or bni)
+
+    Returns:
+        dict: { name, status, matched_count, ambiguous, ... }
+
+    Runs on the payments queue; poll `get_bank_statement_import`. The owner
+    also receives a `cntemad_bank_statement_imported` realtime event.
+    """
+    if not frappe.has_permission("CNTEMAD Payment", "write"):
+        frappe.throw(_("Vous n'avez pas la permission de valider les paiements"), frappe.PermissionError)
+
+    return cntemad_bank_statement_import.start_bank_statement_import(file_url, bank)
+
+
+@frappe.whitelist()
+def get_bank_statement_import(import_id: str) -> dict:
+    """Get the status and result of a bank statement import (polling)."""
+    if not frappe.has_permission("CNTEMAD Payment", "write"):
+        frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
+
+    return cntemad_bank_statement_import.get_bank_statement_import(import_id)
+
+
+# ==============================================================================
+# DOCUMENT EVENTS
+# ==============================================================================
+
+
+def on_payment_created(doc, method):
+    """Hook après création d'un paiement."""
+    if doc.status == "Completed":
+        _apply_paid_delta(doc, 1)
+
+    invalidate_cache_tags("payment")
+
+
+def on_payment_updated(doc, method):
+    """Hook après modification d'un paiement (transitions de statut)."""
+    if doc.flags.in_insert:
+        # Already handled by on_payment_created
+        return
+
+    before = doc.get_doc_before_save()
+    was_paid = bool(before) and before.status == "Completed"
+    is_paid = doc.status == "Completed"
+
+    if was_paid != is_paid:
+        _apply_paid_delta(doc, 1 if is_paid else -1)
+
+    if not before or before.status != doc.status:
+        invalidate_cache_tags("payment")
+        publish_payment_status(doc)
+
+
+def on_payment_deleted(doc, method):
+    """Hook avant suppression d'un paiement."""
+    if doc.status == "Completed":
+        _apply_paid_delta(doc, -1)
+
+    invalidate_cache_tags("payment")
+
+
+def publish_payment_status(doc, user: str = None) -> None:
+    """
+    Pousse le nouveau statut d'un paiement à l'étudiant, une fois commité.
+
+    - événement realtime `cntemad_payment_status` (socket.io) pour l'utilisateur
+    - message Redis réveillant les requêtes `wait_payment_status` en attente
+
+    `user` (utilisateur de l'étudiant) évite une requête quand il est déjà connu.
+    """
+    status = doc.status.lower().replace(" ", "_")
+    user = user or frappe.db.get_value("CNTEMAD Student", doc.student, "user")
+
+    if user:
+        frappe.publish_realtime(
+            "cntemad_payment_status",
+            {"payment_id": doc.name, "status": status, "failure_reason": doc.failure_reason},
+            user=user,
+            after_commit=True,
+        )
+
+    frappe.db.after_commit.add(partial(_notify_status_waiters, doc.name, status))
+
+
+def _notify_status_waiters(payment_id: str, status: str) -> None:
+    cache = frappe.cache()
+    cache.publish(cache.make_key(PAYMENT_STATUS_CHANNEL.format(payment=payment_id)), status)
+
+
+def _apply_paid_delta(doc, sign: int) -> None:
+    """Répercute l'entrée/sortie d'un paiement de l'état payé sur le journal et les agrégats."""
+    center = doc.center or frappe.db.get_value("CNTEMAD Student", doc.student, "center")
+    paid_on = getdate(doc.completed_at or now_datetime())
+
+    if sign > 0:
+        entry_type = "Payment"
+    else:
+        entry_type = "Refund" if doc.status == "Refunded" else "Reversal"
+    post_ledger_entries([frappe._dict(doc.as_dict(), center=center)], entry_type, paid_on)
+
+    record_daily_stats(
+        paid_on, center, doc.ec, doc.provider,
+        payments=sign, revenue=sign * flt(doc.amount),
+    )
@@ -13,6 +13,11 @@ from frappe import _
 from frappe.utils import now_datetime, cint
 import json
 
+from cntemad_lms.cntemad_lms.api.enrollment import apply_enrollment_status_change
+from cntemad_lms.cntemad_lms.counters import mark_student_active
+from cntemad_lms.cntemad_lms.identity import get_current_student_id
+from cntemad_lms.cntemad_lms.quiz_cache import get_compiled_quiz
+
 
 @frappe.whitelist()
 def get_quiz(ec_id: str) -> dict:
@@ -29,16 +34,10 @@ def get_quiz(ec_id: str) -> dict:
             questions: List of questions (without correct answers)
         }
     """
-    # Verify EC exists
-    if not frappe.db.exists("CNTEMAD EC", ec_id):
-        frappe.throw(_("EC non trouvé"), frappe.DoesNotExistError)
-
-    ec = frappe.get_doc("CNTEMAD EC", ec_id)
+    ec = _get_ec(ec_id)
 
     # Check if student has paid
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
 
     is_paid = False
     if student_id:
@@ -56,107 +55,29 @@ def get_quiz(ec_id: str) -> dict:
     if not is_paid:
         return {"ec": ec_data, "quiz": None, "questions": []}
 
-    # Get quiz from LMS or custom doctype
-    quiz_data = get_quiz_for_ec(ec)
-
-    if not quiz_data:
-        return {"ec": ec_data, "quiz": None, "questions": []}
-
-    # Get questions (without correct answers for security)
-    questions = get_quiz_questions(quiz_data.get("name"))
+    # Compiled quiz (LMS Quiz or default), questions without correct answers
+    quiz = get_compiled_quiz(ec)
 
     return {
         "ec": ec_data,
         "quiz": {
-            "name": quiz_data.get("name"),
-            "title": quiz_data.get("title") or f"Quiz - {ec.title}",
-            "passing_score": quiz_data.get("passing_score", 70),
-            "time_limit": quiz_data.get("time_limit", 0),  # in minutes
-            "max_attempts": quiz_data.get("max_attempts", 3),
-            "show_immediate_feedback": quiz_data.get("show_immediate_feedback", False),
+            "name": quiz["name"],
+            "title": quiz["title"] or f"Quiz - {ec.title}",
+            "passing_score": quiz["passing_score"],
+            "time_limit": quiz["time_limit"],  # in minutes
+            "max_attempts": quiz["max_attempts"],
+            "show_immediate_feedback": quiz["show_immediate_feedback"],
         },
-        "questions": questions,
+        "questions": quiz["questions"],
     }
 
 
-def get_quiz_for_ec(ec) -> dict:
-    """Get quiz configuration for an EC."""
-    # Try to get LMS Quiz linked to EC
-    quiz_id = ec.get("quiz") or ec.get("quiz_id")
-
-    if quiz_id and frappe.db.exists("LMS Quiz", quiz_id):
-        quiz = frappe.get_doc("LMS Quiz", quiz_id)
-        return {
-            "name": quiz.name,
-            "title": quiz.title,
-            "passing_score": quiz.passing_percentage or 70,
-            "time_limit": quiz.max_time or 0,
-            "max_attempts": quiz.max_attempts or 3,
-            "show_immediate_feedback": quiz.show_answers_after_submission or False,
-        }
-
-    # Fallback: Create default quiz settings
-    return {
-        "name": f"quiz-{ec.name}",
-        "title": f"Quiz - {ec.title}",
-        "passing_score": 70,
-        "time_limit": 30,  # 30 minutes default
-        "max_attempts": 3,
-        "show_immediate_feedback": False,
-    }
-
-
-def get_quiz_questions(quiz_id: str) -> list:
-    """
-    Get quiz questions without exposing correct answers.
-
-    Returns list of questions with options.
-    """
-    questions = []
-
-    # Try LMS Quiz questions
-    if frappe.db.exists("LMS Quiz", quiz_id):
-        quiz_questions = frappe.get_all(
-            "LMS Quiz Question",
-            filters={"parent": quiz_id},
-            fields=["name", "question", "type", "options", "idx"],
-            order_by="idx",
-        )
-
-        for q in quiz_questions:
-            options = []
-            if q.options:
-                # Parse options (stored as JSON or newline-separated)
-                try:
-                    options = json.loads(q.options)
-                except:
-                    options = [opt.strip() for opt in q.options.split("\n") if opt.strip()]
-
-            questions.append({
-                "id": q.name,
-                "text": q.question,
-                "type": "multiple" if q.type == "Multiple Choice" else "single",
-                "options": options,
-            })
-
-    # Fallback: Sample questions for demo
-    if not questions:
-        questions = [
-            {
-                "id": "q1",
-                "text": "Question exemple 1 - Sélectionnez la bonne réponse",
-                "type": "single",
-                "options": ["Option A", "Option B", "Option C", "Option D"],
-            },
-            {
-                "id": "q2",
-                "text": "Question exemple 2 - Plusieurs réponses possibles",
-                "type": "multiple",
-                "options": ["Réponse 1", "Réponse 2", "Réponse 3", "Réponse 4"],
-            },
-        ]
-
-    return questions
+def _get_ec(ec_id: str):
+    """EC from the document cache (no query once cached)."""
+    try:
+        return frappe.get_cached_doc("CNTEMAD EC", ec_id)
+    except frappe.DoesNotExistError:
+        frappe.throw(_("EC non trouvé"), frappe.DoesNotExistError)
 
 
 @frappe.whitelist()
@@ -166,7 +87,7 @@ def submit_quiz(ec_id: str, quiz_id: str = None, answers: str = None, time_spent
 
     Args:
         ec_id: EC identifier
-        quiz_id: Quiz identifier
+        quiz_id: Quiz identifier (ignored: answers are graded against the EC's quiz)
         answers: JSON string of answers [{question_id, answer}]
         time_spent: Time spent in seconds
 
@@ -181,16 +102,13 @@ def submit_quiz(ec_id: str, quiz_id: str = None, answers: str = None, time_spent
         }
     """
     # Verify student
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
 
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"))
 
     # Verify EC
-    if not frappe.db.exists("CNTEMAD EC", ec_id):
-        frappe.throw(_("EC non trouvé"))
+    quiz = get_compiled_quiz(_get_ec(ec_id))
 
     # Verify enrollment
     enrollment = frappe.db.get_value(
@@ -220,15 +138,10 @@ def submit_quiz(ec_id: str, quiz_id: str = None, answers: str = None, time_spent
         answer_list = []
 
     # Calculate score
-    score, total, details = calculate_quiz_score(ec_id, quiz_id, answer_list)
+    score, total, details = calculate_quiz_score(quiz, answer_list)
 
     percent = round((score / total) * 100) if total > 0 else 0
-    passing_score = 70  # Default, could come from quiz settings
-
-    if quiz_id and frappe.db.exists("LMS Quiz", quiz_id):
-        passing_score = frappe.db.get_value("LMS Quiz", quiz_id, "passing_percentage") or 70
-
-    passed = percent >= passing_score
+    passed = percent >= quiz["passing_score"]
 
     # Update enrollment
     new_attempts = current_attempts + 1
@@ -247,10 +160,15 @@ def submit_quiz(ec_id: str, quiz_id: str = None, answers: str = None, time_spent
             "quiz_attempts": new_attempts,
         })
 
+    apply_enrollment_status_change(
+        student_id, ec_id, enrollment.status, "Validated" if passed else "In Progress"
+    )
+    mark_student_active(student_id)
+
     frappe.db.commit()
 
     # Log the attempt
-    log_quiz_attempt(student_id, ec_id, quiz_id, score, total, percent, passed, time_spent)
+    log_quiz_attempt(student_id, ec_id, quiz["name"], score, total, percent, passed, time_spent)
 
     return {
         "score": score,
@@ -263,9 +181,9 @@ def submit_quiz(ec_id: str, quiz_id: str = None, answers: str = None, time_spent
     }
 
 
-def calculate_quiz_score(ec_id: str, quiz_id: str, answers: list) -> tuple:
+def calculate_quiz_score(quiz: dict, answers: list) -> tuple:
     """
-    Calculate quiz score by comparing answers with correct ones.
+    Calculate quiz score by comparing answers with the compiled answer key.
 
     Returns: (score, total, details)
     """
@@ -273,8 +191,7 @@ def calculate_quiz_score(ec_id: str, quiz_id: str, answers: list) -> tuple:
     total = 0
     details = []
 
-    # Get correct answers from quiz
-    correct_answers = get_correct_answers(quiz_id)
+    correct_answers = quiz["answers"]
 
     for answer_item in answers:
         question_id = answer_item.get("question_id")
@@ -283,17 +200,14 @@ def calculate_quiz_score(ec_id: str, quiz_id: str, answers: list) -> tuple:
         if not isinstance(user_answer, list):
             user_answer = [user_answer]
 
-        correct = correct_answers.get(question_id, [])
-
-        if not isinstance(correct, list):
-            correct = [correct]
+        correct = correct_answers.get(question_id, frozenset())
 
         total += 1
 
-        # Check if answers match
+        # Check if answers match (option indices)
         is_correct = (
             len(user_answer) == len(correct) and
-            all(a in correct for a in user_answer)
+            all(isinstance(a, int) and a in correct for a in user_answer)
         )
 
         if is_correct:
@@ -302,7 +216,7 @@ def calculate_quiz_score(ec_id: str, quiz_id: str, answers: list) -> tuple:
         details.append({
             "question_id": question_id,
             "user_answer": user_answer,
-            "correct_answer": correct,
+            "correct_answer": sorted(correct),
             "is_correct": is_correct,
         })
 
@@ -313,43 +227,6 @@ def calculate_quiz_score(ec_id: str, quiz_id: str, answers: list) -> tuple:
     return correct_count, total, details
 
 
-def get_correct_answers(quiz_id: str) -> dict:
-    """
-    Get correct answers for a quiz.
-
-    Returns dict of {question_id: correct_answer_index(es)}
-    """
-    correct = {}
-
-    if quiz_id and frappe.db.exists("LMS Quiz", quiz_id):
-        questions = frappe.get_all(
-            "LMS Quiz Question",
-            filters={"parent": quiz_id},
-            fields=["name", "type", "options", "correct_options"],
-        )
-
-        for q in questions:
-            if q.correct_options:
-                try:
-                    # correct_options stored as JSON array of indices
-                    correct[q.name] = json.loads(q.correct_options)
-                except:
-                    # Or as comma-separated indices
-                    correct[q.name] = [int(i.strip()) for i in q.correct_options.split(",") if i.strip().isdigit()]
-            else:
-                # Default: first option is correct (for demo)
-                correct[q.name] = [0]
-
-    # Fallback for demo questions
-    if not correct:
-        correct = {
-            "q1": [0],  # First option correct
-            "q2": [0, 2],  # First and third options correct
-        }
-
-    return correct
-
-
 def log_quiz_attempt(
     student_id: str,
     ec_id: str,
@@ -381,9 +258,7 @@ def get_quiz_history(ec_id: str) -> dict:
     Returns:
         dict: { attempts: [], best_score: int }
     """
-    student_id = frappe.db.get_value(
-        "CNTEMAD Student", {"user": frappe.session.user}, "name"
-    )
+    student_id = get_current_student_id()
 
     if not student_id:
         return {"attempts": [], "best_score": 0}
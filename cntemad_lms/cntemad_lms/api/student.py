@@ -2,6 +2,18 @@
 
 import frappe
 from frappe import _
+from frappe.utils import getdate
+
+from cntemad_lms.cntemad_lms.cache import invalidate_cache_tags
+from cntemad_lms.cntemad_lms.counters import forget_student, increment_kpis
+from cntemad_lms.cntemad_lms.doctype.cntemad_center_stats.cntemad_center_stats import (
+    refresh_center_stats,
+    update_center_stats,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    record_daily_stats,
+)
+from cntemad_lms.cntemad_lms.identity import clear_identity, get_current_student_id
 
 
 @frappe.whitelist()
@@ -60,9 +72,7 @@ def get_student_dashboard(student_id: str = None) -> dict:
         dict: Données du dashboard
     """
     if not student_id:
-        student_id = frappe.db.get_value(
-            "CNTEMAD Student", {"user": frappe.session.user}, "name"
-        )
+        student_id = get_current_student_id()
 
     if not student_id:
         frappe.throw(_("Profil étudiant non trouvé"))
@@ -97,3 +107,48 @@ def get_student_dashboard(student_id: str = None) -> dict:
         "recent_activities": recent_enrollments,
         "pending_payments": pending_payments,
     }
+
+
+def on_student_created(doc, method):
+    """Hook après création d'un étudiant."""
+    update_center_stats(doc.center, student_count=1)
+    record_daily_stats(getdate(doc.creation), doc.center, new_students=1)
+    increment_kpis({"total_students": 1})
+    clear_identity(doc.user)
+    invalidate_cache_tags("student")
+
+
+def on_student_updated(doc, method):
+    """Hook après modification d'un étudiant."""
+    if doc.flags.in_insert:
+        # Already handled by on_student_created
+        return
+
+    before = doc.get_doc_before_save()
+    clear_identity(doc.user, before.user if before else None)
+
+    if before and before.center != doc.center:
+        # Enrollments and payments follow the student: recompute both centers
+        sync_student_center(doc.name, doc.center)
+        refresh_center_stats(before.center, doc.center)
+        invalidate_cache_tags("student")
+
+
+def on_student_deleted(doc, method):
+    """Hook avant suppression d'un étudiant."""
+    update_center_stats(doc.center, student_count=-1)
+    record_daily_stats(getdate(doc.creation), doc.center, new_students=-1)
+    increment_kpis({"total_students": -1})
+    forget_student(doc.name)
+    clear_identity(doc.user)
+    invalidate_cache_tags("student")
+
+
+def sync_student_center(student_id: str, center: str) -> None:
+    """Propage le centre d'un étudiant sur ses inscriptions et paiements."""
+    for doctype in ("CNTEMAD Enrollment", "CNTEMAD Payment"):
+        frappe.db.sql(f"""
+            UPDATE `tab{doctype}`
+            SET center = %s
+            WHERE student = %s
+        """, (center or None, student_id))
@@ -4,6 +4,13 @@ import frappe
 from frappe import _
 import json
 
+from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+    get_monthly_series,
+)
+from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+    get_revenue,
+)
+
 
 @frappe.whitelist()
 def get_my_courses() -> dict:
@@ -380,6 +387,7 @@ def save_quiz(ec_id: str, quiz_data: str = None) -> dict:
         # Link to quiz
         quiz.append("questions", {"question": question.name})
 
+    # The LMS Quiz on_update hook bumps the compiled quiz version (quiz_cache)
     quiz.save()
     frappe.db.commit()
 
@@ -424,35 +432,17 @@ def get_ec_stats(ec_id: str) -> dict:
         scores = [e.quiz_score for e in quiz_attempts if e.quiz_score]
         avg_score = sum(scores) / len(scores) if scores else 0
 
-    # Revenue
-    payments = frappe.get_all(
-        "CNTEMAD Payment",
-        filters={"ec": ec_id, "status": "Success"},
-        fields=["amount"]
-    )
-    total_revenue = sum(p.amount for p in payments)
+    # Revenue (payment ledger balance)
+    total_revenue = get_revenue("ec", ec_id)["amount"]
 
     # Enrollments by month (last 6 months)
-    from datetime import datetime, timedelta
-
-    months_data = []
-    for i in range(5, -1, -1):
-        date = datetime.now() - timedelta(days=i * 30)
-        month_start = date.replace(day=1)
-        if i > 0:
-            next_month = (date + timedelta(days=32)).replace(day=1)
-        else:
-            next_month = datetime.now() + timedelta(days=1)
-
-        count = len([
-            e for e in enrollments
-            if e.creation and month_start <= e.creation.replace(tzinfo=None) < next_month
-        ])
-
-        months_data.append({
-            "month": month_start.strftime("%b"),
-            "count": count
-        })
+    months_data = [
+        {
+            "month": point["month_start"].strftime("%b"),
+            "count": point["enrollments"]
+        }
+        for point in get_monthly_series(months=6, ec=ec_id)
+    ]
 
     # Recent enrollments
     recent = frappe.get_all(
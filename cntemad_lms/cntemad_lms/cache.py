@@ -0,0 +1,166 @@
+"""
+Redis cache with tag-based invalidation and stale-while-revalidate.
+
+Each entry is stored under two keys:
+- the value, kept for a long time (`stale_ttl`)
+- a freshness marker, which expires after `ttl` or when one of its tags is invalidated
+
+A stale entry is served immediately while a single background job
+recomputes it (Redis `SET NX` lock), so ten admins opening the same
+dashboard trigger one recomputation, not ten.
+
+Usage:
+    get_cached(
+        "national:kpis",
+        "cntemad_lms.cntemad_lms.api.national.get_national_kpis",
+        tags=["payment", "enrollment", "student"],
+    )
+
+    invalidate_cache_tags("payment")
+"""
+
+import time
+from functools import partial
+
+import frappe
+
+
+CACHE_PREFIX = "cntemad:cache"
+DEFAULT_TTL = 300  # 5 minutes
+DEFAULT_STALE_TTL = 24 * 3600
+LOCK_TTL = 120
+WAIT_TIMEOUT = 10  # seconds a reader waits for a concurrent first computation
+
+
+def get_cached(
+    key: str,
+    method: str,
+    kwargs: dict = None,
+    tags: list = None,
+    ttl: int = None,
+    stale_ttl: int = DEFAULT_STALE_TTL
+):
+    """
+    Return the cached value for `key`, computing it with `method` if needed.
+
+    Args:
+        key: Cache key (unique per method + arguments)
+        method: Dotted path of the function computing the value
+        kwargs: Arguments passed to `method`
+        tags: Invalidation tags (see `invalidate_cache_tags`)
+        ttl: Freshness in seconds (site config `cntemad_cache_ttl` by default)
+        stale_ttl: How long a stale value may still be served
+    """
+    cache = frappe.cache()
+    ttl = ttl or frappe.conf.get("cntemad_cache_ttl") or DEFAULT_TTL
+
+    entry = cache.get_value(_value_key(key), expires=True)
+    if entry is not None:
+        if not cache.get_value(_fresh_key(key), expires=True) and _acquire_lock(key):
+            frappe.enqueue(
+                "cntemad_lms.cntemad_lms.cache.refresh_cached",
+                queue="short",
+                key=key,
+                method=method,
+                kwargs=kwargs,
+                tags=tags,
+                ttl=ttl,
+                stale_ttl=stale_ttl,
+            )
+        return entry["value"]
+
+    # Cold cache: a single caller computes, the others wait for its result
+    if _acquire_lock(key):
+        try:
+            return _compute(key, method, kwargs, tags, ttl, stale_ttl)
+        finally:
+            _release_lock(key)
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        entry = cache.get_value(_value_key(key), expires=True)
+        if entry is not None:
+            return entry["value"]
+
+    return frappe.get_attr(method)(**(kwargs or {}))
+
+
+def refresh_cached(
+    key: str,
+    method: str,
+    kwargs: dict = None,
+    tags: list = None,
+    ttl: int = DEFAULT_TTL,
+    stale_ttl: int = DEFAULT_STALE_TTL
+) -> None:
+    """Background job: recompute a stale entry, then release its lock."""
+    try:
+        _compute(key, method, kwargs, tags, ttl, stale_ttl)
+    finally:
+        _release_lock(key)
+
+
+def invalidate_cache_tags(*tags) -> None:
+    """
+    Mark every entry carrying one of `tags` as stale once the transaction commits.
+
+    Entries are not deleted: readers keep getting the previous value while
+    one background job recomputes it.
+    """
+    if not tags:
+        return
+
+    frappe.db.after_commit.add(partial(_invalidate_now, tags))
+
+
+def _invalidate_now(tags) -> None:
+    cache = frappe.cache()
+    fresh_keys = []
+    for tag in tags:
+        fresh_keys.extend(_fresh_key(_decode(k)) for k in cache.smembers(_tag_key(tag)))
+
+    if fresh_keys:
+        cache.delete_value(fresh_keys)
+
+
+def _compute(key, method, kwargs, tags, ttl, stale_ttl):
+    cache = frappe.cache()
+    value = frappe.get_attr(method)(**(kwargs or {}))
+
+    cache.set_value(_value_key(key), {"value": value}, expires_in_sec=stale_ttl)
+    cache.set_value(_fresh_key(key), 1, expires_in_sec=ttl)
+    for tag in tags or []:
+        cache.sadd(_tag_key(tag), key)
+
+    return value
+
+
+def _acquire_lock(key: str) -> bool:
+    cache = frappe.cache()
+    return bool(cache.set(cache.make_key(_lock_key(key)), 1, nx=True, ex=LOCK_TTL))
+
+
+def _release_lock(key: str) -> None:
+    cache = frappe.cache()
+    cache.delete(cache.make_key(_lock_key(key)))
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _value_key(key: str) -> str:
+    return f"{CACHE_PREFIX}:value:{key}"
+
+
+def _fresh_key(key: str) -> str:
+    return f"{CACHE_PREFIX}:fresh:{key}"
+
+
+def _lock_key(key: str) -> str:
+    return f"{CACHE_PREFIX}:lock:{key}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{CACHE_PREFIX}:tag:{tag}"
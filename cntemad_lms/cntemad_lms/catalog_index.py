@@ -0,0 +1,156 @@
+"""
+In-process inverted index for catalog autocomplete.
+
+Each worker keeps, per site, an index of published EC and Course titles
+and descriptions: accent-free lowercase tokens -> entry ids, plus the
+sorted vocabulary for prefix lookups (bisect). It is built on the first
+lookup after the worker starts and rebuilt whenever the Redis version
+key has moved, which EC and Course hooks bump after commit. A lookup
+costs one Redis GET and a few set operations, no SQL.
+
+Usage:
+    autocomplete("mathe fin", limit=8)
+    # [{"type": "ec", "name": "EC-0001", "title": "Mathématiques financières", ...}]
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+
+import frappe
+from frappe.utils import strip_html
+
+
+VERSION_KEY = "cntemad:catalog_index:version"
+TITLE_WEIGHT = 3
+
+# site -> {"version": str, "entries": [dict], "postings": {token: {id: weight}}, "vocabulary": [token]}
+_indexes = {}
+
+
+def autocomplete(query: str, limit: int = 8) -> list:
+    """
+    Entries matching every word of `query`, the last one as a prefix.
+
+    Returns:
+        list: [{type, name, title, year, course}] best matches first
+    """
+    words = tokenize(query)
+    if not words:
+        return []
+
+    index = _get_index()
+    scores = None
+
+    for position, word in enumerate(words):
+        is_last = position == len(words) - 1
+        matches = _prefix_matches(index, word) if is_last else index["postings"].get(word, {})
+
+        if scores is None:
+            scores = dict(matches)
+        else:
+            scores = {i: scores[i] + w for i, w in matches.items() if i in scores}
+
+        if not scores:
+            return []
+
+    entries = index["entries"]
+    ranked = sorted(scores, key=lambda i: (-scores[i], entries[i]["title"]))
+    return [entries[i] for i in ranked[:limit]]
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, accent-free words (French and Malagasy: « Fahaiza-manao » -> fahaiza, manao)."""
+    if not text:
+        return []
+
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def invalidate_catalog_index(doc=None, method=None) -> None:
+    """doc_events hook (EC, Course): workers rebuild their index on next lookup."""
+    frappe.db.after_commit.add(_bump_version)
+
+
+def _bump_version() -> None:
+    frappe.cache().incr(frappe.cache().make_key(VERSION_KEY))
+
+
+def _current_version() -> str:
+    version = frappe.cache().get(frappe.cache().make_key(VERSION_KEY))
+    return version.decode() if isinstance(version, bytes) else str(version or 0)
+
+
+def _get_index() -> dict:
+    site = frappe.local.site
+    version = _current_version()
+
+    index = _indexes.get(site)
+    if not index or index["version"] != version:
+        index = _build_index(version)
+        _indexes[site] = index
+
+    return index
+
+
+def _build_index(version: str) -> dict:
+    entries = []
+
+    for ec in frappe.get_all(
+        "CNTEMAD EC",
+        filters={"is_published": 1},
+        fields=["name", "title", "description", "year", "course"],
+    ):
+        entries.append(("ec", ec))
+
+    for course in frappe.get_all(
+        "CNTEMAD Course",
+        filters={"is_published": 1},
+        fields=["name", "title", "description", "year"],
+    ):
+        entries.append(("course", course))
+
+    postings = {}
+    public_entries = []
+
+    for entry_id, (entry_type, row) in enumerate(entries):
+        public_entries.append({
+            "type": entry_type,
+            "name": row.name,
+            "title": row.title or row.name,
+            "year": row.year,
+            "course": row.get("course"),
+        })
+
+        weights = {}
+        for token in tokenize(strip_html(row.description or "")):
+            weights[token] = 1
+        for token in tokenize(row.title):
+            weights[token] = TITLE_WEIGHT
+
+        for token, weight in weights.items():
+            postings.setdefault(token, {})[entry_id] = weight
+
+    return {
+        "version": version,
+        "entries": public_entries,
+        "postings": postings,
+        "vocabulary": sorted(postings),
+    }
+
+
+def _prefix_matches(index: dict, prefix: str) -> dict:
+    """{entry id: best weight} for every token starting with `prefix`."""
+    vocabulary = index["vocabulary"]
+    matches = {}
+
+    position = bisect_left(vocabulary, prefix)
+    while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+        for entry_id, weight in index["postings"][vocabulary[position]].items():
+            if weight > matches.get(entry_id, 0):
+                matches[entry_id] = weight
+        position += 1
+
+    return matches
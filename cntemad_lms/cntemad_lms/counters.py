@@ -0,0 +1,159 @@
+"""
+National KPI counters kept in Redis.
+
+The counters live in one Redis hash and are adjusted atomically
+(`HINCRBY`) by the Student and Enrollment hooks once the transaction
+commits. Revenue figures are not counters: they are read from the
+payment ledger balances (`CNTEMAD Revenue Balance`). Active students
+are tracked in a sorted set scored by last activity, so "active in the
+last 30 days" is a `ZCOUNT`.
+
+If the hash is missing (Redis flushed, first deploy) it is rebuilt from
+the database on the next read; `reconcile_kpi_counters` runs hourly to
+fix any drift.
+
+Usage:
+    increment_kpis({"total_students": 1})
+    mark_student_active("STU-0001")
+    forget_student("STU-0001")  # student deleted
+
+    get_kpi_counters()["total_students"]
+"""
+
+import time
+from functools import partial
+
+import frappe
+from frappe.utils import flt
+
+import redis
+
+
+KPI_KEY = "cntemad:kpi:counters"
+ACTIVE_KEY = "cntemad:kpi:active_students"
+ACTIVE_WINDOW = 30 * 24 * 3600  # 30 days
+
+COUNTERS = (
+    "total_students",
+    "total_enrollments",
+    "validated_enrollments",
+)
+
+
+def increment_kpis(deltas: dict) -> None:
+    """
+    Add `deltas` to the counters once the current transaction commits.
+
+    Args:
+        deltas: {counter: delta}, see COUNTERS
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+
+    frappe.db.after_commit.add(partial(_apply_deltas, deltas))
+
+
+def mark_student_active(student: str, timestamp: float = None) -> None:
+    """Record activity for a student (enrollment created or updated)."""
+    if not student:
+        return
+
+    frappe.db.after_commit.add(
+        partial(_mark_active, {student: timestamp or time.time()})
+    )
+
+
+def forget_student(student: str) -> None:
+    """Drop a deleted student from the active set once the transaction commits."""
+    if not student:
+        return
+
+    frappe.db.after_commit.add(partial(_forget, student))
+
+
+def get_kpi_counters() -> dict:
+    """
+    Return every counter plus `active_students`.
+
+    Returns:
+        dict: {total_students, ..., active_students}
+    """
+    cache = frappe.cache()
+    raw = _read_counters()
+    if not raw:
+        reconcile_kpi_counters()
+        raw = _read_counters()
+
+    values = {_decode(k): flt(_decode(v)) for k, v in raw.items()}
+
+    counters = {k: values.get(k, 0) for k in COUNTERS}
+    counters["active_students"] = cache.zcount(
+        cache.make_key(ACTIVE_KEY), time.time() - ACTIVE_WINDOW, "+inf"
+    )
+    return counters
+
+
+def reconcile_kpi_counters() -> None:
+    """Recompute every counter from the database (hourly job, or missing hash)."""
+    values = {
+        "total_students": frappe.db.count("CNTEMAD Student"),
+        "total_enrollments": frappe.db.count("CNTEMAD Enrollment"),
+        "validated_enrollments": frappe.db.count("CNTEMAD Enrollment", {"status": "Validated"}),
+    }
+
+    active = frappe.db.sql("""
+        SELECT student, UNIX_TIMESTAMP(MAX(modified))
+        FROM `tabCNTEMAD Enrollment`
+        WHERE modified >= NOW() - INTERVAL 30 DAY
+        GROUP BY student
+    """)
+
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.delete(cache.make_key(KPI_KEY), cache.make_key(ACTIVE_KEY))
+    pipe.hset(cache.make_key(KPI_KEY), mapping=values)
+    if active:
+        pipe.zadd(cache.make_key(ACTIVE_KEY), {student: flt(ts) for student, ts in active})
+    pipe.execute()
+
+
+def _apply_deltas(deltas: dict) -> None:
+    cache = frappe.cache()
+    key = cache.make_key(KPI_KEY)
+    if not cache.hlen(key):
+        # Rebuilt from the database on the next read, deltas included
+        return
+
+    pipe = cache.pipeline()
+    for field, delta in deltas.items():
+        if isinstance(delta, int):
+            pipe.hincrby(key, field, delta)
+        else:
+            pipe.hincrbyfloat(key, field, flt(delta))
+    pipe.execute()
+
+
+def _read_counters() -> dict:
+    # Plain HGETALL: RedisWrapper.hgetall prefixes the key again and unpickles values
+    cache = frappe.cache()
+    return redis.Redis.hgetall(cache, cache.make_key(KPI_KEY))
+
+
+def _mark_active(activity: dict) -> None:
+    cache = frappe.cache()
+    key = cache.make_key(ACTIVE_KEY)
+
+    pipe = cache.pipeline()
+    pipe.zadd(key, activity)
+    pipe.zremrangebyscore(key, "-inf", time.time() - ACTIVE_WINDOW)
+    pipe.execute()
+
+
+def _forget(student: str) -> None:
+    cache = frappe.cache()
+    cache.zrem(cache.make_key(ACTIVE_KEY), student)
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
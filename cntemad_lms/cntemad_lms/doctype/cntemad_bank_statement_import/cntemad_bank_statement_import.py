@@ -0,0 +1,421 @@
+"""CNTEMAD Bank Statement Import Doctype."""
+
+import codecs
+import csv
+import json
+import re
+import unicodedata
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt, now_datetime
+
+
+OPEN_STATUSES = ("Pending Transfer", "Pending Validation")
+# Écart toléré entre le montant du relevé et celui du paiement (Ariary)
+AMOUNT_TOLERANCE = 0.5
+# Correspondances validées par transaction
+COMPLETION_BATCH_SIZE = 500
+
+READ_CHUNK_SIZE = 64 * 1024
+# Lignes détaillées renvoyées au frontend (le document garde tout)
+SUMMARY_LIMIT = 200
+
+RUNNER = "cntemad_lms.cntemad_lms.doctype.cntemad_bank_statement_import.cntemad_bank_statement_import.run_bank_statement_import"
+
+# Colonne -> en-têtes possibles (normalisés: minuscules, sans accents),
+# exports BFV-SG et BNI en tête
+CSV_COLUMNS = {
+    "date": ("date operation", "date op", "date comptable", "date valeur", "date"),
+    "label": ("libelle operation", "libelle", "description", "motif", "details"),
+    "reference": ("reference", "ref", "ref operation", "numero operation"),
+    "credit": ("credit", "montant credit", "credit mga"),
+    "debit": ("debit", "montant debit", "debit mga"),
+    "amount": ("montant", "montant mga", "amount"),
+}
+
+STMTTRN_PATTERN = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+OFX_FIELD_PATTERN = re.compile(r"<(DTPOSTED|TRNAMT|FITID|NAME|MEMO|REFNUM|CHECKNUM)>([^<\r\n]*)", re.IGNORECASE)
+
+
+class CNTEMADBankStatementImport(Document):
+    """Relevé bancaire importé et rapproché des virements en attente."""
+
+    pass
+
+
+def start_bank_statement_import(file_url: str, bank: str) -> dict:
+    """
+    Enregistre un relevé et lance son rapprochement sur la file `payments`.
+
+    Usage:
+        start_bank_statement_import("/private/files/releve_bfv_janvier.csv", "bfv")
+    """
+    from cntemad_lms.cntemad_lms.api.payment import PAYMENTS_QUEUE, VALID_BANKS
+
+    if bank not in VALID_BANKS:
+        frappe.throw(_("Banque invalide. Utilisez: {}").format(", ".join(VALID_BANKS)), frappe.ValidationError)
+
+    file_name = frappe.db.get_value("File", {"file_url": file_url}, "name") if file_url else None
+    if not file_name:
+        frappe.throw(_("Relevé introuvable"), frappe.DoesNotExistError)
+
+    # Unmatched labels are returned to the caller: the file must be readable by them
+    if not frappe.has_permission("File", "read", doc=file_name):
+        frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
+
+    statement = frappe.get_doc({
+        "doctype": "CNTEMAD Bank Statement Import",
+        "bank": bank,
+        "statement_file": file_url,
+        "statement_format": "ofx" if file_url.lower().endswith((".ofx", ".qfx")) else "csv",
+        "status": "Queued",
+    }).insert(ignore_permissions=True)
+
+    frappe.enqueue(
+        RUNNER,
+        queue=PAYMENTS_QUEUE,
+        timeout=1800,
+        enqueue_after_commit=True,
+        statement_import=statement.name,
+    )
+
+    return get_bank_statement_import(statement.name)
+
+
+def run_bank_statement_import(statement_import: str) -> None:
+    """
+    Tâche de fond: rapproche un relevé des virements en attente.
+
+    Les virements Pending Transfer / Pending Validation sont chargés en une
+    requête dans un index en mémoire (référence -> paiements); le relevé est
+    lu en flux et chaque crédit y est cherché par sa référence puis son
+    montant. Les correspondances uniques sont validées à la fin, par lots
+    (comme une validation groupée: un UPDATE et un commit par lot); les
+    autres sont signalées pour revue.
+    """
+    statement = frappe.get_doc("CNTEMAD Bank Statement Import", statement_import)
+    statement.db_set({"status": "Running", "started_at": now_datetime()}, commit=True)
+
+    counts = {"line_count": 0, "credit_count": 0, "matched_count": 0, "ambiguous_count": 0, "unmatched_count": 0}
+    details = {"matched": [], "ambiguous": [], "unmatched": []}
+
+    try:
+        path = frappe.get_doc("File", {"file_url": statement.statement_file}).get_full_path()
+        matches = match_statement(iter_statement_lines(path, statement.statement_format), counts, details)
+        _complete_matches(statement, matches, counts, details)
+        status, error = "Completed", None
+    except Exception:
+        frappe.db.rollback()
+        status, error = "Failed", frappe.get_traceback(with_context=False)[-1000:]
+        frappe.log_error(title=f"CNTEMAD Bank Statement Import Failed: {statement.name}")
+
+    counts["ambiguous_count"] = len(details["ambiguous"])
+    statement.db_set({
+        **counts,
+        "status": status,
+        "error": error,
+        "details": json.dumps(details, default=str),
+        "completed_at": now_datetime(),
+    }, commit=True)
+
+    frappe.publish_realtime("cntemad_bank_statement_imported", get_bank_statement_import(statement.name), user=statement.owner)
+
+
+def get_bank_statement_import(statement_import: str) -> dict:
+    """État d'un import, tel que renvoyé au frontend."""
+    statement = frappe.db.get_value(
+        "CNTEMAD Bank Statement Import",
+        statement_import,
+        [
+            "name", "bank", "status", "line_count", "credit_count", "matched_count",
+            "ambiguous_count", "unmatched_count", "details", "error", "completed_at",
+        ],
+        as_dict=True
+    )
+    if not statement:
+        frappe.throw(_("Import introuvable"), frappe.DoesNotExistError)
+
+    details = json.loads(statement.pop("details") or "{}")
+    statement["ambiguous"] = details.get("ambiguous", [])[:SUMMARY_LIMIT]
+    statement["unmatched"] = details.get("unmatched", [])[:SUMMARY_LIMIT]
+    return statement
+
+
+# ==============================================================================
+# RAPPROCHEMENT
+# ==============================================================================
+
+
+def match_statement(lines, counts: dict, details: dict) -> list:
+    """
+    Rapproche les lignes du relevé des virements ouverts.
+
+    Returns:
+        list: (ligne, nom du paiement) des correspondances uniques
+    """
+    index, reference_lengths = _load_open_payments()
+    claimed = {}  # payment -> numéro de la ligne qui l'a rapproché
+    matches = []
+
+    for line in lines:
+        counts["line_count"] += 1
+        if line["amount"] <= 0:
+            continue
+        counts["credit_count"] += 1
+
+        references = _find_references(f"{line['label']} {line['reference']}", index, reference_lengths)
+        if not references:
+            counts["unmatched_count"] += 1
+            details["unmatched"].append(line)
+            continue
+
+        candidates = [p for ref in references for p in index[ref]]
+        same_amount = [p for p in candidates if abs(flt(p.amount) - line["amount"]) <= AMOUNT_TOLERANCE]
+        available = [p for p in same_amount if p.name not in claimed]
+
+        if len(available) == 1:
+            claimed[available[0].name] = line["line"]
+            matches.append((line, available[0].name))
+        elif len(available) > 1:
+            _flag(details, line, "Plusieurs virements correspondent", [p.name for p in available])
+        elif same_amount:
+            _flag(
+                details, line, f"Virement déjà rapproché par la ligne {claimed[same_amount[0].name]}",
+                [p.name for p in same_amount],
+            )
+        else:
+            expected = ", ".join(f"{int(p.amount or 0):,}" for p in candidates)
+            _flag(details, line, f"Montant différent (attendu: {expected})", [p.name for p in candidates])
+
+    return matches
+
+
+def _load_open_payments() -> tuple:
+    """Index référence compacte -> virements ouverts, en une requête."""
+    index = {}
+    for payment in frappe.get_all(
+        "CNTEMAD Payment",
+        filters={"status": ["in", OPEN_STATUSES], "bank_reference": ["is", "set"]},
+        fields=["name", "bank_reference", "amount", "status"],
+    ):
+        index.setdefault(_compact(payment.bank_reference), []).append(payment)
+
+    return index, sorted({len(ref) for ref in index}, reverse=True)
+
+
+def _find_references(text: str, index: dict, reference_lengths: list) -> set:
+    """
+    Références de virements présentes dans un libellé.
+
+    Les banques tronquent ou remplacent les séparateurs (`CNT INFO101 2345
+    240122`, `CNTINFO1012345240122`): la recherche se fait sur le libellé
+    compacté, à chaque occurrence de `CNT`, par longueur de référence connue.
+    """
+    compact = _compact(text)
+    found = set()
+
+    start = compact.find("CNT")
+    while start != -1:
+        for length in reference_lengths:
+            if compact[start:start + length] in index:
+                found.add(compact[start:start + length])
+                break
+        start = compact.find("CNT", start + 3)
+
+    return found
+
+
+def _complete_matches(statement, matches: list, counts: dict, details: dict) -> None:
+    from cntemad_lms.cntemad_lms.api.payment import BANKS, complete_bank_payments
+
+    bank_name = BANKS.get(statement.bank, {}).get("name", statement.bank)
+
+    for start in range(0, len(matches), COMPLETION_BATCH_SIZE):
+        batch = matches[start:start + COMPLETION_BATCH_SIZE]
+        completed, changed = [], []
+        try:
+            payments = {
+                p.name: p for p in frappe.db.sql("""
+                    SELECT name, student, ec, amount, provider, center, status
+                    FROM `tabCNTEMAD Payment`
+                    WHERE name IN %(names)s
+                    FOR UPDATE
+                """, {"names": [payment_id for _line, payment_id in batch]}, as_dict=True)
+            }
+
+            notes = {}
+            for line, payment_id in batch:
+                payment = payments.get(payment_id)
+                if not payment or payment.status not in OPEN_STATUSES:
+                    changed.append((line, payment_id, payment.status if payment else _("supprimé")))
+                    continue
+
+                completed.append((line, payment))
+                notes[payment_id] = _("Relevé {0} ({1}), ligne {2}: {3}").format(
+                    bank_name, statement.name, line["line"], line["label"]
+                )
+
+            complete_bank_payments([payment for _line, payment in completed], notes)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(title=f"CNTEMAD Bank Statement Import: {statement.name}")
+            for line, payment_id in batch:
+                _flag(details, line, "Erreur lors de la validation", [payment_id])
+            continue
+
+        for line, payment_id, status in changed:
+            _flag(details, line, f"Statut modifié entre-temps: {status}", [payment_id])
+        counts["matched_count"] += len(completed)
+        details["matched"].extend({**line, "payment": payment.name} for line, payment in completed)
+
+
+def _flag(details: dict, line: dict, reason: str, payments: list) -> None:
+    details["ambiguous"].append({**line, "reason": reason, "payments": payments})
+
+
+def _compact(value: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", (value or "").upper())
+
+
+# ==============================================================================
+# LECTURE DES RELEVÉS
+# ==============================================================================
+
+
+def iter_statement_lines(path: str, statement_format: str):
+    """
+    Lignes d'un relevé, lues en flux.
+
+    Yields:
+        dict: {line, date, label, reference, amount} (amount > 0 pour un crédit)
+    """
+    if statement_format == "ofx":
+        return _iter_ofx(path)
+    return _iter_csv(path)
+
+
+def _iter_csv(path: str):
+    with open(path, newline="", encoding=_detect_encoding(path), errors="replace") as f:
+        sample = f.read(READ_CHUNK_SIZE)
+        f.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+        except csv.Error:
+            delimiter = ";"
+
+        columns = None
+        for number, row in enumerate(csv.reader(f, delimiter=delimiter), start=1):
+            # Les exports commencent souvent par l'en-tête du compte
+            if columns is None:
+                columns = _match_header(row)
+                continue
+            if not any(cell.strip() for cell in row):
+                continue
+
+            if "credit" in columns:
+                amount = _parse_amount(_cell(row, columns, "credit")) - _parse_amount(_cell(row, columns, "debit"))
+            else:
+                amount = _parse_amount(_cell(row, columns, "amount"))
+
+            yield {
+                "line": number,
+                "date": _cell(row, columns, "date"),
+                "label": _cell(row, columns, "label"),
+                "reference": _cell(row, columns, "reference"),
+                "amount": amount,
+            }
+
+
+def _match_header(row: list):
+    """Position de chaque colonne connue, ou None si la ligne n'est pas l'en-tête."""
+    headers = [_normalize(cell) for cell in row]
+    columns = {}
+    for column, names in CSV_COLUMNS.items():
+        position = next((headers.index(name) for name in names if name in headers), None)
+        if position is not None:
+            columns[column] = position
+
+    if "label" in columns and ("credit" in columns or "amount" in columns):
+        return columns
+    return None
+
+
+def _cell(row: list, columns: dict, column: str) -> str:
+    position = columns.get(column)
+    return row[position].strip() if position is not None and position < len(row) else ""
+
+
+def _iter_ofx(path: str):
+    """Transactions <STMTTRN> d'un fichier OFX (SGML ou XML), lues par blocs."""
+    number = 0
+    buffer = ""
+    with open(path, encoding=_detect_encoding(path), errors="replace") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            buffer += chunk
+
+            end = 0
+            for match in STMTTRN_PATTERN.finditer(buffer):
+                number += 1
+                fields = {k.upper(): v.strip() for k, v in OFX_FIELD_PATTERN.findall(match.group(1))}
+                yield {
+                    "line": number,
+                    "date": fields.get("DTPOSTED", "")[:8],
+                    "label": " ".join(filter(None, (fields.get("NAME"), fields.get("MEMO")))),
+                    "reference": fields.get("REFNUM") or fields.get("CHECKNUM") or fields.get("FITID") or "",
+                    "amount": _parse_amount(fields.get("TRNAMT")),
+                }
+                end = match.end()
+
+            buffer = buffer[end:]
+            if not chunk:
+                return
+
+
+def _parse_amount(value: str) -> float:
+    """`75 000,00`, `75.000,00`, `75,000.00`, `-75000` -> float."""
+    value = re.sub(r"[^\d,.\-]", "", value or "")
+    if not value.strip("-,."):
+        return 0.0
+
+    if "," in value and "." in value:
+        decimal = "," if value.rfind(",") > value.rfind(".") else "."
+    else:
+        separator = "," if "," in value else "."
+        parts = value.split(separator)
+        decimal = separator if len(parts) == 2 and len(parts[1]) in (1, 2) else None
+
+    thousands = {",", "."} - {decimal}
+    for separator in thousands:
+        value = value.replace(separator, "")
+    if decimal:
+        value = value.replace(decimal, ".")
+
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _normalize(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", value.lower()).split())
+
+
+def _detect_encoding(path: str) -> str:
+    """
+    UTF-8 si le début du fichier le permet, sinon Windows-1252 (exports bancaires).
+
+    Seul le début est lu: les lecteurs ouvrent le fichier avec
+    errors="replace", un octet invalide plus loin ne coûte qu'un caractère.
+    """
+    with open(path, "rb") as f:
+        head = f.read(READ_CHUNK_SIZE)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "cp1252"
+    return "utf-8-sig"
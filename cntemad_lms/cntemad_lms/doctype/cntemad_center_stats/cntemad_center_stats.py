@@ -0,0 +1,116 @@
+"""CNTEMAD Center Stats Doctype."""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+from cntemad_lms.cntemad_lms.cache import invalidate_cache_tags
+
+
+STAT_FIELDS = (
+    "student_count",
+    "enrollment_count",
+    "validated_count",
+)
+
+
+class CNTEMADCenterStats(Document):
+    """Agrégats maintenus par centre (étudiants, inscriptions); revenus: CNTEMAD Revenue Balance."""
+
+    pass
+
+
+def update_center_stats(center: str, **deltas) -> None:
+    """
+    Applique des incréments atomiques aux compteurs d'un centre.
+
+    Usage:
+        update_center_stats("CTR-TANA", enrollment_count=1, validated_count=1)
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not center or not deltas:
+        return
+
+    _upsert(center, deltas, increment=True)
+
+
+def rebuild_center_stats() -> None:
+    """Recalcule entièrement les agrégats de tous les centres (job nocturne)."""
+    _recompute(frappe.get_all("CNTEMAD Center", pluck="name"))
+    frappe.db.commit()
+
+
+def refresh_center_stats(*centers) -> None:
+    """
+    Recalcule les agrégats des centres donnés (ex: changement de centre d'un étudiant).
+
+    Écrit dans la transaction de l'appelant, sans commit: appelé depuis
+    les doc_events, les agrégats sont commités avec le document.
+    """
+    centers = [c for c in centers if c]
+    if centers:
+        _recompute(centers)
+
+
+def _recompute(centers: list) -> None:
+    """Recalcule et écrit les valeurs absolues pour une liste de centres."""
+    if not centers:
+        return
+
+    students = dict(frappe.db.sql("""
+        SELECT center, COUNT(*)
+        FROM `tabCNTEMAD Student`
+        WHERE center IN %(centers)s
+        GROUP BY center
+    """, {"centers": centers}))
+
+    enrollments = {
+        row.center: row
+        for row in frappe.db.sql("""
+            SELECT
+                e.center,
+                COUNT(*) as enrollment_count,
+                SUM(CASE WHEN e.status = 'Validated' THEN 1 ELSE 0 END) as validated_count
+            FROM `tabCNTEMAD Enrollment` e
+            WHERE e.center IN %(centers)s
+            GROUP BY e.center
+        """, {"centers": centers}, as_dict=True)
+    }
+
+    rebuilt_at = now_datetime()
+    for center in centers:
+        e = enrollments.get(center, {})
+        _upsert(center, {
+            "student_count": students.get(center, 0),
+            "enrollment_count": e.get("enrollment_count", 0),
+            "validated_count": e.get("validated_count") or 0,
+        }, increment=False, rebuilt_at=rebuilt_at)
+
+    invalidate_cache_tags("payment", "enrollment", "student")
+
+
+def _upsert(center: str, values: dict, increment: bool, rebuilt_at=None) -> None:
+    """Insère ou met à jour la ligne du centre en une seule requête."""
+    fields = [f for f in STAT_FIELDS if f in values]
+    if not fields:
+        return
+
+    if increment:
+        updates = ", ".join(f"`{f}` = `{f}` + VALUES(`{f}`)" for f in fields)
+    else:
+        updates = ", ".join(f"`{f}` = VALUES(`{f}`)" for f in fields)
+        updates += ", last_rebuilt_at = VALUES(last_rebuilt_at)"
+
+    now = now_datetime()
+    params = {f: values[f] for f in fields}
+    params.update({"center": center, "now": now, "rebuilt_at": rebuilt_at})
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabCNTEMAD Center Stats`
+            (name, center, {", ".join(f"`{f}`" for f in fields)}, last_rebuilt_at,
+             creation, modified, owner, modified_by, docstatus)
+        VALUES
+            (%(center)s, %(center)s, {", ".join(f"%({f})s" for f in fields)}, %(rebuilt_at)s,
+             %(now)s, %(now)s, 'Administrator', 'Administrator', 0)
+        ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+    """, params)
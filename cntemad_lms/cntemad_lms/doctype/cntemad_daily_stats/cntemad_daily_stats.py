@@ -0,0 +1,203 @@
+"""CNTEMAD Daily Stats Doctype."""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, add_months, date_diff, getdate, now_datetime
+
+
+MEASURES = ("enrollments", "validations", "new_students", "payments", "revenue")
+
+
+class CNTEMADDailyStats(Document):
+    """Ligne de faits journalière clé (date, centre, EC, provider)."""
+
+    pass
+
+
+def on_doctype_update():
+    """Index pour les lectures de séries temporelles."""
+    frappe.db.add_index("CNTEMAD Daily Stats", ["stat_date", "center"])
+    frappe.db.add_index("CNTEMAD Daily Stats", ["ec", "stat_date"])
+
+
+def record_daily_stats(stat_date, center: str = None, ec: str = None, provider: str = None, **deltas) -> None:
+    """
+    Ajoute des incréments à la ligne (date, centre, EC, provider).
+
+    Usage:
+        record_daily_stats(getdate(), "CTR-TANA", "EC-0001", "mvola", payments=1, revenue=75000)
+    """
+    measures = [m for m in MEASURES if deltas.get(m)]
+    if not stat_date or not measures:
+        return
+
+    stat_date = getdate(stat_date)
+    center, ec, provider = center or "", ec or "", provider or ""
+
+    now = now_datetime()
+    params = {m: deltas[m] for m in measures}
+    params.update({
+        "name": make_key(stat_date, center, ec, provider),
+        "stat_date": stat_date,
+        "center": center,
+        "ec": ec,
+        "provider": provider,
+        "now": now,
+    })
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabCNTEMAD Daily Stats`
+            (name, stat_date, center, ec, provider, {", ".join(measures)},
+             creation, modified, owner, modified_by, docstatus)
+        VALUES
+            (%(name)s, %(stat_date)s, %(center)s, %(ec)s, %(provider)s,
+             {", ".join(f"%({m})s" for m in measures)},
+             %(now)s, %(now)s, 'Administrator', 'Administrator', 0)
+        ON DUPLICATE KEY UPDATE
+            {", ".join(f"{m} = {m} + VALUES({m})" for m in measures)},
+            modified = VALUES(modified)
+    """, params)
+
+
+def make_key(stat_date, center: str, ec: str, provider: str) -> str:
+    """Nom déterministe d'une ligne, identique à celui du backfill SQL."""
+    return f"{stat_date}|{center}|{ec}|{provider}"
+
+
+def get_daily_series(from_date, to_date, center: str = None, ec: str = None) -> list:
+    """
+    Série journalière continue (jours sans activité à zéro) entre deux dates incluses.
+
+    Returns:
+        list: [{date, enrollments, validations, new_students, payments, revenue}]
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    rows = _aggregate("stat_date", from_date, to_date, center, ec)
+
+    return [
+        _with_defaults({"date": day}, rows.get(day))
+        for day in (add_days(from_date, i) for i in range(date_diff(to_date, from_date) + 1))
+    ]
+
+
+def get_monthly_series(months: int = 6, center: str = None, ec: str = None) -> list:
+    """
+    Série mensuelle continue sur les `months` derniers mois (mois courant inclus).
+
+    Returns:
+        list: [{month_start, enrollments, validations, new_students, payments, revenue}]
+    """
+    first_of_month = getdate().replace(day=1)
+    month_starts = [add_months(first_of_month, -i) for i in range(months - 1, -1, -1)]
+
+    rows = _aggregate(
+        "DATE_FORMAT(stat_date, '%%Y-%%m-01')", month_starts[0], getdate(), center, ec
+    )
+
+    return [
+        _with_defaults({"month_start": month_start}, rows.get(month_start))
+        for month_start in month_starts
+    ]
+
+
+def _aggregate(bucket: str, from_date, to_date, center: str = None, ec: str = None) -> dict:
+    """Un seul scan indexé groupé par jour ou par mois."""
+    conditions = ["stat_date >= %(from_date)s", "stat_date <= %(to_date)s"]
+    values = {"from_date": from_date, "to_date": to_date}
+
+    if center:
+        conditions.append("center = %(center)s")
+        values["center"] = center
+
+    if ec:
+        conditions.append("ec = %(ec)s")
+        values["ec"] = ec
+
+    rows = frappe.db.sql(f"""
+        SELECT
+            {bucket} as bucket,
+            {", ".join(f"SUM({m}) as {m}" for m in MEASURES)}
+        FROM `tabCNTEMAD Daily Stats`
+        WHERE {" AND ".join(conditions)}
+        GROUP BY bucket
+    """, values, as_dict=True)
+
+    return {getdate(row.bucket): row for row in rows}
+
+
+def _with_defaults(point: dict, row) -> dict:
+    """Complète un point de série avec des zéros."""
+    for m in MEASURES:
+        point[m] = (row or {}).get(m) or 0
+    return point
+
+
+def rebuild_daily_stats(from_date=None, to_date=None) -> None:
+    """
+    Recalcule la table de faits depuis les tables sources (backfill).
+
+    Usage:
+        bench --site <site> cntemad-backfill-daily-stats --from-date 2024-09-01
+    """
+    from_date = getdate(from_date) if from_date else getdate("2000-01-01")
+    to_date = getdate(to_date) if to_date else getdate()
+    values = {"from_date": from_date, "to_date": to_date, "now": now_datetime()}
+
+    frappe.db.sql("""
+        DELETE FROM `tabCNTEMAD Daily Stats`
+        WHERE stat_date >= %(from_date)s AND stat_date <= %(to_date)s
+    """, values)
+
+    sources = {
+        "new_students": """
+            SELECT DATE(s.creation) as stat_date, s.center, '' as ec, '' as provider,
+                COUNT(*) as measure
+            FROM `tabCNTEMAD Student` s
+            WHERE DATE(s.creation) BETWEEN %(from_date)s AND %(to_date)s
+            GROUP BY DATE(s.creation), s.center
+        """,
+        "enrollments": """
+            SELECT DATE(e.creation) as stat_date, e.center, e.ec, '' as provider,
+                COUNT(*) as measure
+            FROM `tabCNTEMAD Enrollment` e
+            WHERE DATE(e.creation) BETWEEN %(from_date)s AND %(to_date)s
+            GROUP BY DATE(e.creation), e.center, e.ec
+        """,
+        "validations": """
+            SELECT e.validation_date as stat_date, e.center, e.ec, '' as provider,
+                COUNT(*) as measure
+            FROM `tabCNTEMAD Enrollment` e
+            WHERE e.status = 'Validated'
+            AND e.validation_date BETWEEN %(from_date)s AND %(to_date)s
+            GROUP BY e.validation_date, e.center, e.ec
+        """,
+        "payments": """
+            SELECT DATE(COALESCE(p.completed_at, p.creation)) as stat_date, p.center, p.ec,
+                p.provider, COUNT(*) as measure, SUM(p.amount) as revenue
+            FROM `tabCNTEMAD Payment` p
+            WHERE p.status = 'Completed'
+            AND DATE(COALESCE(p.completed_at, p.creation)) BETWEEN %(from_date)s AND %(to_date)s
+            GROUP BY DATE(COALESCE(p.completed_at, p.creation)), p.center, p.ec, p.provider
+        """,
+    }
+
+    for measure, source in sources.items():
+        extra_column = ", revenue" if measure == "payments" else ""
+        extra_value = ", src.revenue" if measure == "payments" else ""
+        extra_update = ", revenue = VALUES(revenue)" if measure == "payments" else ""
+
+        frappe.db.sql(f"""
+            INSERT INTO `tabCNTEMAD Daily Stats`
+                (name, stat_date, center, ec, provider, {measure}{extra_column},
+                 creation, modified, owner, modified_by, docstatus)
+            SELECT
+                CONCAT_WS('|', src.stat_date, COALESCE(src.center, ''),
+                    COALESCE(src.ec, ''), COALESCE(src.provider, '')),
+                src.stat_date, COALESCE(src.center, ''), COALESCE(src.ec, ''),
+                COALESCE(src.provider, ''), src.measure{extra_value},
+                %(now)s, %(now)s, 'Administrator', 'Administrator', 0
+            FROM ({source}) src
+            ON DUPLICATE KEY UPDATE {measure} = VALUES({measure}){extra_update}
+        """, values)
+
+    frappe.db.commit()
@@ -21,3 +21,28 @@ class CNTEMADEC(Document):
             course = frappe.get_doc("CNTEMAD Course", self.course)
             course.update_ec_count()
             course.save()
+
+
+FULLTEXT_INDEX = "ec_search_fulltext"
+
+
+def on_doctype_update():
+    """Index FULLTEXT (titre, description) pour la recherche du catalogue."""
+    add_fulltext_index()
+
+
+def add_fulltext_index():
+    """
+    Crée l'index FULLTEXT s'il n'existe pas.
+
+    La collation utf8mb4_unicode_ci des colonnes rend la recherche insensible
+    à la casse et aux accents (« economie » trouve « Économie »).
+    """
+    if frappe.db.sql(
+        "SHOW INDEX FROM `tabCNTEMAD EC` WHERE Key_name = %s", FULLTEXT_INDEX
+    ):
+        return
+
+    frappe.db.sql_ddl(
+        f"ALTER TABLE `tabCNTEMAD EC` ADD FULLTEXT INDEX `{FULLTEXT_INDEX}` (title, description)"
+    )
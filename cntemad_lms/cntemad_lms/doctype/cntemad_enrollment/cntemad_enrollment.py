@@ -1,9 +1,20 @@
 """CNTEMAD Enrollment Doctype."""
 
+import frappe
 from frappe.model.document import Document
 
 
 class CNTEMADEnrollment(Document):
     """Représente l'inscription d'un étudiant à un cours/EC."""
 
-    pass
+    def validate(self):
+        if self.is_new() or self.has_value_changed("student"):
+            self.center = frappe.db.get_value("CNTEMAD Student", self.student, "center")
+
+
+def on_doctype_update():
+    """Index composites pour les accès étudiant/EC, EC/statut et par date de modification."""
+    frappe.db.add_index("CNTEMAD Enrollment", ["student", "ec"])
+    frappe.db.add_index("CNTEMAD Enrollment", ["ec", "status"])
+    frappe.db.add_index("CNTEMAD Enrollment", ["center", "status"])
+    frappe.db.add_index("CNTEMAD Enrollment", ["modified"])
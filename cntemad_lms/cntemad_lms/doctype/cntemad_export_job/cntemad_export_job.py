@@ -0,0 +1,293 @@
+"""CNTEMAD Export Job Doctype."""
+
+import csv
+import hashlib
+import json
+import os
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import add_days, add_to_date, getdate, now_datetime
+
+from cntemad_lms.cntemad_lms.identity import get_current_admin_center, is_national_admin
+
+
+EXPORT_FORMATS = ("csv", "xlsx", "parquet")
+ARTIFACT_RETENTION_DAYS = 7
+PARQUET_BATCH_SIZE = 10000
+EXPORT_JOB_TIMEOUT = 3600  # seconds, RQ timeout of run_export_job
+
+# Rapport -> fonction qui yield l'en-tête puis les lignes
+EXPORT_REPORTS = {
+    "national": "cntemad_lms.cntemad_lms.api.national.iter_national_report",
+    "center_students": "cntemad_lms.cntemad_lms.api.center.iter_center_students",
+}
+
+
+class CNTEMADExportJob(Document):
+    """Export exécuté en tâche de fond, fichier conservé dans les fichiers privés."""
+
+    pass
+
+
+def start_export(report: str, export_format: str = "csv", filters: dict = None) -> dict:
+    """
+    Lance un export en arrière-plan, ou réutilise celui du jour s'il existe.
+
+    Deux demandes identiques (rapport, format, filtres, date) d'un même
+    utilisateur partagent le même fichier. Un export Queued/Running sans
+    nouvelle depuis EXPORT_JOB_TIMEOUT (worker arrêté) est passé en Failed
+    et relancé.
+
+    Usage:
+        start_export("national", "xlsx", {"report_type": "payments", "date_from": "2025-01-01"})
+    """
+    if report not in EXPORT_REPORTS:
+        frappe.throw(_("Rapport inconnu: {0}").format(report))
+
+    if export_format not in EXPORT_FORMATS:
+        frappe.throw(_("Format d'export non supporté: {0}").format(export_format))
+
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    check_report_permission(report, filters)
+    export_date = getdate()
+    cache_key = make_cache_key(report, export_format, filters, export_date)
+
+    existing = frappe.get_all(
+        "CNTEMAD Export Job",
+        filters={
+            "cache_key": cache_key,
+            "owner": frappe.session.user,
+            "status": ["in", ["Queued", "Running", "Completed"]],
+        },
+        fields=["name", "status", "file_url", "modified"],
+        order_by="creation desc",
+        limit=1
+    )
+    if existing:
+        job = existing[0]
+        if job.status == "Completed":
+            if _artifact_exists(job.file_url):
+                return get_export_job(job.name)
+        elif job.modified >= add_to_date(now_datetime(), seconds=-EXPORT_JOB_TIMEOUT):
+            return get_export_job(job.name)
+        else:
+            frappe.db.set_value("CNTEMAD Export Job", job.name, {
+                "status": "Failed",
+                "error": "Interrompu: aucune nouvelle du worker",
+                "completed_at": now_datetime(),
+            })
+
+    job = frappe.get_doc({
+        "doctype": "CNTEMAD Export Job",
+        "report": report,
+        "export_format": export_format,
+        "filters": json.dumps(filters, sort_keys=True),
+        "cache_key": cache_key,
+        "export_date": export_date,
+        "status": "Queued",
+    }).insert(ignore_permissions=True)
+
+    frappe.enqueue(
+        "cntemad_lms.cntemad_lms.doctype.cntemad_export_job.cntemad_export_job.run_export_job",
+        queue="long",
+        timeout=EXPORT_JOB_TIMEOUT,
+        enqueue_after_commit=True,
+        export_job=job.name,
+    )
+
+    return get_export_job(job.name)
+
+
+def run_export_job(export_job: str) -> None:
+    """Tâche de fond: écrit le fichier puis notifie le demandeur."""
+    job = frappe.get_doc("CNTEMAD Export Job", export_job)
+    job.db_set({"status": "Running", "started_at": now_datetime()}, commit=True)
+
+    filename = f"cntemad_{job.report}_{job.name}.{job.export_format}"
+    path = frappe.get_site_path("private", "files", filename)
+
+    try:
+        rows = frappe.get_attr(EXPORT_REPORTS[job.report])(**json.loads(job.filters or "{}"))
+        row_count = WRITERS[job.export_format](rows, path)
+    except Exception:
+        frappe.db.rollback()
+        if os.path.exists(path):
+            os.remove(path)
+
+        frappe.log_error(title=f"CNTEMAD Export Failed: {job.name}")
+        job.db_set({
+            "status": "Failed",
+            "error": frappe.get_traceback(with_context=False)[-1000:],
+            "completed_at": now_datetime(),
+        }, commit=True)
+    else:
+        job.db_set({
+            "status": "Completed",
+            "file_url": f"/private/files/{filename}",
+            "row_count": max(row_count - 1, 0),
+            "completed_at": now_datetime(),
+        }, commit=True)
+
+    frappe.publish_realtime("cntemad_export_ready", get_export_job(job.name), user=job.owner)
+
+
+def get_export_job(export_job: str) -> dict:
+    """État d'un export, tel que renvoyé au frontend."""
+    job = frappe.db.get_value(
+        "CNTEMAD Export Job",
+        export_job,
+        ["name", "report", "export_format", "status", "row_count", "error", "completed_at"],
+        as_dict=True
+    )
+    if not job:
+        frappe.throw(_("Export introuvable"), frappe.DoesNotExistError)
+
+    job["download_url"] = (
+        f"/api/method/cntemad_lms.api.export.download_export?job_id={job.name}"
+        if job.status == "Completed" else None
+    )
+    return job
+
+
+def check_report_permission(report: str, filters: dict) -> None:
+    """
+    Le rapport national est réservé aux administrateurs nationaux; un
+    administrateur de centre n'exporte que les étudiants de son centre
+    (`center_id` imposé si absent).
+    """
+    if is_national_admin():
+        return
+
+    if report == "center_students":
+        center = get_current_admin_center()
+        if center:
+            filters.setdefault("center_id", center["name"])
+            if filters["center_id"] == center["name"]:
+                return
+
+    frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
+
+
+def check_export_permission(export_job: str) -> None:
+    """Seul le demandeur (ou un System Manager) voit et télécharge un export."""
+    owner = frappe.db.get_value("CNTEMAD Export Job", export_job, "owner")
+    if not owner:
+        frappe.throw(_("Export introuvable"), frappe.DoesNotExistError)
+
+    if owner != frappe.session.user and "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Accès non autorisé"), frappe.PermissionError)
+
+
+def get_artifact_path(export_job: str) -> str:
+    """Chemin disque du fichier d'un export terminé."""
+    file_url = frappe.db.get_value(
+        "CNTEMAD Export Job", {"name": export_job, "status": "Completed"}, "file_url"
+    )
+    if not _artifact_exists(file_url):
+        frappe.throw(_("Fichier d'export indisponible"), frappe.DoesNotExistError)
+
+    return _artifact_path(file_url)
+
+
+def make_cache_key(report: str, export_format: str, filters: dict, export_date) -> str:
+    """Clé stable pour (rapport, format, filtres, date)."""
+    payload = json.dumps([report, export_format, filters, str(export_date)], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def purge_old_exports() -> None:
+    """Supprime les exports et fichiers de plus de ARTIFACT_RETENTION_DAYS jours (job quotidien)."""
+    old_jobs = frappe.get_all(
+        "CNTEMAD Export Job",
+        filters={"creation": ["<", add_days(getdate(), -ARTIFACT_RETENTION_DAYS)]},
+        fields=["name", "file_url"]
+    )
+
+    for job in old_jobs:
+        if _artifact_exists(job.file_url):
+            os.remove(_artifact_path(job.file_url))
+        frappe.delete_doc("CNTEMAD Export Job", job.name, ignore_permissions=True, force=True)
+
+    frappe.db.commit()
+
+
+def _artifact_path(file_url: str) -> str:
+    return frappe.get_site_path("private", "files", os.path.basename(file_url))
+
+
+def _artifact_exists(file_url: str) -> bool:
+    return bool(file_url) and os.path.exists(_artifact_path(file_url))
+
+
+def _write_csv(rows, path: str) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(rows, path: str) -> int:
+    """Classeur en mode write-only: les lignes sont écrites au fil de l'eau."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+
+    count = 0
+    for row in rows:
+        sheet.append(list(row))
+        count += 1
+
+    workbook.save(path)
+    return count
+
+
+def _write_parquet(rows, path: str) -> int:
+    """Parquet écrit par lots de PARQUET_BATCH_SIZE lignes (colonnes texte)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        frappe.throw(_("L'export Parquet nécessite pyarrow (pip install cntemad_lms[parquet])"))
+
+    rows = iter(rows)
+    header = [str(column) for column in next(rows, [])]
+    schema = pa.schema([(column, pa.string()) for column in header])
+
+    def to_table(batch):
+        width = len(header)
+        padded = [(list(row) + [None] * width)[:width] for row in batch]
+        return pa.Table.from_arrays(
+            [
+                pa.array([None if row[i] is None else str(row[i]) for row in padded], pa.string())
+                for i in range(width)
+            ],
+            schema=schema
+        )
+
+    count = 1
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                writer.write_table(to_table(batch))
+                batch = []
+
+        if batch:
+            writer.write_table(to_table(batch))
+
+    return count
+
+
+WRITERS = {
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "parquet": _write_parquet,
+}
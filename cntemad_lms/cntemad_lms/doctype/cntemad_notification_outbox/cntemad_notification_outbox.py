@@ -0,0 +1,307 @@
+"""CNTEMAD Notification Outbox Doctype."""
+
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+
+NOTIFICATION_BATCH_SIZE = 100
+MAX_ATTEMPTS = 4
+RETRY_DELAYS = (1, 5, 30)  # minutes before attempts 2, 3, 4
+# Emails per recipient and per hour; the rest waits for the next hour
+RECIPIENT_HOURLY_LIMIT = 20
+THROTTLE_KEY = "cntemad:notifications:sent:{recipient}:{hour}"
+
+SENDER = "cntemad_lms.cntemad_lms.doctype.cntemad_notification_outbox.cntemad_notification_outbox.send_queued_notifications"
+
+# event_type -> (subject, template); the subject is formatted with the template context
+NOTIFICATIONS = {
+    "payment_confirmed": ("Paiement confirmé - {ec_title}", "payment_confirmed.html"),
+    "bank_payment_submitted": ("Virement à valider - {student_name}", "bank_payment_submitted.html"),
+    "bank_payment_validated": ("Paiement validé - {ec_title}", "bank_payment_validated.html"),
+    "bank_payment_rejected": ("Paiement rejeté - {ec_title}", "bank_payment_rejected.html"),
+    "certificate_issued": ("Félicitations ! Certificat {year} validé", "certificate_issued.html"),
+}
+TEMPLATE_PATH = "cntemad_lms/templates/emails/{template}"
+
+
+class CNTEMADNotificationOutbox(Document):
+    """Notification transactionnelle en attente d'envoi par le worker."""
+
+    pass
+
+
+def on_doctype_update():
+    """Index pour la lecture des notifications à envoyer."""
+    frappe.db.add_index("CNTEMAD Notification Outbox", ["status", "next_attempt_at"])
+
+
+def queue_notification(event_type: str, reference_doctype: str, reference_name: str, **data) -> None:
+    """
+    Met une notification en file, dans la transaction courante.
+
+    Le rendu et l'envoi sont faits par `send_queued_notifications` une fois
+    la transaction commitée: une notification n'existe que si l'opération
+    qui la déclenche a abouti.
+
+    Usage:
+        queue_notification("payment_confirmed", "CNTEMAD Payment", payment.name)
+        queue_notification("bank_payment_rejected", "CNTEMAD Payment", payment.name, reason=note)
+    """
+    if event_type not in NOTIFICATIONS:
+        frappe.throw(f"Unknown notification type: {event_type}")
+
+    frappe.get_doc({
+        "doctype": "CNTEMAD Notification Outbox",
+        "event_type": event_type,
+        "reference_doctype": reference_doctype,
+        "reference_name": reference_name,
+        "data": json.dumps(data, default=str) if data else None,
+        "status": "Queued",
+    }).insert(ignore_permissions=True)
+
+    _enqueue_sender()
+
+
+def queue_notifications(event_type: str, reference_doctype: str, reference_names: list, **data) -> None:
+    """
+    Variante groupée de `queue_notification`: une seule insertion pour tous les documents.
+
+    Usage:
+        queue_notifications("bank_payment_validated", "CNTEMAD Payment", ["PAY-0001", "PAY-0002"])
+    """
+    if event_type not in NOTIFICATIONS:
+        frappe.throw(f"Unknown notification type: {event_type}")
+
+    if not reference_names:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user
+    payload = json.dumps(data, default=str) if data else None
+
+    frappe.db.bulk_insert(
+        "CNTEMAD Notification Outbox",
+        [
+            "name", "creation", "modified", "owner", "modified_by", "docstatus",
+            "event_type", "reference_doctype", "reference_name", "data", "status", "attempts",
+        ],
+        [
+            (frappe.generate_hash(length=10), now, now, user, user, 0,
+             event_type, reference_doctype, name, payload, "Queued", 0)
+            for name in reference_names
+        ],
+    )
+
+    _enqueue_sender()
+
+
+def _enqueue_sender() -> None:
+    frappe.enqueue(
+        SENDER,
+        queue="short",
+        job_id="cntemad_send_notifications",
+        deduplicate=True,
+        enqueue_after_commit=True,
+    )
+
+
+def send_queued_notifications() -> int:
+    """
+    Tâche de fond (et chaque minute): rend et envoie les notifications en file.
+
+    Les notifications sont traitées par lots; les documents référencés
+    (paiements, étudiants, EC, centres) sont chargés une fois par lot.
+    Au-delà de RECIPIENT_HOURLY_LIMIT messages par destinataire et par
+    heure, l'envoi est reporté; une erreur est retentée MAX_ATTEMPTS fois.
+    Chaque notification est verrouillée puis commitée seule: la tâche
+    planifiée et la tâche en file peuvent tourner en même temps sans
+    envoyer deux fois.
+
+    Returns:
+        int: Nombre de notifications envoyées
+    """
+    sent = 0
+
+    while True:
+        rows = frappe.db.sql("""
+            SELECT name, event_type, reference_doctype, reference_name, data, attempts
+            FROM `tabCNTEMAD Notification Outbox`
+            WHERE status = 'Queued'
+                AND (next_attempt_at IS NULL OR next_attempt_at <= %(now)s)
+            ORDER BY creation
+            LIMIT %(limit)s
+        """, {"now": now_datetime(), "limit": NOTIFICATION_BATCH_SIZE}, as_dict=True)
+
+        if not rows:
+            return sent
+
+        references = _load_references(rows)
+        for row in rows:
+            # Lock the notification: a concurrent sender skips it once handled
+            if not _claim(row):
+                frappe.db.rollback()
+                continue
+
+            sent += _send(row, references)
+            frappe.db.commit()
+
+        if len(rows) < NOTIFICATION_BATCH_SIZE:
+            return sent
+
+
+def _claim(row) -> bool:
+    current = frappe.db.get_value(
+        "CNTEMAD Notification Outbox", row.name,
+        ["status", "next_attempt_at", "attempts"],
+        as_dict=True, for_update=True
+    )
+    if not current or current.status != "Queued":
+        return False
+    if current.next_attempt_at and get_datetime(current.next_attempt_at) > now_datetime():
+        return False
+
+    row.attempts = current.attempts
+    return True
+
+
+def _send(row, references: dict) -> int:
+    try:
+        recipient, context = CONTEXT_BUILDERS[row.event_type](row, json.loads(row.data or "{}"), references)
+        if not recipient:
+            _update(row.name, status="Skipped", error="Aucun destinataire")
+            return 0
+
+        if not _take_quota(recipient):
+            next_hour = get_datetime(now_datetime().strftime("%Y-%m-%d %H:00:00"))
+            _update(row.name, recipient=recipient, next_attempt_at=add_to_date(next_hour, hours=1))
+            return 0
+
+        subject, template = NOTIFICATIONS[row.event_type]
+        frappe.sendmail(
+            recipients=[recipient],
+            subject=subject.format(**context),
+            message=frappe.get_template(TEMPLATE_PATH.format(template=template)).render(context),
+            reference_doctype=row.reference_doctype,
+            reference_name=row.reference_name,
+        )
+        _update(row.name, status="Sent", recipient=recipient, sent_at=now_datetime(), error=None)
+        return 1
+
+    except Exception:
+        attempts = (row.attempts or 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            _update(row.name, status="Failed", attempts=attempts, error=frappe.get_traceback())
+            frappe.log_error(frappe.get_traceback(), f"Notification {row.name}")
+        else:
+            _update(
+                row.name,
+                attempts=attempts,
+                next_attempt_at=add_to_date(now_datetime(), minutes=RETRY_DELAYS[attempts - 1]),
+                error=frappe.get_traceback(),
+            )
+        return 0
+
+
+def _update(name: str, **values) -> None:
+    frappe.db.set_value("CNTEMAD Notification Outbox", name, values, update_modified=False)
+
+
+def _take_quota(recipient: str) -> bool:
+    cache = frappe.cache()
+    key = cache.make_key(THROTTLE_KEY.format(
+        recipient=recipient, hour=now_datetime().strftime("%Y%m%d%H")
+    ))
+
+    count = cache.incr(key)
+    if count == 1:
+        cache.expire(key, 3600)
+    return count <= RECIPIENT_HOURLY_LIMIT
+
+
+# ==============================================================================
+# CONTEXTES
+# ==============================================================================
+
+
+def _load_references(rows: list) -> dict:
+    """Paiements, étudiants, EC et centres utilisés par le lot, en quelques requêtes."""
+    payment_ids = {r.reference_name for r in rows if r.reference_doctype == "CNTEMAD Payment"}
+    payments = {
+        p.name: p for p in frappe.get_all(
+            "CNTEMAD Payment",
+            filters={"name": ["in", list(payment_ids)]},
+            fields=["name", "student", "ec", "amount", "bank_reference", "proof_type", "proof_value"],
+        )
+    } if payment_ids else {}
+
+    student_ids = {p.student for p in payments.values()}
+    student_ids |= {r.reference_name for r in rows if r.reference_doctype == "CNTEMAD Student"}
+    students = {
+        s.name: s for s in frappe.get_all(
+            "CNTEMAD Student",
+            filters={"name": ["in", list(student_ids)]},
+            fields=["name", "full_name", "user", "email", "center"],
+        )
+    } if student_ids else {}
+
+    ec_ids = {p.ec for p in payments.values() if p.ec}
+    ec_titles = dict(frappe.get_all(
+        "CNTEMAD EC", filters={"name": ["in", list(ec_ids)]}, fields=["name", "title"], as_list=True
+    )) if ec_ids else {}
+
+    admin_emails = {}
+    center_ids = {s.center for s in students.values() if s.center}
+    if center_ids and any(r.event_type == "bank_payment_submitted" for r in rows):
+        admin_emails = dict(frappe.get_all(
+            "CNTEMAD Center", filters={"name": ["in", list(center_ids)]}, fields=["name", "admin_email"], as_list=True
+        ))
+
+    return {"payments": payments, "students": students, "ec_titles": ec_titles, "admin_emails": admin_emails}
+
+
+def _payment_context(row, references: dict) -> tuple:
+    payment = references["payments"][row.reference_name]
+    student = references["students"].get(payment.student) or frappe._dict()
+    context = {
+        "student_name": student.full_name,
+        "ec_title": references["ec_titles"].get(payment.ec) or payment.ec,
+        "amount": f"{int(payment.amount or 0):,}",
+        "reference": payment.name,
+        "bank_reference": payment.bank_reference,
+        "proof_type": payment.proof_type,
+        "proof_value": payment.proof_value,
+    }
+    return payment, student, context
+
+
+def _student_payment_context(row, data: dict, references: dict) -> tuple:
+    payment, student, context = _payment_context(row, references)
+    context["reason"] = data.get("reason")
+    return student.user, context
+
+
+def _center_admin_context(row, data: dict, references: dict) -> tuple:
+    payment, student, context = _payment_context(row, references)
+    return references["admin_emails"].get(student.center), context
+
+
+def _certificate_context(row, data: dict, references: dict) -> tuple:
+    student = references["students"].get(row.reference_name) or frappe._dict()
+    return student.email, {
+        "student_name": student.full_name,
+        "year": data.get("year"),
+        "certificate_number": data.get("certificate_number"),
+    }
+
+
+# event_type -> builder(row, data, references) -> (recipient, context)
+CONTEXT_BUILDERS = {
+    "payment_confirmed": _student_payment_context,
+    "bank_payment_submitted": _center_admin_context,
+    "bank_payment_validated": _student_payment_context,
+    "bank_payment_rejected": _student_payment_context,
+    "certificate_issued": _certificate_context,
+}
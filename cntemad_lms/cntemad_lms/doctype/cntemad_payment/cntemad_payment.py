@@ -1,9 +1,21 @@
 """CNTEMAD Payment Doctype."""
 
+import frappe
 from frappe.model.document import Document
 
 
 class CNTEMADPayment(Document):
     """Représente un paiement mobile money."""
 
-    pass
+    def validate(self):
+        if self.is_new() or self.has_value_changed("student"):
+            self.center = frappe.db.get_value("CNTEMAD Student", self.student, "center")
+
+
+def on_doctype_update():
+    """Index composites pour les accès étudiant/EC/statut, étudiant/date, statut/date, provider et centre/date."""
+    frappe.db.add_index("CNTEMAD Payment", ["student", "ec", "status"])
+    frappe.db.add_index("CNTEMAD Payment", ["student", "creation"])
+    frappe.db.add_index("CNTEMAD Payment", ["status", "creation"])
+    frappe.db.add_index("CNTEMAD Payment", ["provider", "status"])
+    frappe.db.add_index("CNTEMAD Payment", ["center", "creation"])
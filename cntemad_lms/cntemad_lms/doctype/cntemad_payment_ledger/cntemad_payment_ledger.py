@@ -0,0 +1,82 @@
+"""CNTEMAD Payment Ledger Doctype."""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, getdate, now_datetime
+
+from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+    apply_balance_deltas,
+)
+
+
+# Seul statut « payé »: toutes les lectures de revenus passent par le journal
+PAID_STATUS = "Completed"
+
+# entry_type -> signe de l'écriture
+ENTRY_SIGNS = {"Payment": 1, "Refund": -1, "Reversal": -1}
+
+
+class CNTEMADPaymentLedger(Document):
+    """Écriture du journal des encaissements, jamais modifiée ni supprimée."""
+
+    pass
+
+
+def on_doctype_update():
+    """Index pour retrouver les écritures d'un paiement."""
+    frappe.db.add_index("CNTEMAD Payment Ledger", ["payment"])
+
+
+def post_ledger_entries(payments: list, entry_type: str, posting_date=None) -> None:
+    """
+    Écrit une écriture par paiement et met à jour les soldes, dans la transaction courante.
+
+    Appelé quand un paiement entre dans l'état payé (Payment) ou en sort
+    (Refund pour un remboursement, Reversal sinon). Les soldes national,
+    centre, EC et provider, par mois et cumulés, sont ajustés en une requête.
+
+    Args:
+        payments: Documents ou lignes avec name, amount, center, ec, provider
+        entry_type: Payment, Refund ou Reversal
+        posting_date: Date d'encaissement (completed_at du paiement par défaut)
+
+    Usage:
+        post_ledger_entries([payment], "Payment")
+    """
+    if not payments:
+        return
+
+    sign = ENTRY_SIGNS[entry_type]
+    now = now_datetime()
+    user = frappe.session.user
+
+    rows = []
+    for p in payments:
+        paid_on = getdate(posting_date or p.get("completed_at") or now)
+        rows.append(frappe._dict(
+            payment=p.name,
+            posting_date=paid_on,
+            month=paid_on.strftime("%Y-%m"),
+            center=p.get("center"),
+            ec=p.get("ec"),
+            provider=p.get("provider"),
+            amount=sign * flt(p.get("amount")),
+            payment_count=sign,
+        ))
+
+    frappe.db.bulk_insert(
+        "CNTEMAD Payment Ledger",
+        [
+            "name", "creation", "modified", "owner", "modified_by", "docstatus",
+            "payment", "entry_type", "posting_date", "month",
+            "center", "ec", "provider", "amount", "payment_count",
+        ],
+        [
+            (frappe.generate_hash(length=10), now, now, user, user, 0,
+             r.payment, entry_type, r.posting_date, r.month,
+             r.center, r.ec, r.provider, r.amount, r.payment_count)
+            for r in rows
+        ],
+    )
+
+    apply_balance_deltas(rows)
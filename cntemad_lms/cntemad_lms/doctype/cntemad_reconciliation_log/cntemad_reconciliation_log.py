@@ -0,0 +1,192 @@
+"""CNTEMAD Reconciliation Log Doctype."""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, now_datetime
+
+
+MOBILE_PROVIDERS = ("mvola", "orange_money", "airtel_money")
+
+# Processing payments are queried once their webhook is this late
+PROCESSING_THRESHOLD_MINUTES = 15
+# Pending payments are expired once no initiation job can still send them:
+# the phone number it reads has expired (PAYMENT_PHONE_TTL) and a job in
+# flight has hit its timeout (PROVIDER_JOB_TIMEOUT), plus this margin
+PENDING_GRACE_MINUTES = 5
+
+RECONCILE_BATCH_SIZE = 200
+# Status queries in flight at once, all providers together
+RECONCILE_CONCURRENCY = 4
+RECONCILE_TIME_BUDGET = 25 * 60  # seconds, below the job timeout
+
+
+class CNTEMADReconciliationLog(Document):
+    """Trace d'un passage de réconciliation des paiements mobile money."""
+
+    pass
+
+
+def schedule_reconciliation() -> None:
+    """Scheduler (toutes les 15 minutes): lance la réconciliation sur la file `payments`."""
+    from cntemad_lms.cntemad_lms.api.payment import PAYMENTS_QUEUE
+
+    frappe.enqueue(
+        "cntemad_lms.cntemad_lms.doctype.cntemad_reconciliation_log.cntemad_reconciliation_log.reconcile_stuck_payments",
+        queue=PAYMENTS_QUEUE,
+        timeout=RECONCILE_TIME_BUDGET + 300,
+        job_id="cntemad_reconcile_payments",
+        deduplicate=True,
+    )
+
+
+def reconcile_stuck_payments() -> str:
+    """
+    Tâche de fond: met à jour les paiements restés Pending/Processing.
+
+    - Pending sans transaction provider, une fois qu'aucune tâche
+      `send_provider_request` ne peut plus l'envoyer (numéro expiré, tâche
+      en cours arrivée à son timeout): le paiement passe en Failed.
+    - Processing depuis plus de PROCESSING_THRESHOLD_MINUTES: le statut
+      est demandé au provider, par lots de RECONCILE_BATCH_SIZE avec au
+      plus RECONCILE_CONCURRENCY requêtes simultanées, puis appliqué comme
+      un webhook (`apply_provider_status`).
+
+    Returns:
+        str: Nom du CNTEMAD Reconciliation Log
+    """
+    log = frappe.get_doc({
+        "doctype": "CNTEMAD Reconciliation Log",
+        "status": "Running",
+        "started_at": now_datetime(),
+    }).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    counts = {"checked": 0, "completed_count": 0, "failed_count": 0, "unchanged_count": 0, "error_count": 0}
+    details = []
+
+    try:
+        _expire_pending_payments(counts, details)
+        _reconcile_processing_payments(counts, details)
+        log.status = "Completed"
+    except Exception:
+        frappe.db.rollback()
+        log.status = "Failed"
+        log.error = frappe.get_traceback()
+        frappe.log_error(log.error, "Payment reconciliation")
+
+    log.update(counts)
+    log.details = json.dumps(details, default=str)
+    log.completed_at = now_datetime()
+    log.save(ignore_permissions=True)
+    frappe.db.commit()
+
+    return log.name
+
+
+def _expire_pending_payments(counts: dict, details: list) -> None:
+    from cntemad_lms.cntemad_lms.api.payment import PAYMENT_PHONE_TTL, PROVIDER_JOB_TIMEOUT, apply_provider_status
+
+    cutoff = add_to_date(
+        now_datetime(),
+        seconds=-(PAYMENT_PHONE_TTL + PROVIDER_JOB_TIMEOUT),
+        minutes=-PENDING_GRACE_MINUTES,
+    )
+    names = frappe.get_all(
+        "CNTEMAD Payment",
+        filters={
+            "status": "Pending",
+            "creation": ["<", cutoff],
+            "provider": ["in", MOBILE_PROVIDERS],
+            "provider_transaction_id": ["is", "not set"],
+        },
+        pluck="name",
+    )
+
+    for name in names:
+        payment = frappe.get_doc("CNTEMAD Payment", name, for_update=True)
+        counts["checked"] += 1
+        if apply_provider_status(payment, "failed", reason="Demande non transmise au provider"):
+            counts["failed_count"] += 1
+            details.append({"payment": name, "from": "Pending", "to": "Failed"})
+        else:
+            counts["unchanged_count"] += 1
+        frappe.db.commit()
+
+
+def _reconcile_processing_payments(counts: dict, details: list) -> None:
+    from cntemad_lms.cntemad_lms.api.payment import apply_provider_status
+
+    cutoff = add_to_date(now_datetime(), minutes=-PROCESSING_THRESHOLD_MINUTES)
+    deadline = time.monotonic() + RECONCILE_TIME_BUDGET
+    last = None
+
+    query_status = partial(_query_status, frappe.local.site, frappe.local.sites_path)
+
+    with ThreadPoolExecutor(max_workers=RECONCILE_CONCURRENCY) as pool:
+        while time.monotonic() < deadline:
+            batch = _next_batch(cutoff, last)
+            if not batch:
+                break
+            last = batch[-1]
+
+            results = pool.map(query_status, batch)
+
+            for row, result in zip(batch, results):
+                counts["checked"] += 1
+                if isinstance(result, Exception):
+                    counts["error_count"] += 1
+                    continue
+                if not result:
+                    counts["unchanged_count"] += 1
+                    continue
+
+                payment = frappe.get_doc("CNTEMAD Payment", row.name, for_update=True)
+                if apply_provider_status(payment, result["status"], result["transaction_id"], result["reason"]):
+                    counts["completed_count" if payment.status == "Completed" else "failed_count"] += 1
+                    details.append({"payment": row.name, "from": row.status, "to": payment.status})
+                else:
+                    counts["unchanged_count"] += 1
+                frappe.db.commit()
+
+
+def _next_batch(cutoff, last) -> list:
+    """Paiements Processing en retard, par (creation, name) croissants."""
+    after = ""
+    values = {"cutoff": cutoff, "providers": MOBILE_PROVIDERS, "limit": RECONCILE_BATCH_SIZE}
+    if last:
+        after = "AND (creation > %(creation)s OR (creation = %(creation)s AND name > %(name)s))"
+        values.update(creation=last.creation, name=last.name)
+
+    return frappe.db.sql(f"""
+        SELECT name, creation, status, provider, provider_transaction_id, amount
+        FROM `tabCNTEMAD Payment`
+        WHERE status = 'Processing'
+            AND creation < %(cutoff)s
+            AND provider IN %(providers)s
+            {after}
+        ORDER BY creation, name
+        LIMIT %(limit)s
+    """, values, as_dict=True)
+
+
+def _query_status(site: str, sites_path: str, row):
+    """
+    Statut d'un paiement auprès du provider, dans un thread du pool.
+
+    Le thread ne fait que du HTTP: il lui faut la configuration du site et
+    Redis, pas la base. Son contexte Frappe est détruit après chaque appel.
+    """
+    from cntemad_lms.cntemad_lms.api.payment import query_provider_status
+
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        return query_provider_status(row)
+    except Exception as e:
+        return e
+    finally:
+        frappe.destroy()
@@ -0,0 +1,122 @@
+"""CNTEMAD Revenue Balance Doctype."""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, flt, getdate, now_datetime
+
+
+# Dimensions tenues pour chaque écriture du journal
+DIMENSIONS = ("national", "center", "ec", "provider")
+ALL_TIME = ""  # month du solde cumulé
+
+
+class CNTEMADRevenueBalance(Document):
+    """Solde courant (revenus, nombre de paiements) d'une dimension pour un mois ou depuis l'origine."""
+
+    pass
+
+
+def on_doctype_update():
+    """Index pour lire tous les soldes d'une dimension pour un mois."""
+    frappe.db.add_index("CNTEMAD Revenue Balance", ["dimension", "month"])
+
+
+def make_key(dimension: str, value: str = None, month: str = ALL_TIME) -> str:
+    """Nom déterministe d'un solde, identique à celui de la reconstruction SQL."""
+    return f"{dimension}|{value or ''}|{month or ''}"
+
+
+def get_revenue(dimension: str, value: str = None, month=None) -> dict:
+    """
+    Solde d'une dimension: lecture par clé primaire.
+
+    Usage:
+        get_revenue("center", "CTR-TANA")                    # depuis l'origine
+        get_revenue("national", month=getdate())             # mois en cours
+        get_revenue("ec", "EC-0001", month="2025-01")
+
+    Returns:
+        dict: {amount, payment_count}
+    """
+    balance = frappe.db.get_value(
+        "CNTEMAD Revenue Balance",
+        make_key(dimension, value, _month(month)),
+        ["amount", "payment_count"],
+        as_dict=True
+    ) or {}
+    return {"amount": flt(balance.get("amount")), "payment_count": cint(balance.get("payment_count"))}
+
+
+def apply_balance_deltas(entries: list) -> None:
+    """
+    Ajoute des écritures du journal aux soldes, en une seule requête.
+
+    Chaque écriture touche 8 soldes: (national, centre, EC, provider) x
+    (mois, cumul); les deltas sont regroupés par solde avant l'écriture.
+    """
+    deltas = {}
+    for entry in entries:
+        for dimension in DIMENSIONS:
+            value = "" if dimension == "national" else entry.get(dimension)
+            if dimension != "national" and not value:
+                continue
+            for month in (entry.month, ALL_TIME):
+                key = (dimension, value, month)
+                amount, count = deltas.get(key, (0, 0))
+                deltas[key] = (amount + flt(entry.amount), count + cint(entry.payment_count))
+
+    if not deltas:
+        return
+
+    now = now_datetime()
+    params = []
+    for (dimension, value, month), (amount, count) in deltas.items():
+        params += [make_key(dimension, value, month), dimension, value, month, amount, count, now, now]
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabCNTEMAD Revenue Balance`
+            (name, dimension, dimension_value, month, amount, payment_count,
+             creation, modified, owner, modified_by, docstatus)
+        VALUES
+            {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator', 0)"] * len(deltas))}
+        ON DUPLICATE KEY UPDATE
+            amount = amount + VALUES(amount),
+            payment_count = payment_count + VALUES(payment_count),
+            modified = VALUES(modified)
+    """, params)
+
+
+def rebuild_revenue_balances() -> None:
+    """Recalcule tous les soldes depuis le journal (backfill, réparation)."""
+    frappe.db.sql("DELETE FROM `tabCNTEMAD Revenue Balance`")
+
+    for dimension in DIMENSIONS:
+        column = "''" if dimension == "national" else f"l.`{dimension}`"
+        condition = "" if dimension == "national" else f"AND l.`{dimension}` IS NOT NULL AND l.`{dimension}` != ''"
+
+        for month in ("l.month", "''"):
+            group_by = ", ".join(c for c in (column, month) if c != "''")
+            frappe.db.sql(f"""
+                INSERT INTO `tabCNTEMAD Revenue Balance`
+                    (name, dimension, dimension_value, month, amount, payment_count,
+                     creation, modified, owner, modified_by, docstatus)
+                SELECT
+                    CONCAT(%(dimension)s, '|', {column}, '|', {month}),
+                    %(dimension)s, {column}, {month},
+                    SUM(l.amount), SUM(l.payment_count),
+                    NOW(), NOW(), 'Administrator', 'Administrator', 0
+                FROM `tabCNTEMAD Payment Ledger` l
+                WHERE 1=1 {condition}
+                {f"GROUP BY {group_by}" if group_by else ""}
+                HAVING COUNT(*) > 0
+            """, {"dimension": dimension})
+
+    frappe.db.commit()
+
+
+def _month(month) -> str:
+    if not month:
+        return ALL_TIME
+    if isinstance(month, str) and len(month) == 7:
+        return month
+    return getdate(month).strftime("%Y-%m")
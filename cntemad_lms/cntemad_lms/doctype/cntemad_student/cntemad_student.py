@@ -39,3 +39,9 @@ class CNTEMADStudent(Document):
         """Retourne la progression de l'étudiant."""
         from cntemad_lms.cntemad_lms.api.student import get_student_progress
         return get_student_progress(self.name)
+
+
+def on_doctype_update():
+    """Index composites pour les accès par utilisateur et par centre."""
+    frappe.db.add_index("CNTEMAD Student", ["user"])
+    frappe.db.add_index("CNTEMAD Student", ["center", "status"])
@@ -0,0 +1,140 @@
+"""CNTEMAD Webhook Inbox Doctype."""
+
+import hashlib
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+
+WEBHOOK_BATCH_SIZE = 100
+CONSUMER = "cntemad_lms.cntemad_lms.doctype.cntemad_webhook_inbox.cntemad_webhook_inbox.process_webhook_inbox"
+
+
+class CNTEMADWebhookInbox(Document):
+    """Callback provider brut, enregistré tel quel puis traité en tâche de fond."""
+
+    pass
+
+
+def on_doctype_update():
+    """Index pour la lecture des événements en attente dans l'ordre d'arrivée."""
+    frappe.db.add_index("CNTEMAD Webhook Inbox", ["status", "creation"])
+
+
+def record_webhook_event(provider: str, event: dict, payload: dict) -> bool:
+    """
+    Enregistre un callback et programme son traitement.
+
+    Un même événement (provider, transaction, statut) n'est enregistré
+    qu'une fois: les renvois du provider sont acquittés sans effet.
+
+    Returns:
+        bool: False si l'événement avait déjà été reçu
+    """
+    try:
+        frappe.get_doc({
+            "doctype": "CNTEMAD Webhook Inbox",
+            "event_key": make_event_key(provider, event, payload),
+            "provider": provider,
+            "transaction_id": event.get("transaction_id"),
+            "reference": event.get("reference"),
+            "event_status": event.get("status"),
+            "payload": json.dumps(payload, sort_keys=True),
+            "received_at": now_datetime(),
+        }).insert(ignore_permissions=True)
+    except frappe.DuplicateEntryError:
+        return False
+
+    from cntemad_lms.cntemad_lms.api.payment import PAYMENTS_QUEUE
+
+    # One consumer at a time; events arriving while it runs are picked up
+    # by its next batch or by the scheduler sweep
+    frappe.enqueue(
+        CONSUMER,
+        queue=PAYMENTS_QUEUE,
+        job_id="cntemad_webhook_inbox",
+        deduplicate=True,
+        enqueue_after_commit=True,
+    )
+    return True
+
+
+def make_event_key(provider: str, event: dict, payload: dict) -> str:
+    """provider:transaction:statut, ou empreinte du payload sans identifiant."""
+    transaction = event.get("transaction_id") or event.get("reference")
+    if not transaction:
+        transaction = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    return f"{provider}:{transaction}:{event.get('status') or ''}"
+
+
+def process_webhook_inbox(batch_size: int = WEBHOOK_BATCH_SIZE) -> int:
+    """
+    Tâche de fond (file `payments`, et chaque minute): applique les callbacks reçus.
+
+    Les événements sont lus par lots dans l'ordre d'arrivée; chacun est
+    traité et commité séparément, une erreur le passe en Failed sans
+    bloquer les suivants.
+
+    Returns:
+        int: Nombre d'événements traités
+    """
+    processed = 0
+
+    while True:
+        events = frappe.get_all(
+            "CNTEMAD Webhook Inbox",
+            filters={"status": "Received"},
+            fields=["name", "provider", "reference", "transaction_id", "event_status", "payload"],
+            order_by="creation asc",
+            limit=batch_size,
+        )
+
+        for event in events:
+            _process_event(event)
+
+        processed += len(events)
+        if len(events) < batch_size:
+            return processed
+
+
+def _process_event(event) -> None:
+    from cntemad_lms.cntemad_lms.api.payment import apply_provider_status, parse_webhook_payload
+
+    try:
+        # Lock the event: a concurrent consumer skips it once processed
+        if frappe.db.get_value("CNTEMAD Webhook Inbox", event.name, "status", for_update=True) != "Received":
+            frappe.db.rollback()
+            return
+
+        if not event.reference or not frappe.db.exists("CNTEMAD Payment", event.reference):
+            frappe.log_error(
+                f"Webhook callback: Payment not found for reference {event.reference}",
+                "Payment Webhook Error"
+            )
+            _set_status(event.name, "Ignored", "Paiement introuvable")
+        else:
+            parsed = parse_webhook_payload(event.provider, json.loads(event.payload or "{}")) or {}
+            payment = frappe.get_doc("CNTEMAD Payment", event.reference, for_update=True)
+            changed = apply_provider_status(
+                payment, event.event_status, event.transaction_id, parsed.get("reason")
+            )
+            _set_status(event.name, "Processed" if changed else "Ignored")
+
+        frappe.db.commit()
+
+    except Exception:
+        frappe.db.rollback()
+        _set_status(event.name, "Failed", frappe.get_traceback())
+        frappe.log_error(frappe.get_traceback(), f"Webhook event {event.name}")
+        frappe.db.commit()
+
+
+def _set_status(name: str, status: str, error: str = None) -> None:
+    frappe.db.set_value("CNTEMAD Webhook Inbox", name, {
+        "status": status,
+        "processed_at": now_datetime(),
+        "error": error,
+    }, update_modified=False)
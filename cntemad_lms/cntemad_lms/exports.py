@@ -0,0 +1,83 @@
+"""
+Streaming CSV exports.
+
+Rows are read from an unbuffered (server-side) cursor and written to the
+HTTP response in chunks, so memory stays constant whatever the size of
+the export.
+
+Usage:
+    return stream_csv_response("cntemad_payments_20250101.csv", iter_rows)
+
+`iter_rows` is a callable returning an iterable of rows (first row = header).
+It is called while the response body is being sent, after Frappe has
+released the request context: the site connection is reopened for it.
+"""
+
+import csv
+from io import StringIO
+
+import frappe
+from werkzeug.wrappers import Response
+
+
+CHUNK_SIZE = 64 * 1024  # bytes buffered before each write to the socket
+
+
+def stream_csv_response(filename: str, iter_rows, *args, **kwargs) -> Response:
+    """
+    Build a chunked CSV download from `iter_rows(*args, **kwargs)`.
+
+    The UTF-8 BOM lets Excel open accented characters correctly.
+    """
+    body = _iter_csv_chunks(
+        frappe.local.site,
+        frappe.local.sites_path,
+        frappe.session.user,
+        iter_rows,
+        args,
+        kwargs,
+    )
+
+    response = Response(body, mimetype="text/csv", direct_passthrough=True)
+    response.charset = "utf-8"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def iter_query(query: str, values: dict = None, header: list = None, format_row=None):
+    """
+    Yield `header` then every row of `query` from an unbuffered cursor.
+
+    No other query may run on the connection until the iteration is over.
+    """
+    if header:
+        yield header
+
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(query, values or {}, as_iterator=True):
+            yield format_row(row) if format_row else row
+
+
+def _iter_csv_chunks(site, sites_path, user, iter_rows, args, kwargs):
+    """Generator consumed by the WSGI server once the request is finished."""
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user(user)
+
+    try:
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        yield "\ufeff".encode()
+
+        for row in iter_rows(*args, **kwargs):
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    finally:
+        frappe.destroy()
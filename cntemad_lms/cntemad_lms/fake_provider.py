@@ -0,0 +1,183 @@
+"""
+Local stand-in for the MVola, Orange Money and Airtel Money APIs.
+
+Answers the payment initiation and status endpoints called by
+`api/payment.py` with a configurable latency and failure rate, so the
+provider client (pooling, timeouts, circuit breaker) and the
+reconciliation can be exercised and load-tested offline. No callback is
+sent; `load_test.py` generates them.
+
+Usage:
+    bench cntemad-fake-provider --port 8765 --latency 300 --failure-rate 0.1
+
+    # site_config.json
+    "mobile_money": {"mvola": {"api_url": "http://127.0.0.1:8765", "sandbox": 0}, ...}
+"""
+
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROUTES = {
+    "/mvola/mm/transactions/type/merchantpay/1.0.0/": "mvola",
+    "/orange-money-webpay/mg/v1/webpayment": "orange_money",
+    "/merchant/v1/payments/": "airtel_money",
+}
+
+# Status queries (reconciliation): every transaction is reported completed
+STATUS_ROUTES = {
+    "/mvola/mm/transactions/type/merchantpay/1.0.0/status/": "mvola",
+    "/orange-money-webpay/mg/v1/transactionstatus": "orange_money",
+    "/standard/v1/payments/": "airtel_money",
+}
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real gateways
+
+    # Set by run_fake_provider
+    latency_ms = 0
+    jitter_ms = 0
+    failure_rate = 0.0
+    timeout_rate = 0.0
+    hang_seconds = 60
+    quiet = True
+
+    def do_GET(self):
+        provider = next((p for route, p in STATUS_ROUTES.items() if self.path.startswith(route)), None)
+        if not provider or provider == "orange_money":
+            return self._reply(404, {"error": "not found"})
+
+        if self._simulate_degradation():
+            return
+        return self._reply(200, _status_response(provider, self.path.rsplit("/", 1)[-1], {}))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status_query = self.path == "/orange-money-webpay/mg/v1/transactionstatus"
+        provider = "orange_money" if status_query else ROUTES.get(self.path)
+        if not provider:
+            return self._reply(404, {"error": "not found"})
+
+        if self._simulate_degradation():
+            return
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self._reply(400, {"error": "invalid json"})
+
+        if status_query:
+            return self._reply(200, _status_response(provider, payload.get("pay_token"), payload))
+        return self._reply(200, _success_response(provider, payload))
+
+    def _simulate_degradation(self) -> bool:
+        """Latency, then maybe a hang or a 503. True when the reply was sent."""
+        roll = random.random()
+        if roll < self.timeout_rate:
+            time.sleep(self.hang_seconds)
+            self._reply(504, {"error": "gateway timeout"})
+            return True
+
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(delay, 0) / 1000)
+
+        if roll < self.timeout_rate + self.failure_rate:
+            self._reply(503, {"error": "service unavailable"})
+            return True
+
+        return False
+
+    def _reply(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def run_fake_provider(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    latency_ms: int = 200,
+    jitter_ms: int = 50,
+    failure_rate: float = 0.0,
+    timeout_rate: float = 0.0,
+    quiet: bool = True,
+) -> None:
+    """Serve until interrupted."""
+    server = make_fake_provider_server(
+        host, port, latency_ms, jitter_ms, failure_rate, timeout_rate, quiet
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def make_fake_provider_server(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    latency_ms: int = 200,
+    jitter_ms: int = 50,
+    failure_rate: float = 0.0,
+    timeout_rate: float = 0.0,
+    quiet: bool = True,
+) -> ThreadingHTTPServer:
+    """Bound server, not started: call `serve_forever` (e.g. in a thread, see load_test.py)."""
+    handler = type("ConfiguredFakeProviderHandler", (FakeProviderHandler,), {
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "failure_rate": failure_rate,
+        "timeout_rate": timeout_rate,
+        "quiet": quiet,
+    })
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def _success_response(provider: str, payload: dict) -> dict:
+    transaction_id = uuid.uuid4().hex
+
+    if provider == "mvola":
+        return {
+            "status": "pending",
+            "serverCorrelationId": transaction_id,
+            "notificationMethod": "callback",
+        }
+
+    if provider == "orange_money":
+        return {
+            "status": 201,
+            "message": "OK",
+            "pay_token": transaction_id,
+            "payment_url": f"https://webpayment.example/{transaction_id}",
+        }
+
+    return {
+        "data": {"transaction": {"id": payload.get("transaction", {}).get("id"), "status": "Success."}},
+        "status": {"code": "200", "success": True},
+    }
+
+
+def _status_response(provider: str, transaction_id: str, payload: dict) -> dict:
+    if provider == "mvola":
+        return {"status": "completed", "serverCorrelationId": transaction_id, "objectReference": transaction_id}
+
+    if provider == "orange_money":
+        return {"status": "SUCCESS", "order_id": payload.get("order_id"), "txnid": transaction_id}
+
+    return {
+        "data": {"transaction": {"id": transaction_id, "status": "TS", "airtel_money_id": f"AM{transaction_id}"}},
+        "status": {"code": "200", "success": True},
+    }
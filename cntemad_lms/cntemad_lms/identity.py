@@ -0,0 +1,143 @@
+"""
+Identity of the current user (student profile, managed center, roles).
+
+Resolved once per user and kept in a Redis hash (`frappe.cache().hget`,
+which also memoizes it for the rest of the request). Entries are
+dropped at login/logout and whenever a Student, Center, Center Admin or
+User record that feeds them changes (Student hooks live in api/student.py).
+
+Usage:
+    from cntemad_lms.cntemad_lms.identity import get_current_student_id
+
+    student_id = get_current_student_id()
+    identity = get_identity()  # {user, student, admin_center, roles}
+    is_national_admin()  # CNTEMAD central: every center
+"""
+
+from functools import partial
+
+import frappe
+
+
+IDENTITY_KEY = "cntemad_identity"
+NATIONAL_ADMIN_ROLES = ("National Admin", "System Manager")
+
+
+def get_identity(user: str = None) -> frappe._dict:
+    """
+    Return the cached identity of `user` (current user by default).
+
+    Returns:
+        frappe._dict: {
+            user,
+            student: {name, full_name, center, current_year} or None,
+            admin_center: {name, title, region, code} or None,
+            roles: [role, ...]
+        }
+    """
+    user = user or frappe.session.user
+    if user == "Guest":
+        return frappe._dict(user="Guest", student=None, admin_center=None, roles=["Guest"])
+
+    return frappe.cache().hget(IDENTITY_KEY, user, generator=partial(_resolve, user))
+
+
+def get_current_student_id() -> str:
+    """Name of the CNTEMAD Student linked to the current user, or None."""
+    student = get_identity().student
+    return student["name"] if student else None
+
+
+def get_current_admin_center() -> dict:
+    """Center managed by the current user, or None."""
+    center = get_identity().admin_center
+    return dict(center) if center else None
+
+
+def is_national_admin() -> bool:
+    """Whether the current user administers every center."""
+    return any(role in NATIONAL_ADMIN_ROLES for role in get_identity().roles)
+
+
+def clear_identity(*users) -> None:
+    """Forget the cached identity of `users`, now and once the transaction commits."""
+    users = [u for u in users if u and u != "Guest"]
+    if not users:
+        return
+
+    _delete(users)
+    frappe.db.after_commit.add(partial(_delete, users))
+
+
+def clear_all_identities() -> None:
+    """Forget every cached identity (e.g. a center was renamed)."""
+    frappe.cache().delete_key(IDENTITY_KEY)
+    frappe.db.after_commit.add(partial(frappe.cache().delete_key, IDENTITY_KEY))
+
+
+# ==============================================================================
+# HOOKS
+# ==============================================================================
+
+
+def on_session_change(login_manager=None):
+    """on_session_creation / on_logout: start each session from fresh data."""
+    clear_identity(login_manager.user if login_manager else frappe.session.user)
+
+
+def on_center_changed(doc, method):
+    """CNTEMAD Center: admin link or displayed fields may have changed."""
+    clear_all_identities()
+
+
+def on_center_admin_changed(doc, method):
+    """CNTEMAD Center Admin."""
+    before = doc.get_doc_before_save() if method == "on_update" else None
+    clear_identity(doc.user, before.user if before else None)
+
+
+def on_user_changed(doc, method):
+    """User: roles may have changed."""
+    clear_identity(doc.name)
+
+
+def _resolve(user: str) -> frappe._dict:
+    student = frappe.db.get_value(
+        "CNTEMAD Student",
+        {"user": user},
+        ["name", "full_name", "center", "current_year"],
+        as_dict=True
+    )
+
+    return frappe._dict(
+        user=user,
+        student=dict(student) if student else None,
+        admin_center=_resolve_admin_center(user),
+        roles=frappe.get_roles(user),
+    )
+
+
+def _resolve_admin_center(user: str) -> dict:
+    center_id = frappe.db.get_value("CNTEMAD Center", {"admin_user": user}, "name")
+
+    if not center_id and frappe.db.exists("DocType", "CNTEMAD Center Admin"):
+        center_id = frappe.db.get_value(
+            "CNTEMAD Center Admin", {"user": user, "is_active": 1}, "center"
+        )
+
+    if not center_id:
+        return None
+
+    center = frappe.get_doc("CNTEMAD Center", center_id)
+    return {
+        "name": center.name,
+        "title": center.title,
+        "region": center.region,
+        "code": center.code if hasattr(center, "code") else None,
+    }
+
+
+def _delete(users: list) -> None:
+    cache = frappe.cache()
+    for user in users:
+        cache.hdel(IDENTITY_KEY, user)
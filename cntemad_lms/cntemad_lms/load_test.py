@@ -0,0 +1,576 @@
+"""
+Load test of the mobile money payment path (fee-deadline peak).
+
+Seeds load-test students and ECs, then:
+
+1. initiates payments concurrently through `initiate_payment`, each as
+   its student; the provider calls run on the `payments` workers
+   against the fake provider (`fake_provider.py`), served in-process;
+2. waits for the workers to take every payment out of Pending;
+3. fires the provider callbacks through `process_webhook_callback`: one
+   final status per accepted payment, plus duplicates and stale
+   `pending` callbacks arriving after the final one, interleaved and
+   delivered concurrently;
+4. waits for the webhook inbox to be drained and checks every payment
+   (status, enrollment, ledger, webhook events).
+
+The report gives throughput and latency percentiles per phase, the
+MariaDB statement counts (server-wide `SHOW GLOBAL STATUS`, so the
+queries of the workers are included) and the payments left in an
+inconsistent state.
+
+Requirements: `allow_tests` in site_config.json, workers on the
+`payments` queue, and the providers pointed at the fake provider:
+
+    "mobile_money": {
+        "mvola": {"api_url": "http://127.0.0.1:8765", "sandbox": 0, "api_secret": "..."},
+        "orange_money": {"api_url": "http://127.0.0.1:8765", "sandbox": 0},
+        "airtel_money": {"api_url": "http://127.0.0.1:8765", "sandbox": 0}
+    }
+
+Usage:
+    bench --site test.localhost cntemad-load-test --payments 2000 --concurrency 50 --failure-rate 0.05
+    bench --site test.localhost cntemad-load-test --cleanup
+"""
+
+import hashlib
+import hmac
+import json
+import math
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+import frappe
+from frappe.utils import cint, getdate, now_datetime
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from cntemad_lms.cntemad_lms.fake_provider import make_fake_provider_server
+
+
+PREFIX = "LOADTEST"
+EMAIL_DOMAIN = "loadtest.invalid"
+EC_PRICE = 50000
+
+PROVIDERS = ("mvola", "orange_money", "airtel_money")
+PHONE_PREFIXES = {"mvola": "034", "orange_money": "032", "airtel_money": "033"}
+
+# Server-wide statement counters sampled around each phase
+STATUS_COUNTERS = ("Questions", "Com_select", "Com_insert", "Com_update", "Com_delete")
+POLL_INTERVAL = 1  # seconds
+
+
+def run_payment_load_test(
+    payments: int = 500,
+    students: int = 200,
+    concurrency: int = 20,
+    providers: tuple = PROVIDERS,
+    port: int = 8765,
+    latency_ms: int = 200,
+    jitter_ms: int = 50,
+    failure_rate: float = 0.0,
+    callback_failure_rate: float = 0.1,
+    duplicate_rate: float = 0.2,
+    reorder_rate: float = 0.2,
+    settle_timeout: int = 300,
+) -> dict:
+    """
+    Run the load test on the connected site.
+
+    Args:
+        payments: Payments to initiate
+        students: Load-test students (created once, reused by later runs)
+        concurrency: Concurrent clients (initiations and callbacks)
+        providers: Providers drawn at random for each payment
+        port: Port of the fake provider (must match the site config)
+        latency_ms, jitter_ms, failure_rate: Fake provider behaviour
+        callback_failure_rate: Share of accepted payments whose callback is `failed`
+        duplicate_rate: Share of payments whose final callback is sent twice
+        reorder_rate: Share of payments receiving a stale `pending` callback after the final one
+        settle_timeout: Seconds to wait for the workers after each phase
+
+    Returns:
+        dict: {run_id, phases, queries, statuses, issues, ...}
+    """
+    _check_setup(providers, port)
+
+    run_id = now_datetime().strftime("%Y%m%d%H%M%S")
+    student_rows = _seed_students(students)
+    ecs = _seed_ecs(run_id, math.ceil(payments / len(student_rows)))
+
+    tasks = []
+    for i in range(payments):
+        provider = random.choice(providers)
+        tasks.append(frappe._dict(
+            user=student_rows[i % len(student_rows)].user,
+            ec=ecs[i // len(student_rows)],
+            provider=provider,
+            phone=f"{PHONE_PREFIXES[provider]}{random.randint(0, 9999999):07d}",
+        ))
+
+    server = make_fake_provider_server(
+        port=port, latency_ms=latency_ms, jitter_ms=jitter_ms, failure_rate=failure_rate
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    report = frappe._dict(run_id=run_id, payments=payments, concurrency=concurrency, phases={}, queries={})
+    try:
+        # 1. Initiation storm
+        before = _db_status()
+        results, elapsed = _run_concurrently(tasks, _initiate, concurrency)
+        report.queries["initiate"] = _status_delta(before)
+        report.phases["initiate"] = _phase(results, elapsed)
+        payment_ids = [r["payment_id"] for r in results if r.get("payment_id")]
+
+        if not payment_ids:
+            report.statuses, report.issues = {}, []
+            return report
+
+        # 2. Provider calls on the workers
+        before = _db_status()
+        start = time.perf_counter()
+        _wait(lambda: not _count_payments(payment_ids, ("Pending",)), settle_timeout)
+        report.queries["provider_calls"] = _status_delta(before)
+        report.phases["provider_calls"] = {
+            "seconds": round(time.perf_counter() - start, 2),
+            "statuses": _payment_statuses(payment_ids),
+        }
+
+        # 3. Webhook storm
+        expected, callbacks = _plan_callbacks(
+            payment_ids, callback_failure_rate, duplicate_rate, reorder_rate
+        )
+        before = _db_status()
+        results, elapsed = _run_concurrently(callbacks, _deliver_callback, concurrency)
+        report.queries["callbacks"] = _status_delta(before)
+        report.phases["callbacks"] = _phase(results, elapsed)
+
+        # 4. Inbox consumer on the workers
+        before = _db_status()
+        start = time.perf_counter()
+        _wait(lambda: not _count_inbox(payment_ids, "Received"), settle_timeout)
+        report.queries["webhook_processing"] = _status_delta(before)
+        report.phases["webhook_processing"] = {"seconds": round(time.perf_counter() - start, 2)}
+
+        report.statuses = _payment_statuses(payment_ids)
+        report.issues = _check_consistency(payment_ids, expected)
+        return report
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def cleanup_load_test_data() -> dict:
+    """
+    Delete every load-test record, then rebuild the aggregates they fed.
+
+    Ledger rows are deleted too: the revenue balances, center stats,
+    daily stats and KPI counters are recomputed from what remains.
+    """
+    students = frappe.get_all(
+        "CNTEMAD Student", filters={"email": ["like", f"%@{EMAIL_DOMAIN}"]}, pluck="name"
+    )
+    course = frappe.db.get_value("CNTEMAD Course", {"title": PREFIX})
+    ecs = frappe.get_all("CNTEMAD EC", filters={"course": course}, pluck="name") if course else []
+    payments = frappe.get_all(
+        "CNTEMAD Payment", filters={"student": ["in", students]}, fields=["name", "creation"]
+    ) if students else []
+    payment_ids = [p.name for p in payments]
+
+    if payment_ids:
+        frappe.db.delete("CNTEMAD Payment Ledger", {"payment": ["in", payment_ids]})
+        frappe.db.delete("CNTEMAD Webhook Inbox", {"reference": ["in", payment_ids]})
+        frappe.db.delete("CNTEMAD Notification Outbox", {
+            "reference_doctype": "CNTEMAD Payment", "reference_name": ["in", payment_ids]
+        })
+        frappe.db.delete("CNTEMAD Payment", {"name": ["in", payment_ids]})
+    if students:
+        frappe.db.delete("CNTEMAD Enrollment", {"student": ["in", students]})
+        frappe.db.delete("CNTEMAD Student", {"name": ["in", students]})
+    if ecs:
+        frappe.db.delete("CNTEMAD EC", {"name": ["in", ecs]})
+    if course:
+        frappe.db.delete("CNTEMAD Course", {"name": course})
+
+    users = frappe.get_all("User", filters={"name": ["like", f"%@{EMAIL_DOMAIN}"]}, pluck="name")
+    if users:
+        frappe.db.delete("Has Role", {"parenttype": "User", "parent": ["in", users]})
+        frappe.db.delete("User", {"name": ["in", users]})
+    frappe.db.delete("CNTEMAD Center Stats", {"center": PREFIX})
+    frappe.db.delete("CNTEMAD Center", {"name": PREFIX})
+    frappe.db.commit()
+
+    _rebuild_aggregates(min((p.creation for p in payments), default=None))
+    return {"payments": len(payment_ids), "students": len(students), "ecs": len(ecs), "users": len(users)}
+
+
+# ==============================================================================
+# SETUP
+# ==============================================================================
+
+
+def _check_setup(providers: tuple, port: int) -> None:
+    if not frappe.conf.allow_tests:
+        frappe.throw("Set `allow_tests` in site_config.json to run the load test on this site")
+
+    from cntemad_lms.cntemad_lms.api.payment import get_provider_config
+
+    for provider in providers:
+        config = get_provider_config(provider)
+        if config.get("sandbox", True) or not config["api_url"].rstrip("/").endswith(f":{port}"):
+            frappe.throw(
+                f"mobile_money.{provider} must have sandbox 0 and api_url http://127.0.0.1:{port} "
+                "(the workers call the fake provider)"
+            )
+
+
+def _seed_students(count: int) -> list:
+    """Load-test students with their users, created on the first run."""
+    center = _ensure_center()
+    students = []
+
+    for i in range(count):
+        email = f"student-{i:05d}@{EMAIL_DOMAIN}"
+        student = frappe.db.get_value("CNTEMAD Student", {"email": email}, ["name", "user"], as_dict=True)
+        if not student:
+            if not frappe.db.exists("User", email):
+                frappe.get_doc({
+                    "doctype": "User",
+                    "email": email,
+                    "first_name": PREFIX,
+                    "last_name": str(i),
+                    "user_type": "Website User",
+                    "send_welcome_email": 0,
+                    "roles": [{"role": "Student"}],
+                }).insert(ignore_permissions=True)
+
+            doc = frappe.get_doc({
+                "doctype": "CNTEMAD Student",
+                "first_name": PREFIX,
+                "last_name": str(i),
+                "email": email,
+                "user": email,
+                "center": center,
+                "status": "Active",
+            }).insert(ignore_permissions=True)
+            student = frappe._dict(name=doc.name, user=email)
+        students.append(student)
+
+    frappe.db.commit()
+    return students
+
+
+def _seed_ecs(run_id: str, count: int) -> list:
+    """ECs of this run: each (student, EC) pair is paid at most once."""
+    course = frappe.db.get_value("CNTEMAD Course", {"title": PREFIX})
+    if not course:
+        course = frappe.get_doc({
+            "doctype": "CNTEMAD Course", "title": PREFIX, "year": "L1"
+        }).insert(ignore_permissions=True).name
+
+    ecs = [
+        frappe.get_doc({
+            "doctype": "CNTEMAD EC",
+            "title": f"{PREFIX} {run_id} #{i}",
+            "course": course,
+            "price": EC_PRICE,
+        }).insert(ignore_permissions=True).name
+        for i in range(count)
+    ]
+    frappe.db.commit()
+    return ecs
+
+
+def _ensure_center() -> str:
+    if not frappe.db.exists("CNTEMAD Center", PREFIX):
+        frappe.get_doc({
+            "doctype": "CNTEMAD Center",
+            "code": PREFIX,
+            "title": "Centre de test de charge",
+            "region": "Test",
+        }).insert(ignore_permissions=True)
+    return PREFIX
+
+
+def _rebuild_aggregates(since) -> None:
+    from cntemad_lms.cntemad_lms.counters import reconcile_kpi_counters
+    from cntemad_lms.cntemad_lms.doctype.cntemad_center_stats.cntemad_center_stats import (
+        rebuild_center_stats,
+    )
+    from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+        rebuild_daily_stats,
+    )
+    from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+        rebuild_revenue_balances,
+    )
+
+    rebuild_revenue_balances()
+    rebuild_center_stats()
+    if since:
+        rebuild_daily_stats(getdate(since))
+    reconcile_kpi_counters()
+    frappe.db.commit()
+
+
+# ==============================================================================
+# CLIENTS
+# ==============================================================================
+
+
+def _run_concurrently(items: list, fn, concurrency: int) -> tuple:
+    """
+    Apply `fn` to every item from `concurrency` threads, each with its own site connection.
+
+    Returns:
+        tuple: (results, elapsed seconds)
+    """
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+    pending = queue.SimpleQueue()
+    for item in items:
+        pending.put(item)
+    results = []
+
+    def client():
+        frappe.init(site=site, sites_path=sites_path)
+        frappe.connect()
+        try:
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    return
+                results.append(fn(item))
+        finally:
+            frappe.destroy()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(min(concurrency, len(items)))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def _initiate(task) -> dict:
+    from cntemad_lms.cntemad_lms.api.payment import initiate_payment
+
+    frappe.set_user(task.user)
+    start = time.perf_counter()
+    try:
+        response = initiate_payment(task.ec, task.provider, task.phone)
+        frappe.db.commit()
+        return {"latency": time.perf_counter() - start, "payment_id": response["payment_id"]}
+    except Exception as e:
+        frappe.db.rollback()
+        return {"latency": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+
+
+def _deliver_callback(callback) -> dict:
+    """POST a provider callback to the webhook endpoint, in-process."""
+    from cntemad_lms.cntemad_lms.api.payment import get_provider_config, process_webhook_callback
+
+    body = json.dumps(callback.payload)
+    headers = {}
+    if callback.provider == "mvola":
+        secret = get_provider_config("mvola")["api_secret"]
+        headers["X-Callback-Signature"] = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+
+    frappe.set_user("Guest")
+    frappe.local.request = Request(EnvironBuilder(
+        method="POST", data=body, content_type="application/json", headers=headers
+    ).get_environ())
+
+    start = time.perf_counter()
+    try:
+        response = process_webhook_callback(callback.provider)
+        frappe.db.commit()
+        result = {"latency": time.perf_counter() - start}
+        if response.get("status") != "ok":
+            result["error"] = response.get("message") or response.get("status")
+        return result
+    except Exception as e:
+        frappe.db.rollback()
+        return {"latency": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+
+
+def _plan_callbacks(payment_ids: list, failure_rate: float, duplicate_rate: float, reorder_rate: float) -> tuple:
+    """
+    Callbacks of the accepted (Processing) payments, and the expected final statuses.
+
+    Payments refused by the provider (Failed) get no callback; payments
+    still Pending were never sent and are reported as stuck.
+
+    Returns:
+        tuple: ({payment: expected status}, [callback, ...])
+    """
+    expected = {}
+    sequences = []
+
+    for payment in frappe.get_all(
+        "CNTEMAD Payment",
+        filters={"name": ["in", payment_ids]},
+        fields=["name", "status", "provider", "provider_transaction_id"],
+    ):
+        if payment.status == "Failed":
+            expected[payment.name] = "Failed"
+        if payment.status != "Processing":
+            continue
+
+        final = "failed" if random.random() < failure_rate else "completed"
+        expected[payment.name] = "Failed" if final == "failed" else "Completed"
+
+        extras = []
+        if random.random() < duplicate_rate:
+            extras.append(final)
+        if random.random() < reorder_rate:
+            extras.append("pending")
+        random.shuffle(extras)
+
+        sequences.append([
+            frappe._dict(provider=payment.provider, payload=_callback_payload(payment, status))
+            for status in [final] + extras
+        ])
+
+    return expected, _interleave(sequences)
+
+
+def _callback_payload(payment, status: str) -> dict:
+    """Callback body in the provider format read by `parse_webhook_payload`."""
+    transaction_id = payment.provider_transaction_id
+    if payment.provider == "mvola":
+        return {
+            "serverCorrelationId": transaction_id,
+            "requestingOrganisationTransactionReference": payment.name,
+            "status": status,
+        }
+    if payment.provider == "orange_money":
+        return {"transactionId": transaction_id, "orderId": payment.name, "status": status}
+    return {"transaction_id": transaction_id, "reference": payment.name, "status": status}
+
+
+def _interleave(sequences: list) -> list:
+    """Random merge of the sequences, keeping the order within each one."""
+    sequences = [list(reversed(s)) for s in sequences]
+    merged = []
+    while sequences:
+        i = random.randrange(len(sequences))
+        merged.append(sequences[i].pop())
+        if not sequences[i]:
+            sequences[i] = sequences[-1]
+            sequences.pop()
+    return merged
+
+
+# ==============================================================================
+# MEASURES
+# ==============================================================================
+
+
+def _phase(results: list, elapsed: float) -> dict:
+    errors = Counter(r["error"] for r in results if r.get("error"))
+    return {
+        "requests": len(results),
+        "errors": sum(errors.values()),
+        "top_errors": errors.most_common(5),
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(results) / elapsed, 1) if elapsed else 0,
+        "latency_ms": _percentiles([r["latency"] for r in results]),
+    }
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(v * 1000 for v in values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+    return {"p50": pick(0.5), "p90": pick(0.9), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 1)}
+
+
+def _db_status() -> dict:
+    return {
+        name: cint(value)
+        for name, value in frappe.db.sql(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN %(names)s", {"names": STATUS_COUNTERS}
+        )
+    }
+
+
+def _status_delta(before: dict) -> dict:
+    after = _db_status()
+    return {name: after.get(name, 0) - before.get(name, 0) for name in STATUS_COUNTERS}
+
+
+def _wait(done, timeout: int) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        # New snapshot: the rows are written by the workers
+        frappe.db.rollback()
+        if done():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+
+def _count_payments(payment_ids: list, statuses: tuple) -> int:
+    return frappe.db.count("CNTEMAD Payment", {"name": ["in", payment_ids], "status": ["in", statuses]})
+
+
+def _count_inbox(payment_ids: list, status: str) -> int:
+    return frappe.db.count("CNTEMAD Webhook Inbox", {"reference": ["in", payment_ids], "status": status})
+
+
+def _payment_statuses(payment_ids: list) -> dict:
+    return dict(frappe.db.sql("""
+        SELECT status, COUNT(*)
+        FROM `tabCNTEMAD Payment`
+        WHERE name IN %(names)s
+        GROUP BY status
+    """, {"names": payment_ids}))
+
+
+def _check_consistency(payment_ids: list, expected: dict) -> list:
+    """Payments whose final state disagrees with the callbacks sent, or with the ledger and enrollments."""
+    issues = []
+
+    rows = frappe.db.sql("""
+        SELECT
+            p.name, p.status,
+            (SELECT COALESCE(SUM(l.payment_count), 0)
+                FROM `tabCNTEMAD Payment Ledger` l WHERE l.payment = p.name) as ledger_count,
+            EXISTS(SELECT 1 FROM `tabCNTEMAD Enrollment` e
+                WHERE e.student = p.student AND e.ec = p.ec) as enrolled
+        FROM `tabCNTEMAD Payment` p
+        WHERE p.name IN %(names)s
+    """, {"names": payment_ids}, as_dict=True)
+
+    for row in rows:
+        problems = []
+        if row.status in ("Pending", "Processing"):
+            problems.append("stuck")
+        elif expected.get(row.name) and row.status != expected[row.name]:
+            problems.append(f"expected {expected[row.name]}")
+        if cint(row.ledger_count) != (1 if row.status == "Completed" else 0):
+            problems.append(f"ledger count {cint(row.ledger_count)}")
+        if row.status == "Completed" and not row.enrolled:
+            problems.append("no enrollment")
+
+        if problems:
+            issues.append({"payment": row.name, "status": row.status, "problems": problems})
+
+    for event in frappe.get_all(
+        "CNTEMAD Webhook Inbox",
+        filters={"reference": ["in", payment_ids], "status": "Failed"},
+        fields=["name", "reference"],
+    ):
+        issues.append({"payment": event.reference, "status": None, "problems": [f"webhook event {event.name} failed"]})
+
+    return issues
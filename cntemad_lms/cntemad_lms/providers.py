@@ -0,0 +1,223 @@
+"""
+Shared HTTP client for the mobile money providers (MVola, Orange, Airtel).
+
+- One `requests.Session` per provider and worker process: connections
+  are pooled and kept alive, so only the first call pays the TCP/TLS
+  handshake.
+- Connect/read timeouts come from the provider config
+  (`mobile_money.<provider>.connect_timeout` / `read_timeout`).
+- A circuit breaker shared by every worker (Redis) fails fast while a
+  provider is degraded: after BREAKER_THRESHOLD consecutive failures the
+  circuit opens for BREAKER_COOLDOWN seconds, then one call is let
+  through; its outcome closes or re-opens the circuit.
+- Each call records its latency and outcome in per-minute Redis buckets,
+  read back by `get_provider_metrics`.
+
+Usage:
+    response = provider_request("mvola", "POST", "/mvola/mm/transactions/...", config, json=payload)
+
+    get_provider_metrics(minutes=15)
+    # {"mvola": {"requests": 120, "errors": 3, "error_rate": 2.5, "avg_latency_ms": 310, ...}}
+"""
+
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+PROVIDERS = ("mvola", "orange_money", "airtel_money")
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+POOL_SIZE = 10
+
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30  # seconds
+
+CIRCUIT_KEY = "cntemad:provider:circuit:{provider}"
+FAILURES_KEY = "cntemad:provider:failures:{provider}"
+PROBE_KEY = "cntemad:provider:probe:{provider}"
+METRICS_KEY = "cntemad:provider:metrics:{provider}:{minute}"
+METRICS_TTL = 24 * 3600
+LATENCY_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000)  # ms
+
+# provider -> requests.Session (per worker process)
+_sessions = {}
+
+
+class ProviderUnavailable(requests.exceptions.ConnectionError):
+    """The circuit of the provider is open: the call was not attempted."""
+
+
+def provider_request(provider: str, method: str, path: str, config: dict, **kwargs) -> requests.Response:
+    """
+    Send a request to a provider through its pooled session.
+
+    Args:
+        provider: mvola, orange_money or airtel_money
+        method: HTTP method
+        path: Path appended to `config["api_url"]`
+        config: Provider config (see payment.get_provider_config)
+        **kwargs: Passed to `requests.Session.request` (json, headers, ...)
+
+    Returns:
+        requests.Response: any status code; 5xx and 429 count as failures
+            for the circuit breaker
+
+    Raises:
+        ProviderUnavailable: circuit open
+        requests.exceptions.RequestException: network error or timeout
+    """
+    if not _allow_request(provider):
+        _record(provider, None, error=True)
+        raise ProviderUnavailable(f"{provider} unavailable (circuit open)")
+
+    kwargs.setdefault("timeout", (
+        flt(config.get("connect_timeout")) or DEFAULT_CONNECT_TIMEOUT,
+        flt(config.get("read_timeout")) or DEFAULT_READ_TIMEOUT,
+    ))
+
+    started = time.monotonic()
+    try:
+        response = _get_session(provider).request(method, config["api_url"].rstrip("/") + path, **kwargs)
+    except requests.exceptions.RequestException:
+        _record(provider, time.monotonic() - started, error=True)
+        _record_failure(provider)
+        raise
+
+    failed = response.status_code == 429 or response.status_code >= 500
+    _record(provider, time.monotonic() - started, error=failed)
+    if failed:
+        _record_failure(provider)
+    else:
+        _record_success(provider)
+
+    return response
+
+
+def is_circuit_open(provider: str) -> bool:
+    cache = frappe.cache()
+    return bool(cache.get(cache.make_key(CIRCUIT_KEY.format(provider=provider))))
+
+
+def get_provider_metrics(minutes: int = 15) -> dict:
+    """
+    Latency and error rate of each provider over the last `minutes`.
+
+    Returns:
+        dict: {provider: {requests, errors, error_rate, avg_latency_ms,
+                          p95_latency_ms, circuit_open}}
+            p95_latency_ms is the upper bound of its bucket (None above 10 s)
+    """
+    cache = frappe.cache()
+    now = int(time.time() // 60)
+    metrics = {}
+
+    for provider in PROVIDERS:
+        pipe = cache.pipeline()
+        for minute in range(now - minutes + 1, now + 1):
+            pipe.hgetall(cache.make_key(METRICS_KEY.format(provider=provider, minute=minute)))
+
+        totals = {}
+        for bucket in pipe.execute():
+            for field, value in bucket.items():
+                field = field.decode() if isinstance(field, bytes) else field
+                totals[field] = totals.get(field, 0) + flt(value.decode() if isinstance(value, bytes) else value)
+
+        requests_count = int(totals.get("requests", 0))
+        errors = int(totals.get("errors", 0))
+        timed = int(sum(v for k, v in totals.items() if k.startswith("le_")))
+
+        metrics[provider] = {
+            "requests": requests_count,
+            "errors": errors,
+            "error_rate": round(errors / requests_count * 100, 1) if requests_count else 0,
+            "avg_latency_ms": round(totals.get("latency_ms", 0) / timed) if timed else None,
+            "p95_latency_ms": _percentile(totals, timed, 0.95),
+            "circuit_open": is_circuit_open(provider),
+        }
+
+    return metrics
+
+
+def _allow_request(provider: str) -> bool:
+    cache = frappe.cache()
+    if is_circuit_open(provider):
+        return False
+
+    if cint(cache.get(cache.make_key(FAILURES_KEY.format(provider=provider)))) < BREAKER_THRESHOLD:
+        return True
+
+    # Half-open: a single trial call across all workers
+    return bool(cache.set(cache.make_key(PROBE_KEY.format(provider=provider)), 1, nx=True, ex=BREAKER_COOLDOWN))
+
+
+def _get_session(provider: str) -> requests.Session:
+    session = _sessions.get(provider)
+    if session is None:
+        session = requests.Session()
+        # No transport-level retries: retries are decided by the payment job
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _sessions[provider] = session
+    return session
+
+
+def _record(provider: str, elapsed: float, error: bool) -> None:
+    cache = frappe.cache()
+    key = cache.make_key(METRICS_KEY.format(provider=provider, minute=int(time.time() // 60)))
+
+    pipe = cache.pipeline()
+    pipe.hincrby(key, "requests", 1)
+    if error:
+        pipe.hincrby(key, "errors", 1)
+    if elapsed is not None:
+        latency_ms = elapsed * 1000
+        pipe.hincrbyfloat(key, "latency_ms", latency_ms)
+        pipe.hincrby(key, _latency_bucket(latency_ms), 1)
+    pipe.expire(key, METRICS_TTL)
+    pipe.execute()
+
+
+def _latency_bucket(latency_ms: float) -> str:
+    for bound in LATENCY_BUCKETS:
+        if latency_ms <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def _percentile(buckets: dict, total: int, percentile: float):
+    """Upper bound of the latency bucket holding the given percentile."""
+    if not total:
+        return None
+
+    seen = 0
+    for bound in LATENCY_BUCKETS:
+        seen += buckets.get(f"le_{bound}", 0)
+        if seen >= total * percentile:
+            return bound
+    return None  # beyond the last bucket
+
+
+def _record_failure(provider: str) -> None:
+    cache = frappe.cache()
+    failures_key = cache.make_key(FAILURES_KEY.format(provider=provider))
+
+    failures = cache.incr(failures_key)
+    cache.expire(failures_key, BREAKER_COOLDOWN * 10)
+    if failures >= BREAKER_THRESHOLD:
+        cache.set(cache.make_key(CIRCUIT_KEY.format(provider=provider)), 1, ex=BREAKER_COOLDOWN)
+        cache.delete(cache.make_key(PROBE_KEY.format(provider=provider)))
+
+
+def _record_success(provider: str) -> None:
+    cache = frappe.cache()
+    cache.delete(
+        cache.make_key(FAILURES_KEY.format(provider=provider)),
+        cache.make_key(PROBE_KEY.format(provider=provider)),
+    )
@@ -0,0 +1,142 @@
+"""
+EXPLAIN check for the hot queries.
+
+Each query below mirrors an access pattern of the API. The check fails
+when MariaDB reads a table of one of them without an index (`type = ALL`
+or no `key` chosen). Run it on a site with realistic data: on near-empty
+tables the optimizer may prefer a full scan although an index exists.
+A query that legitimately scans a small table can opt out with
+`allow_full_scan`.
+
+Usage:
+    bench --site <site> cntemad-check-query-plans
+"""
+
+import frappe
+
+
+SAMPLE = "__explain__"
+
+# (label, query, values[, allow_full_scan])
+HOT_QUERIES = [
+    (
+        "student by user",
+        "SELECT name FROM `tabCNTEMAD Student` WHERE user = %(v)s",
+        {"v": SAMPLE},
+    ),
+    (
+        "students by center and status",
+        "SELECT COUNT(*) FROM `tabCNTEMAD Student` WHERE center = %(v)s AND status = 'Active'",
+        {"v": SAMPLE},
+    ),
+    (
+        "enrollment by student and EC",
+        """SELECT name, status FROM `tabCNTEMAD Enrollment`
+        WHERE student = %(v)s AND ec = %(v)s""",
+        {"v": SAMPLE},
+    ),
+    (
+        "enrollments of an EC by status",
+        "SELECT COUNT(*) FROM `tabCNTEMAD Enrollment` WHERE ec = %(v)s AND status = 'Validated'",
+        {"v": SAMPLE},
+    ),
+    (
+        "enrollments of a center by status",
+        """SELECT status, COUNT(*) FROM `tabCNTEMAD Enrollment`
+        WHERE center = %(v)s GROUP BY status""",
+        {"v": SAMPLE},
+    ),
+    (
+        "recently modified enrollments",
+        """SELECT COUNT(DISTINCT student) FROM `tabCNTEMAD Enrollment`
+        WHERE modified >= NOW() - INTERVAL 30 DAY""",
+        {},
+    ),
+    (
+        "payment by student, EC and status",
+        """SELECT name FROM `tabCNTEMAD Payment`
+        WHERE student = %(v)s AND ec = %(v)s AND status = 'Completed'""",
+        {"v": SAMPLE},
+    ),
+    (
+        "payments by status and date",
+        """SELECT name FROM `tabCNTEMAD Payment`
+        WHERE status = 'Pending' AND creation < NOW() - INTERVAL 24 HOUR""",
+        {},
+    ),
+    (
+        "payments by provider",
+        """SELECT name FROM `tabCNTEMAD Payment`
+        WHERE provider = 'mvola' AND status = 'Processing'""",
+        {},
+    ),
+    (
+        "payments of a center by date",
+        """SELECT name FROM `tabCNTEMAD Payment`
+        WHERE center = %(v)s ORDER BY creation DESC LIMIT 20""",
+        {"v": SAMPLE},
+    ),
+    (
+        "payment history of a student (keyset page)",
+        """SELECT p.name, ec.title FROM `tabCNTEMAD Payment` p
+        LEFT JOIN `tabCNTEMAD EC` ec ON ec.name = p.ec
+        WHERE p.student = %(v)s
+            AND (p.creation < NOW() OR (p.creation = NOW() AND p.name < %(v)s))
+        ORDER BY p.creation DESC, p.name DESC LIMIT 20""",
+        {"v": SAMPLE},
+    ),
+    (
+        "pending bank payments of a center (keyset page)",
+        """SELECT p.name, s.full_name FROM `tabCNTEMAD Payment` p
+        LEFT JOIN `tabCNTEMAD Student` s ON s.name = p.student
+        WHERE p.status = 'Pending Validation' AND p.provider LIKE 'bank_%%'
+            AND p.center = %(v)s
+        ORDER BY p.creation DESC, p.name DESC LIMIT 50""",
+        {"v": SAMPLE},
+    ),
+    (
+        "stuck processing payments",
+        """SELECT name FROM `tabCNTEMAD Payment`
+        WHERE status = 'Processing' AND creation < NOW() - INTERVAL 15 MINUTE
+        ORDER BY creation, name LIMIT 200""",
+        {},
+    ),
+    (
+        "pending webhook events",
+        """SELECT name FROM `tabCNTEMAD Webhook Inbox`
+        WHERE status = 'Received' ORDER BY creation LIMIT 100""",
+        {},
+    ),
+    (
+        "daily stats of a center",
+        """SELECT SUM(payments) FROM `tabCNTEMAD Daily Stats`
+        WHERE stat_date >= CURDATE() - INTERVAL 30 DAY AND center = %(v)s""",
+        {"v": SAMPLE},
+    ),
+]
+
+
+def check_query_plans() -> list:
+    """
+    Run EXPLAIN on every hot query.
+
+    Returns:
+        list: [{label, table, possible_keys, rows}] for each table read without index
+    """
+    failures = []
+
+    for label, query, values, *options in HOT_QUERIES:
+        if options and options[0]:  # allow_full_scan
+            continue
+
+        for row in frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True):
+            # type NULL: table optimized away (const / impossible WHERE)
+            if row.get("type") and (row.get("type") == "ALL" or not row.get("key")):
+                failures.append({
+                    "label": label,
+                    "table": row.get("table"),
+                    "possible_keys": row.get("possible_keys"),
+                    "rows": row.get("rows"),
+                })
+
+    return failures
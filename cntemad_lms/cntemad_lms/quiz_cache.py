@@ -0,0 +1,153 @@
+"""
+Compiled quizzes shared by `quiz.get_quiz` and `quiz.submit_quiz`.
+
+A compiled quiz holds the settings, the public questions (options
+already parsed) and the answer key as frozensets. It is built once per
+(quiz, version), stored in Redis and kept in each worker's memory; the
+version key is bumped after commit whenever the LMS Quiz is saved or
+deleted (`teacher.save_quiz` included). Serving or grading a quiz then
+costs one Redis GET, no SQL.
+
+Usage:
+    quiz = get_compiled_quiz(frappe.get_cached_doc("CNTEMAD EC", ec_id))
+    quiz["questions"]  # [{id, text, type, options}]
+    quiz["answers"]    # {question_id: frozenset({0, 2})}
+"""
+
+import json
+from functools import partial
+
+import frappe
+
+
+VERSION_KEY = "cntemad:quiz:version:{quiz}"
+COMPILED_KEY = "cntemad:quiz:compiled:{quiz}:{version}"
+COMPILED_TTL = 7 * 24 * 3600
+
+# Default settings of an EC without LMS Quiz
+DEFAULT_QUIZ = {
+    "passing_score": 70,
+    "time_limit": 30,  # minutes
+    "max_attempts": 3,
+    "show_immediate_feedback": False,
+}
+
+# Demo questions served when the quiz has none
+SAMPLE_QUESTIONS = [
+    {
+        "id": "q1",
+        "text": "Question exemple 1 - Sélectionnez la bonne réponse",
+        "type": "single",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+    },
+    {
+        "id": "q2",
+        "text": "Question exemple 2 - Plusieurs réponses possibles",
+        "type": "multiple",
+        "options": ["Réponse 1", "Réponse 2", "Réponse 3", "Réponse 4"],
+    },
+]
+SAMPLE_ANSWERS = {"q1": frozenset({0}), "q2": frozenset({0, 2})}
+
+# (site, quiz) -> compiled quiz (per worker process)
+_quizzes = {}
+
+
+def get_compiled_quiz(ec) -> dict:
+    """
+    Compiled quiz of an EC (its LMS Quiz, or the default quiz `quiz-<EC>`).
+
+    Returns:
+        dict: {name, version, title, passing_score, time_limit, max_attempts,
+            show_immediate_feedback, questions, answers}
+    """
+    quiz_id = ec.get("quiz") or ec.get("quiz_id") or f"quiz-{ec.name}"
+    version = _current_version(quiz_id)
+    key = (frappe.local.site, quiz_id)
+
+    quiz = _quizzes.get(key)
+    if quiz and quiz["version"] == version:
+        return quiz
+
+    cache = frappe.cache()
+    redis_key = COMPILED_KEY.format(quiz=quiz_id, version=version)
+    quiz = cache.get_value(redis_key)
+    if quiz is None:
+        quiz = _compile(quiz_id, version)
+        cache.set_value(redis_key, quiz, expires_in_sec=COMPILED_TTL)
+
+    _quizzes[key] = quiz
+    return quiz
+
+
+def invalidate_compiled_quiz(doc=None, method=None) -> None:
+    """doc_events hook (LMS Quiz): the next read compiles the new version."""
+    frappe.db.after_commit.add(partial(_bump_version, doc.name))
+
+
+def _bump_version(quiz_id: str) -> None:
+    frappe.cache().incr(frappe.cache().make_key(VERSION_KEY.format(quiz=quiz_id)))
+
+
+def _current_version(quiz_id: str) -> str:
+    version = frappe.cache().get(frappe.cache().make_key(VERSION_KEY.format(quiz=quiz_id)))
+    return version.decode() if isinstance(version, bytes) else str(version or 0)
+
+
+def _compile(quiz_id: str, version: str) -> dict:
+    quiz = {"name": quiz_id, "version": version, "title": None, **DEFAULT_QUIZ}
+    questions = []
+    answers = {}
+
+    settings = frappe.db.get_value(
+        "LMS Quiz", quiz_id,
+        ["title", "passing_percentage", "max_time", "max_attempts", "show_answers_after_submission"],
+        as_dict=True
+    )
+    if settings:
+        quiz.update(
+            title=settings.title,
+            passing_score=settings.passing_percentage or 70,
+            time_limit=settings.max_time or 0,
+            max_attempts=settings.max_attempts or 3,
+            show_immediate_feedback=settings.show_answers_after_submission or False,
+        )
+
+        for q in frappe.get_all(
+            "LMS Quiz Question",
+            filters={"parent": quiz_id},
+            fields=["name", "question", "type", "options", "correct_options"],
+            order_by="idx",
+        ):
+            questions.append({
+                "id": q.name,
+                "text": q.question,
+                "type": "multiple" if q.type == "Multiple Choice" else "single",
+                "options": _parse_options(q.options),
+            })
+            answers[q.name] = _parse_correct_options(q.correct_options)
+
+    quiz["questions"] = questions or SAMPLE_QUESTIONS
+    quiz["answers"] = answers or SAMPLE_ANSWERS
+    return quiz
+
+
+def _parse_options(options: str) -> list:
+    """Options stored as JSON or newline-separated."""
+    if not options:
+        return []
+    try:
+        return json.loads(options)
+    except ValueError:
+        return [opt.strip() for opt in options.split("\n") if opt.strip()]
+
+
+def _parse_correct_options(correct_options: str) -> frozenset:
+    """Indices stored as a JSON array or comma-separated; first option by default (demo)."""
+    if not correct_options:
+        return frozenset({0})
+    try:
+        indices = json.loads(correct_options)
+    except ValueError:
+        indices = [int(i.strip()) for i in correct_options.split(",") if i.strip().isdigit()]
+    return frozenset(indices if isinstance(indices, list) else [indices])
@@ -16,12 +16,7 @@ def get_student_progress(student_id: str) -> dict:
 
 def get_current_student():
     """Retourne l'étudiant lié à l'utilisateur courant."""
-    if frappe.session.user == "Guest":
-        return None
+    from cntemad_lms.cntemad_lms.identity import get_identity
 
-    return frappe.db.get_value(
-        "CNTEMAD Student",
-        {"user": frappe.session.user},
-        ["name", "full_name", "center", "current_year"],
-        as_dict=True
-    )
+    student = get_identity().student
+    return frappe._dict(student) if student else None
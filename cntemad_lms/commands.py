@@ -0,0 +1,147 @@
+"""Bench commands for CNTEMAD LMS."""
+
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("cntemad-backfill-daily-stats")
+@click.option("--from-date", help="Premier jour à recalculer (YYYY-MM-DD)")
+@click.option("--to-date", help="Dernier jour à recalculer (YYYY-MM-DD), aujourd'hui par défaut")
+@pass_context
+def backfill_daily_stats(context, from_date=None, to_date=None):
+    """Recalcule la table CNTEMAD Daily Stats depuis les inscriptions et paiements."""
+    from cntemad_lms.cntemad_lms.doctype.cntemad_daily_stats.cntemad_daily_stats import (
+        rebuild_daily_stats,
+    )
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        rebuild_daily_stats(from_date, to_date)
+        click.echo(f"Daily stats rebuilt for {site}")
+    finally:
+        frappe.destroy()
+
+
+@click.command("cntemad-check-query-plans")
+@pass_context
+def check_query_plans(context):
+    """Vérifie par EXPLAIN qu'aucune requête critique ne parcourt une table entière."""
+    from cntemad_lms.cntemad_lms.query_plans import HOT_QUERIES
+    from cntemad_lms.cntemad_lms.query_plans import check_query_plans as run_check
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        failures = run_check()
+    finally:
+        frappe.destroy()
+
+    for failure in failures:
+        click.secho(
+            f"FULL SCAN  {failure['label']}: table {failure['table']} "
+            f"(~{failure['rows']} rows, no index used, "
+            f"possible keys: {failure['possible_keys'] or '-'})",
+            fg="red",
+        )
+
+    if failures:
+        raise click.ClickException(f"{len(failures)} query plan(s) fall back to a full scan")
+
+    click.echo(f"{len(HOT_QUERIES)} query plans OK for {site}")
+
+
+@click.command("cntemad-fake-provider")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, type=int, show_default=True)
+@click.option("--latency", default=200, type=int, show_default=True, help="Latence moyenne (ms)")
+@click.option("--jitter", default=50, type=int, show_default=True, help="Variation de latence (ms)")
+@click.option("--failure-rate", default=0.0, type=float, show_default=True, help="Part de réponses HTTP 503")
+@click.option("--timeout-rate", default=0.0, type=float, show_default=True, help="Part de requêtes sans réponse")
+@click.option("--verbose", is_flag=True, help="Journaliser chaque requête")
+def fake_provider(host, port, latency, jitter, failure_rate, timeout_rate, verbose):
+    """Simule les API MVola, Orange Money et Airtel Money en local."""
+    from cntemad_lms.cntemad_lms.fake_provider import run_fake_provider
+
+    click.echo(f"Fake provider listening on http://{host}:{port} (Ctrl+C to stop)")
+    run_fake_provider(
+        host=host,
+        port=port,
+        latency_ms=latency,
+        jitter_ms=jitter,
+        failure_rate=failure_rate,
+        timeout_rate=timeout_rate,
+        quiet=not verbose,
+    )
+
+
+@click.command("cntemad-load-test")
+@click.option("--payments", default=500, type=int, show_default=True, help="Paiements à initier")
+@click.option("--students", default=200, type=int, show_default=True, help="Étudiants de test (réutilisés)")
+@click.option("--concurrency", default=20, type=int, show_default=True, help="Clients simultanés")
+@click.option("--provider", "providers", multiple=True, type=click.Choice(["mvola", "orange_money", "airtel_money"]),
+              help="Opérateurs utilisés (tous par défaut)")
+@click.option("--port", default=8765, type=int, show_default=True, help="Port du simulateur d'opérateurs")
+@click.option("--latency", default=200, type=int, show_default=True, help="Latence moyenne des opérateurs (ms)")
+@click.option("--jitter", default=50, type=int, show_default=True, help="Variation de latence (ms)")
+@click.option("--failure-rate", default=0.0, type=float, show_default=True, help="Part de réponses HTTP 503")
+@click.option("--callback-failure-rate", default=0.1, type=float, show_default=True,
+              help="Part des callbacks finaux en échec")
+@click.option("--duplicate-rate", default=0.2, type=float, show_default=True, help="Part des callbacks envoyés deux fois")
+@click.option("--reorder-rate", default=0.2, type=float, show_default=True,
+              help="Part des paiements recevant un callback `pending` après le statut final")
+@click.option("--settle-timeout", default=300, type=int, show_default=True, help="Attente max des workers (s)")
+@click.option("--cleanup", is_flag=True, help="Supprimer les données de test au lieu de lancer le test")
+@click.option("--json", "as_json", is_flag=True, help="Rapport au format JSON")
+@pass_context
+def load_test(context, cleanup=False, as_json=False, providers=None, **options):
+    """Test de charge du parcours de paiement mobile money (simulateur d'opérateurs, rafale de callbacks)."""
+    import json
+
+    from cntemad_lms.cntemad_lms.load_test import PROVIDERS, cleanup_load_test_data, run_payment_load_test
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        if cleanup:
+            deleted = cleanup_load_test_data()
+            click.echo(f"Load test data deleted for {site}: {deleted}")
+            return
+        report = run_payment_load_test(providers=tuple(providers or PROVIDERS), **options)
+    finally:
+        frappe.destroy()
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, default=str))
+    else:
+        _print_load_test_report(report)
+
+    if report.get("issues"):
+        raise click.ClickException(f"{len(report['issues'])} payment(s) left in an inconsistent state")
+
+
+def _print_load_test_report(report):
+    click.echo(f"Run {report['run_id']}: {report['payments']} payments, {report['concurrency']} clients")
+
+    for phase, stats in report["phases"].items():
+        click.secho(f"\n{phase}", bold=True)
+        for key, value in stats.items():
+            click.echo(f"  {key}: {value}")
+        if phase in report["queries"]:
+            click.echo(f"  queries: {report['queries'][phase]}")
+
+    click.echo(f"\nFinal statuses: {report.get('statuses')}")
+    for issue in report.get("issues", [])[:50]:
+        click.secho(f"  {issue['payment']} ({issue['status']}): {', '.join(issue['problems'])}", fg="red")
+
+
+commands = [
+    backfill_daily_stats,
+    check_query_plans,
+    fake_provider,
+    load_test,
+]
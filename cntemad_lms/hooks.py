@@ -32,16 +32,61 @@ doc_events = {
     "CNTEMAD Payment": {
         "after_insert": "cntemad_lms.cntemad_lms.api.payment.on_payment_created",
         "on_update": "cntemad_lms.cntemad_lms.api.payment.on_payment_updated",
+        "on_trash": "cntemad_lms.cntemad_lms.api.payment.on_payment_deleted",
     },
     "CNTEMAD Enrollment": {
         "after_insert": "cntemad_lms.cntemad_lms.api.enrollment.on_enrollment_created",
+        "on_update": "cntemad_lms.cntemad_lms.api.enrollment.on_enrollment_updated",
+        "on_trash": "cntemad_lms.cntemad_lms.api.enrollment.on_enrollment_deleted",
+    },
+    "CNTEMAD Student": {
+        "after_insert": "cntemad_lms.cntemad_lms.api.student.on_student_created",
+        "on_update": "cntemad_lms.cntemad_lms.api.student.on_student_updated",
+        "on_trash": "cntemad_lms.cntemad_lms.api.student.on_student_deleted",
+    },
+    "CNTEMAD EC": {
+        "on_update": "cntemad_lms.cntemad_lms.catalog_index.invalidate_catalog_index",
+        "on_trash": "cntemad_lms.cntemad_lms.catalog_index.invalidate_catalog_index",
+    },
+    "CNTEMAD Course": {
+        "on_update": "cntemad_lms.cntemad_lms.catalog_index.invalidate_catalog_index",
+        "on_trash": "cntemad_lms.cntemad_lms.catalog_index.invalidate_catalog_index",
+    },
+    "CNTEMAD Center": {
+        "on_update": "cntemad_lms.cntemad_lms.identity.on_center_changed",
+        "on_trash": "cntemad_lms.cntemad_lms.identity.on_center_changed",
+    },
+    "CNTEMAD Center Admin": {
+        "on_update": "cntemad_lms.cntemad_lms.identity.on_center_admin_changed",
+        "on_trash": "cntemad_lms.cntemad_lms.identity.on_center_admin_changed",
+    },
+    "User": {
+        "on_update": "cntemad_lms.cntemad_lms.identity.on_user_changed",
+    },
+    "LMS Quiz": {
+        "on_update": "cntemad_lms.cntemad_lms.quiz_cache.invalidate_compiled_quiz",
+        "on_trash": "cntemad_lms.cntemad_lms.quiz_cache.invalidate_compiled_quiz",
     },
 }
 
 # Scheduled Tasks
 scheduler_events = {
+    "cron": {
+        "* * * * *": [
+            "cntemad_lms.cntemad_lms.doctype.cntemad_webhook_inbox.cntemad_webhook_inbox.process_webhook_inbox",
+            "cntemad_lms.cntemad_lms.doctype.cntemad_notification_outbox.cntemad_notification_outbox.send_queued_notifications",
+        ],
+        "*/15 * * * *": [
+            "cntemad_lms.cntemad_lms.doctype.cntemad_reconciliation_log.cntemad_reconciliation_log.schedule_reconciliation",
+        ],
+    },
+    "hourly": [
+        "cntemad_lms.cntemad_lms.counters.reconcile_kpi_counters",
+    ],
     "daily": [
         "cntemad_lms.cntemad_lms.tasks.daily.send_progress_reminders",
+        "cntemad_lms.cntemad_lms.doctype.cntemad_center_stats.cntemad_center_stats.rebuild_center_stats",
+        "cntemad_lms.cntemad_lms.doctype.cntemad_export_job.cntemad_export_job.purge_old_exports",
     ],
     "weekly": [
         "cntemad_lms.cntemad_lms.tasks.weekly.generate_center_reports",
@@ -78,3 +123,8 @@ portal_menu_items = [
 
 # Translation
 # translated_languages_for_website = ["fr", "mg", "en"]
+
+# Session
+
+on_session_creation = "cntemad_lms.cntemad_lms.identity.on_session_change"
+on_logout = "cntemad_lms.cntemad_lms.identity.on_session_change"
@@ -0,0 +1,12 @@
+"""Crée les index composites des chemins d'accès les plus fréquents."""
+
+from cntemad_lms.cntemad_lms.doctype.cntemad_enrollment import cntemad_enrollment
+from cntemad_lms.cntemad_lms.doctype.cntemad_payment import cntemad_payment
+from cntemad_lms.cntemad_lms.doctype.cntemad_student import cntemad_student
+
+
+def execute():
+    # Same definitions as on_doctype_update, for sites where the doctypes did not change
+    cntemad_student.on_doctype_update()
+    cntemad_enrollment.on_doctype_update()
+    cntemad_payment.on_doctype_update()
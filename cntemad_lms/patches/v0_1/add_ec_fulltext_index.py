@@ -0,0 +1,7 @@
+"""Crée l'index FULLTEXT de recherche du catalogue des EC."""
+
+from cntemad_lms.cntemad_lms.doctype.cntemad_ec.cntemad_ec import add_fulltext_index
+
+
+def execute():
+    add_fulltext_index()
@@ -0,0 +1,15 @@
+"""Renseigne le nouveau champ `center` des paiements et inscriptions existants."""
+
+import frappe
+
+
+def execute():
+    for doctype in ("CNTEMAD Payment", "CNTEMAD Enrollment"):
+        frappe.db.sql(f"""
+            UPDATE `tab{doctype}` t
+            INNER JOIN `tabCNTEMAD Student` s ON s.name = t.student
+            SET t.center = s.center
+            WHERE t.center IS NULL OR t.center != s.center
+        """)
+
+    frappe.db.commit()
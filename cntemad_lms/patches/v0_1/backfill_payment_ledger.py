@@ -0,0 +1,34 @@
+"""Écrit le journal des paiements déjà encaissés, puis calcule les soldes de revenus."""
+
+import frappe
+
+from cntemad_lms.cntemad_lms.doctype.cntemad_revenue_balance.cntemad_revenue_balance import (
+    rebuild_revenue_balances,
+)
+
+
+def execute():
+    if frappe.db.count("CNTEMAD Payment Ledger"):
+        return
+
+    # Un encaissement par paiement payé ou remboursé, puis le remboursement
+    for entry_type, sign, statuses in (
+        ("Payment", 1, ("Completed", "Refunded")),
+        ("Refund", -1, ("Refunded",)),
+    ):
+        frappe.db.sql("""
+            INSERT INTO `tabCNTEMAD Payment Ledger`
+                (name, creation, modified, owner, modified_by, docstatus,
+                 payment, entry_type, posting_date, month,
+                 center, ec, provider, amount, payment_count)
+            SELECT
+                SUBSTRING(MD5(CONCAT(%(entry_type)s, p.name)), 1, 10), NOW(), NOW(),
+                'Administrator', 'Administrator', 0,
+                p.name, %(entry_type)s, DATE(COALESCE(p.completed_at, p.creation)),
+                DATE_FORMAT(COALESCE(p.completed_at, p.creation), '%%Y-%%m'),
+                p.center, p.ec, p.provider, %(sign)s * COALESCE(p.amount, 0), %(sign)s
+            FROM `tabCNTEMAD Payment` p
+            WHERE p.status IN %(statuses)s
+        """, {"entry_type": entry_type, "sign": sign, "statuses": statuses})
+
+    rebuild_revenue_balances()
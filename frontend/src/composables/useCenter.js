@@ -15,6 +15,7 @@
  */
 import { ref, computed } from 'vue'
 import { createResource } from 'frappe-ui'
+import { useExport } from './useExport'
 
 export function useCenter() {
   const center = ref(null)
@@ -81,6 +82,8 @@ export function useCenter() {
     auto: false,
   })
 
+  const { runExportJob } = useExport()
+
   // KPIs calculés
   const kpis = computed(() => {
     if (!dashboard.value?.kpis) return null
@@ -164,23 +167,23 @@ export function useCenter() {
   // Exporter les étudiants
   const exportStudents = async (format = 'csv') => {
     try {
-      await exportResource.fetch({
-        center_id: center.value?.name,
-        format,
-      })
+      if (format === 'csv') {
+        // Téléchargement streamé
+        const params = new URLSearchParams({ format })
+        if (center.value?.name) params.append('center_id', center.value.name)
 
-      const result = exportResource.data
-      if (result?.data) {
-        // Download CSV
-        const blob = new Blob([result.data], { type: 'text/csv;charset=utf-8;' })
         const link = document.createElement('a')
-        link.href = URL.createObjectURL(blob)
-        link.download = result.filename || 'export.csv'
+        link.href = `/api/method/cntemad_lms.api.center.export_students?${params}`
         link.click()
-        URL.revokeObjectURL(link.href)
+        return null
       }
 
-      return result
+      // xlsx / parquet: généré en arrière-plan
+      const job = await exportResource.fetch({
+        center_id: center.value?.name,
+        format,
+      })
+      return await runExportJob(job)
     } catch (e) {
       error.value = e.message
       throw e
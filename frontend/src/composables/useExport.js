@@ -4,8 +4,13 @@
  * Usage:
  *   const { exportCSV, exportPDF, loading } = useExport()
  *   await exportCSV(data, 'students')
+ *
+ *   // Export serveur en arrière-plan (xlsx, parquet)
+ *   const { runExportJob } = useExport()
+ *   await runExportJob(job)
  */
 import { ref } from 'vue'
+import { createResource } from 'frappe-ui'
 
 export function useExport() {
   const loading = ref(false)
@@ -97,6 +102,47 @@ export function useExport() {
     }
   }
 
+  const exportStatusResource = createResource({
+    url: 'cntemad_lms.api.export.get_export_status',
+    auto: false,
+  })
+
+  /**
+   * Suivre un export serveur jusqu'à la fin, puis télécharger le fichier
+   * @param {Object} job - Job renvoyé par l'API ({ name, status, download_url })
+   * @param {Number} intervalMs - Intervalle de polling
+   * @param {Number} maxAttempts - Nombre maximum de vérifications
+   */
+  const runExportJob = async (job, intervalMs = 2000, maxAttempts = 900) => {
+    loading.value = true
+    error.value = null
+
+    try {
+      let attempts = 0
+      while (job.status === 'Queued' || job.status === 'Running') {
+        if (++attempts > maxAttempts) {
+          throw new Error("Délai d'export dépassé")
+        }
+        await new Promise((resolve) => setTimeout(resolve, intervalMs))
+        job = await exportStatusResource.fetch({ job_id: job.name })
+      }
+
+      if (job.status !== 'Completed') {
+        throw new Error(job.error || "L'export a échoué")
+      }
+
+      const link = document.createElement('a')
+      link.href = job.download_url
+      link.click()
+      return job
+    } catch (e) {
+      error.value = e.message
+      throw e
+    } finally {
+      loading.value = false
+    }
+  }
+
   /**
    * Télécharger un fichier
    */
@@ -134,6 +180,7 @@ export function useExport() {
     exportCSV,
     exportPDF,
     exportJSON,
+    runExportJob,
     formatDate,
     formatAmount,
   }
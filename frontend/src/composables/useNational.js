@@ -14,6 +14,7 @@
  */
 import { ref, computed } from 'vue'
 import { createResource } from 'frappe-ui'
+import { useExport } from './useExport'
 
 export function useNational() {
   const dashboard = ref(null)
@@ -86,6 +87,8 @@ export function useNational() {
     auto: false,
   })
 
+  const { runExportJob } = useExport()
+
   // Computed
   const kpis = computed(() => dashboard.value?.kpis || null)
 
@@ -161,25 +164,25 @@ export function useNational() {
     exporting.value = true
     error.value = null
     try {
-      await exportResource.fetch({
-        report_type: reportType,
-        date_from: dateFrom,
-        date_to: dateTo,
-        format,
-      })
-
-      const result = exportResource.data
-      if (result?.data) {
-        // Download file
-        const blob = new Blob([result.data], { type: 'text/csv;charset=utf-8;' })
-        const link = document.createElement('a')
-        link.href = URL.createObjectURL(blob)
-        link.download = result.filename || `report_${reportType}.csv`
-        link.click()
-        URL.revokeObjectURL(link.href)
+      if (format !== 'csv') {
+        // xlsx / parquet: generated by a background job
+        const job = await exportResource.fetch({
+          report_type: reportType,
+          date_from: dateFrom,
+          date_to: dateTo,
+          format,
+        })
+        return await runExportJob(job)
       }
 
-      return result
+      // Streamed download: the browser writes the file as rows arrive
+      const params = new URLSearchParams({ report_type: reportType, format })
+      if (dateFrom) params.append('date_from', dateFrom)
+      if (dateTo) params.append('date_to', dateTo)
+
+      const link = document.createElement('a')
+      link.href = `/api/method/cntemad_lms.api.national.export_national_report?${params}`
+      link.click()
     } catch (e) {
       error.value = e.message
       throw e
@@ -21,6 +21,7 @@
  */
 import { ref, computed } from 'vue'
 import { createResource } from 'frappe-ui'
+import { getSocket } from '@/socket'
 
 // Mobile money provider configurations
 const PROVIDERS = [
@@ -61,12 +62,17 @@ const BANKS = [
   },
 ]
 
+// Statuses after which a payment no longer changes on its own
+const TERMINAL_STATUSES = ['completed', 'failed', 'rejected', 'refunded']
+
 export function usePayment() {
   const loading = ref(false)
   const paymentStatus = ref(null)
   const currentPayment = ref(null)
   const error = ref(null)
   const pollingInterval = ref(null)
+  let pollingSession = 0
+  let unsubscribe = null
 
   // Payment initiation resource
   const initiateResource = createResource({
@@ -92,6 +98,12 @@ export function usePayment() {
     },
   })
 
+  // Fallback while the socket is down (returns when the status changes, 5 s max)
+  const waitStatusResource = createResource({
+    url: 'cntemad_lms.api.payment.wait_payment_status',
+    auto: false,
+  })
+
   // Payment history resource
   const historyResource = createResource({
     url: 'cntemad_lms.api.payment.get_payment_history',
@@ -203,31 +215,78 @@ export function usePayment() {
     }
   }
 
+  // Status changes are pushed by the realtime server (`cntemad_payment_status`),
+  // one status read per transition. While the socket is disconnected, fall back
+  // to wait_payment_status (short server-side wait).
   const startPolling = (paymentId, intervalMs = 5000, maxAttempts = 60) => {
-    let attempts = 0
-
     stopPolling() // Clear any existing polling
 
-    pollingInterval.value = setInterval(async () => {
-      attempts++
-
-      const status = await checkPaymentStatus(paymentId)
+    const session = ++pollingSession
+    pollingInterval.value = session
+    const deadline = Date.now() + intervalMs * maxAttempts
+    const isActive = () => pollingInterval.value === session
+    const socket = getSocket()
 
-      if (status?.status === 'completed' || status?.status === 'failed') {
+    const refresh = async () => {
+      await checkPaymentStatus(paymentId)
+      if (isActive() && TERMINAL_STATUSES.includes(paymentStatus.value)) {
         stopPolling()
       }
+    }
+    const onStatus = (data) => {
+      if (data.payment_id === paymentId) refresh()
+    }
 
-      if (attempts >= maxAttempts) {
-        stopPolling()
-        error.value = 'Délai de vérification dépassé'
+    socket.on('cntemad_payment_status', onStatus)
+    socket.on('connect', refresh) // transitions missed while disconnected
+    unsubscribe = () => {
+      socket.off('cntemad_payment_status', onStatus)
+      socket.off('connect', refresh)
+    }
+
+    const poll = async () => {
+      // Transition before the subscription
+      await refresh()
+
+      while (isActive()) {
+        if (Date.now() >= deadline) {
+          stopPolling()
+          error.value = 'Délai de vérification dépassé'
+          return
+        }
+
+        if (socket.connected) {
+          await new Promise((resolve) => setTimeout(resolve, intervalMs))
+          continue
+        }
+
+        try {
+          const data = await waitStatusResource.fetch({
+            payment_id: paymentId,
+            last_status: paymentStatus.value,
+          })
+          if (!isActive()) return
+          currentPayment.value = data
+          paymentStatus.value = data.status
+        } catch (e) {
+          console.error('Error waiting for payment status:', e)
+          await new Promise((resolve) => setTimeout(resolve, intervalMs))
+        }
+
+        if (TERMINAL_STATUSES.includes(paymentStatus.value)) {
+          stopPolling()
+        }
       }
-    }, intervalMs)
+    }
+
+    poll()
   }
 
   const stopPolling = () => {
-    if (pollingInterval.value) {
-      clearInterval(pollingInterval.value)
-      pollingInterval.value = null
+    pollingInterval.value = null
+    if (unsubscribe) {
+      unsubscribe()
+      unsubscribe = null
     }
   }
 
@@ -241,13 +300,14 @@ export function usePayment() {
     }
   }
 
-  const getPaymentHistory = async (limit = 20, offset = 0) => {
+  // Keyset pagination: pass the next_cursor of the previous page
+  const getPaymentHistory = async (limit = 20, cursor = null) => {
     try {
-      await historyResource.fetch({ limit, offset })
+      await historyResource.fetch({ limit, cursor })
       return historyResource.data
     } catch (e) {
       console.error('Error fetching payment history:', e)
-      return { payments: [], total: 0 }
+      return { payments: [], total: 0, next_cursor: null }
     }
   }
 
@@ -0,0 +1,31 @@
+/**
+ * Client socket.io du serveur realtime Frappe (frappe.publish_realtime).
+ *
+ * Une seule connexion par onglet, ouverte au premier usage, sur le
+ * namespace du site (Frappe v15). En développement, Vite relaie
+ * /socket.io vers le serveur realtime de bench (port 9000).
+ *
+ * Usage:
+ *   const off = onRealtime('cntemad_payment_status', (data) => { ... })
+ *   off() // se désabonner
+ */
+import { io } from 'socket.io-client'
+
+let socket = null
+
+export function getSocket() {
+  if (!socket) {
+    const siteName = window.site_name || window.location.hostname
+    socket = io(`${window.location.origin}/${siteName}`, {
+      withCredentials: true,
+      reconnectionAttempts: 5,
+    })
+  }
+  return socket
+}
+
+export function onRealtime(event, handler) {
+  const client = getSocket()
+  client.on(event, handler)
+  return () => client.off(event, handler)
+}
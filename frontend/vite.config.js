@@ -28,6 +28,10 @@ export default defineConfig({
         target: 'http://localhost:8000',
         changeOrigin: true,
       },
+      '/socket.io': {
+        target: 'http://localhost:9000',
+        ws: true,
+      },
     },
   },
 })